@@ -14,6 +14,8 @@ from pathlib import Path
 import dj_database_url
 import os
 
+from kunnic.db import apply_profile
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -49,6 +51,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # First, so its timings cover the rest of the stack (see kunnic/metrics.py).
+    'kunnic.metrics.MetricsMiddleware',
+
     'django.middleware.security.SecurityMiddleware',
 
     # White noise middleware for serving static files in production
@@ -85,6 +90,13 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'backend.wsgi.application'
+ASGI_APPLICATION = 'backend.asgi.application'
+
+# Serve anonymous list/detail reads on the async ORM (see kunnic/async_views.py).
+# Turn on when running under ASGI, e.g.
+#   KUNNIC_ASYNC_READS=1 gunicorn backend.asgi -k uvicorn_worker.UvicornWorker
+# Under WSGI every async view pays for its own event loop, so leave it off.
+KUNNIC_ASYNC_READS = os.environ.get('KUNNIC_ASYNC_READS', '').lower() in ('1', 'true', 'yes')
 
 
 # Database
@@ -101,14 +113,151 @@ WSGI_APPLICATION = 'backend.wsgi.application'
 # }
 
 # NEW DATABASES CONFIGURATION
+# DATABASE_PROFILE=tuned (the default) turns on WAL, a busy timeout and
+# immediate transactions for SQLite, and the native connection pool for
+# PostgreSQL (needs psycopg[pool]); "plain" keeps Django's defaults. See
+# kunnic/db.py. Behind pgbouncer in transaction mode, set PGBOUNCER=1.
+DATABASE_PROFILE = os.environ.get('DATABASE_PROFILE', 'tuned')
 DATABASES = {
-    'default': dj_database_url.config(
-        default=f"sqlite:///{BASE_DIR / 'db.sqlite3'}",
-        conn_max_age=600
+    'default': apply_profile(
+        dj_database_url.config(
+            default=f"sqlite:///{BASE_DIR / 'db.sqlite3'}",
+            conn_max_age=600
+        ),
+        DATABASE_PROFILE,
+        {
+            'POOL_MIN_SIZE': int(os.environ.get('DB_POOL_MIN_SIZE', 2)),
+            'POOL_MAX_SIZE': int(os.environ.get('DB_POOL_MAX_SIZE', 10)),
+            'PGBOUNCER': os.environ.get('PGBOUNCER', '').lower() in ('1', 'true', 'yes'),
+        },
     )
 }
 
 
+# Cache settings
+# The public read API caches rendered responses (see kunnic/cache.py). Set
+# API_CACHE_URL to a cache every gunicorn worker and the job worker share,
+# e.g. file:///var/tmp/kunnic-cache (one machine) or redis://localhost:6379/1
+# (any Redis-compatible server). Without one the cache is local memory, which
+# other processes never see, so responses aren't cached; ENABLED = True
+# caches anyway, for a single process such as runserver.
+API_CACHE_URL = os.environ.get('API_CACHE_URL', '')
+if API_CACHE_URL.startswith(('redis://', 'rediss://')):
+    API_CACHE = {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': API_CACHE_URL,
+    }
+elif API_CACHE_URL.startswith('file://'):
+    API_CACHE = {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': API_CACHE_URL[len('file://'):],
+    }
+else:
+    API_CACHE = {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'kunnic-api',
+    }
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'api': API_CACHE,
+}
+
+KUNNIC_API_CACHE = {
+    'ALIAS': 'api',
+    # None: on when the 'api' cache is shared (not local memory).
+    'ENABLED': None,
+    'TIMEOUT': 60 * 60,
+    # Browsers and CDNs revalidate every time; unchanged content costs a 304.
+    'MAX_AGE': 0,
+}
+
+
+# Media delivery
+# /api/songs/<id>/stream/ serves audio with Range support (see kunnic/media.py).
+# Behind nginx, set MEDIA_OFFLOAD=x-accel-redirect and map ACCEL_PREFIX to
+# MEDIA_ROOT in an internal location; Apache/lighttpd use x-sendfile.
+# MEDIA_URL paths ending in a content hash never change; a front server
+# serving MEDIA_ROOT should send them as the development server does, e.g.
+#   location ~ "^/media/.+/[0-9a-f]{64}(\.\w+)?$" {
+#       add_header Cache-Control "public, max-age=31536000, immutable";
+#   }
+KUNNIC_MEDIA = {
+    'CHUNK_SIZE': 64 * 1024,
+    'OFFLOAD': os.environ.get('MEDIA_OFFLOAD') or None,
+    'ACCEL_PREFIX': '/protected-media/',
+    'MAX_AGE': 0,
+}
+
+# Song metadata and waveform peaks are extracted on upload (see kunnic/audio.py).
+# WAV is decoded in-process; other formats need ffmpeg/ffprobe on PATH.
+KUNNIC_AUDIO = {
+    'DECODERS': ['kunnic.audio.WavDecoder', 'kunnic.audio.FFmpegDecoder'],
+    'RESOLUTIONS': [256, 1024, 4096],
+    'DEFAULT_RESOLUTION': 1024,
+}
+
+# Gallery uploads get resized AVIF/WebP copies and a BlurHash (see kunnic/images.py).
+KUNNIC_IMAGES = {
+    'WIDTHS': [320, 640, 1280],
+    'FORMATS': ['avif', 'webp'],
+    'QUALITY': {'avif': 50, 'webp': 75},
+    # Pool size for manage.py process_gallery; None uses every core.
+    'PROCESSES': None,
+}
+
+
+# Rate limiting (see kunnic/throttling.py). Buckets are per process by
+# default; set THROTTLE_STORE_URL to share them between workers, e.g.
+# file:///var/tmp/kunnic-throttle.sqlite3 or redis://localhost:6379/2.
+THROTTLE_STORE_URL = os.environ.get('THROTTLE_STORE_URL', '')
+if THROTTLE_STORE_URL.startswith(('redis://', 'rediss://')):
+    THROTTLE_STORE = ('kunnic.throttling.RedisStore', THROTTLE_STORE_URL)
+elif THROTTLE_STORE_URL.startswith('file://'):
+    THROTTLE_STORE = ('kunnic.throttling.FileStore', THROTTLE_STORE_URL[len('file://'):])
+else:
+    THROTTLE_STORE = ('kunnic.throttling.MemoryStore', '')
+
+KUNNIC_THROTTLE = {
+    'STORE': THROTTLE_STORE[0],
+    'LOCATION': THROTTLE_STORE[1],
+    'RATES': {
+        'read': '600/min',
+        'write': '120/min',
+        'comment': '5/min',
+        'upload': '600/min',
+    },
+}
+# Load tests drive every request from one address; KUNNIC_THROTTLE_OFF=1
+# lifts the limits for their servers (see kunnic/bench/).
+if os.environ.get('KUNNIC_THROTTLE_OFF', '').lower() in ('1', 'true', 'yes'):
+    KUNNIC_THROTTLE['RATES'] = {}
+
+
+# Request metrics (see kunnic/metrics.py): Server-Timing on every response and
+# Prometheus text at /metrics. Set METRICS_TOKEN to let scrapers in with
+# "Authorization: Bearer <token>"; without it only loopback may scrape, and
+# only with DEBUG on. Totals from several workers need a shared API cache
+# (API_CACHE_URL); with local memory a scrape sees one worker.
+KUNNIC_METRICS = {
+    'SERVER_TIMING': True,
+    'N_PLUS_ONE_THRESHOLD': 5,
+    'FLUSH_INTERVAL': 15,
+    'TOKEN': os.environ.get('METRICS_TOKEN') or None,
+}
+
+# Static JSON snapshot of the public API (see kunnic/snapshot.py), built by
+# "manage.py build_snapshot" into STATIC_ROOT/snapshot and served by WhiteNoise.
+# BASE_URL is the public origin used for absolute URLs inside the files.
+KUNNIC_SNAPSHOT = {
+    'ROOT': os.environ.get('SNAPSHOT_ROOT') or None,
+    'BASE_URL': os.environ.get('SNAPSHOT_BASE_URL', 'http://localhost:8000'),
+    'COMPRESS_MIN_SIZE': 256,
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -146,14 +295,54 @@ USE_TZ = True
 STATIC_URL = 'static/'
 STATIC_ROOT = BASE_DIR / 'staticfiles'
 STORAGES = {
+    "default": {
+        "BACKEND": "django.core.files.storage.FileSystemStorage",
+    },
     "staticfiles": {
         "BACKEND": "whitenoise.storage.CompressedManifestStaticFilesStorage",
     },
+    # Song audio, peaks and gallery images, stored by content hash and
+    # reference-counted (see kunnic/storage.py). "manage.py convert_media"
+    # moves files saved before it to their hashed names.
+    "media": {
+        "BACKEND": "kunnic.storage.ContentAddressedStorage",
+    },
 }
+# Uploads over 2.5 MB are hashed while they are spooled to disk, so storage
+# doesn't read them again.
+FILE_UPLOAD_HANDLERS = [
+    "django.core.files.uploadhandler.MemoryFileUploadHandler",
+    "kunnic.storage.HashingFileUploadHandler",
+]
+# Snapshot files carry a 12-character content hash (see kunnic/snapshot.py);
+# let WhiteNoise serve them with a far-future Cache-Control like the rest.
+WHITENOISE_IMMUTABLE_FILE_TEST = r'^.+\.[0-9a-f]{12}\..+$'
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
+# Background jobs (see kunnic/jobs.py): uploads are processed by
+# "manage.py runworker", the Procfile's worker. JOBS_EAGER=1 runs them in the
+# web process after each commit instead, for development without a worker.
+KUNNIC_JOBS = {
+    'EAGER': os.environ.get('JOBS_EAGER', '').lower() in ('1', 'true', 'yes'),
+    'THREADS': int(os.environ.get('JOBS_THREADS', 4)),
+    # Processes for image rendering; 0 renders on the job's thread.
+    'PROCESSES': int(os.environ.get('JOBS_PROCESSES', 0)),
+    'LEASE': 300,
+    'MAX_ATTEMPTS': 5,
+}
+
+# Resumable chunked uploads for songs and gallery images (see kunnic/uploads.py).
+# Chunks are staged on local disk; keep STAGING_DIR on the same file system as
+# MEDIA_ROOT so committing an upload is a rename.
+KUNNIC_UPLOADS = {
+    'STAGING_DIR': os.environ.get('UPLOAD_STAGING_DIR') or BASE_DIR / 'upload-staging',
+    'CHUNK_SIZE': 8 * 1024 * 1024,
+    'MAX_SIZE': 2 * 1024 * 1024 * 1024,
+    'EXPIRES': 24 * 60 * 60,
+}
+
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 # CORS settings
@@ -173,8 +362,25 @@ REST_FRAMEWORK = {
     # 'DEFAULT_PERMISSION_CLASSES': [
     #     'rest_framework.permissions.IsAuthenticatedOrReadOnly',
     # ],
-    'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
+    # Page numbers by default; ?pagination=cursor and ?count=false opt in to
+    # keyset pagination and count-free pages (see kunnic/pagination.py).
+    'DEFAULT_PAGINATION_CLASS': 'kunnic.pagination.KunnicPagination',
     'PAGE_SIZE': 10,
+    # Token buckets per scope; rates and store are in KUNNIC_THROTTLE.
+    'DEFAULT_THROTTLE_CLASSES': ['kunnic.throttling.BucketThrottle'],
+    # Proxies in front of the app whose X-Forwarded-For entries are trusted
+    # for the client address; 0 keys buckets on REMOTE_ADDR. Heroku's router is one.
+    'NUM_PROXIES': int(os.environ.get('NUM_PROXIES', 1 if os.environ.get('HEROKU_APP_NAME') else 0)),
+    # DRF's JSON renderer and parser on orjson; same bytes (see kunnic/renderers.py).
+    'DEFAULT_RENDERER_CLASSES': [
+        'kunnic.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'kunnic.renderers.FastJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
 }
 
 ALLOWED_HOSTS = ['127.0.0.1', 'localhost']
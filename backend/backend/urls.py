@@ -14,15 +14,20 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+import re
+
 from django.conf import settings
 from django.contrib import admin
-from django.urls import path
+from django.urls import path, re_path
 from django.urls import include
-from django.conf.urls.static import static
+from kunnic.media import serve_media
+from kunnic.metrics import metrics_view
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/', include('kunnic.urls')),
+    path('metrics', metrics_view, name='metrics'),
 ]
 
 if settings.DEBUG:
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
\ No newline at end of file
+    # Like django.conf.urls.static, plus Range and immutable caching of hashed names.
+    urlpatterns.append(re_path(rf'^{re.escape(settings.MEDIA_URL.lstrip("/"))}(?P<path>.+)$', serve_media))
\ No newline at end of file
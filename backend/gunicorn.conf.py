@@ -0,0 +1,44 @@
+"""
+Gunicorn configuration for production (see Procfile).
+
+The app is imported once in the master and warmed up there (see
+kunnic/warmup.py), then ``gc.freeze()`` moves everything it allocated out
+of the collector's reach. Workers fork from that state, so they start warm.
+They also keep sharing the master's memory pages, because the collector
+never writes to those objects.
+
+Database connections and the throttle store are opened per worker after
+the fork. ``GUNICORN_PRELOAD=0`` goes back to importing in every worker;
+each worker then warms itself up instead.
+
+Environment: WEB_CONCURRENCY (workers), GUNICORN_THREADS, GUNICORN_TIMEOUT,
+GUNICORN_MAX_REQUESTS (recycle workers after that many requests, 0 = never).
+"""
+import gc
+import multiprocessing
+import os
+
+preload_app = os.environ.get('GUNICORN_PRELOAD', '1').lower() in ('1', 'true', 'yes')
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+threads = int(os.environ.get('GUNICORN_THREADS', 1))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 30))
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 0))
+max_requests_jitter = max_requests // 10
+
+
+def when_ready(server):
+    if not preload_app:
+        return
+    from kunnic.warmup import warmup
+
+    warmup()
+    gc.collect()
+    gc.freeze()
+
+
+def post_worker_init(worker):
+    from kunnic.warmup import connect, warmup
+
+    if not preload_app:
+        warmup()
+    connect()
@@ -1,14 +1,31 @@
 from django.contrib import admin
-from kunnic.models import Post, Song, GalleryImage, Comment
+from django.utils import timezone
+from kunnic.models import Job, Post, PostTag, Song, GalleryImage, Comment, Tag
+from kunnic.moderation import moderate
 # Register your models here.
 
+class PostTagInline(admin.TabularInline):
+    model = PostTag
+    fields = ('tag',)
+    extra = 1
+
 @admin.register(Post)
 class PostAdmin(admin.ModelAdmin):
-    list_display = ('title', 'slug', 'is_published', 'published_at', 'updated_at', 'created_at')
+    list_display = ('title', 'slug', 'is_published', 'comment_count', 'published_at', 'updated_at', 'created_at')
+    readonly_fields = ('comment_count',)
     prepopulated_fields = {'slug': ('title',)}
     search_fields = ('title', 'content')
-    list_filter = ('is_published', 'published_at')
+    list_filter = ('is_published', 'published_at', 'tags')
     ordering = ('-published_at',)
+    inlines = (PostTagInline,)
+
+@admin.register(Tag)
+class TagAdmin(admin.ModelAdmin):
+    list_display = ('name', 'slug', 'post_count')
+    readonly_fields = ('post_count',)
+    prepopulated_fields = {'slug': ('name',)}
+    search_fields = ('name',)
+    ordering = ('name',)
 
 @admin.register(Song)
 class SongAdmin(admin.ModelAdmin):
@@ -16,17 +33,47 @@ class SongAdmin(admin.ModelAdmin):
     search_fields = ('title', 'artist')
     list_filter = ('release_date',)
     ordering = ('-release_date',)
+    readonly_fields = ('duration', 'sample_rate', 'channels', 'bitrate', 'peaks_file', 'upload_date')
 
 @admin.register(GalleryImage)
 class GalleryAdmin(admin.ModelAdmin):
     list_display = ('image', 'caption', 'upload_date')
     search_fields = ('caption',)
     ordering = ('-upload_date',)
-    readonly_fields = ('upload_date',)
+    readonly_fields = ('width', 'height', 'placeholder', 'derivatives', 'upload_date')
 
 @admin.register(Comment)
 class CommentAdmin(admin.ModelAdmin):
-    list_display = ('post', 'author', 'content', 'created_at')
+    list_display = ('post', 'author', 'content', 'is_approved', 'created_at')
+    list_select_related = ('post',)
     search_fields = ('content',)
-    list_filter = ('created_at',)
-    ordering = ('-created_at',)
\ No newline at end of file
+    list_filter = ('is_approved', 'created_at')
+    ordering = ('-created_at',)
+    actions = ('approve_comments', 'hide_comments')
+
+    @admin.action(description='Approve selected comments')
+    def approve_comments(self, request, queryset):
+        self.message_user(request, f'Approved {moderate(queryset, "approve")} comments.')
+
+    @admin.action(description='Hide selected comments')
+    def hide_comments(self, request, queryset):
+        self.message_user(request, f'Hid {moderate(queryset, "hide")} comments.')
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ('kind', 'status', 'attempts', 'run_at', 'worker', 'created_at', 'finished_at')
+    list_filter = ('status', 'kind')
+    ordering = ('-created_at',)
+    readonly_fields = ('key', 'attempts', 'worker', 'error', 'result', 'created_at', 'started_at', 'finished_at')
+    actions = ('retry_jobs',)
+
+    @admin.action(description='Retry selected failed jobs')
+    def retry_jobs(self, request, queryset):
+        count = 0
+        for job in queryset.filter(status=Job.FAILED):
+            # Skipped if the same job is queued already.
+            if not Job.objects.filter(key=job.key, status=Job.QUEUED).exists():
+                count += Job.objects.filter(pk=job.pk, status=Job.FAILED).update(
+                    status=Job.QUEUED, attempts=0, run_at=timezone.now(), finished_at=None,
+                )
+        self.message_user(request, f'Queued {count} jobs again.')
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class KunnicConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'kunnic'
+
+    def ready(self):
+        from kunnic import signals  # noqa: F401
@@ -0,0 +1,124 @@
+"""
+Monthly archive and tag counts for posts.
+
+``ArchiveMonth`` holds the number of published posts per calendar month in
+``TIME_ZONE`` and ``Tag.post_count`` the number of published posts per
+tag. ``PostTag`` rows carry copies of their post's ``is_published`` and
+``published_at``, so a tag's posts are read in order off one index.
+
+Single saves and deletes adjust all three with ``F()`` from
+``kunnic/signals.py``. ``post.tags.add()`` and friends bulk-create their rows,
+which skips the signals, so :func:`tags_added` fills those rows in
+afterwards. :func:`refresh_archive` recounts everything from ``Post``.
+"""
+import datetime
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce, TruncMonth
+from django.utils import timezone
+
+from kunnic.cache import bump_generation
+from kunnic.models import ArchiveMonth, Post, PostTag, Tag
+
+
+def month_of(published_at):
+    local = timezone.localtime(published_at)
+    return local.year, local.month
+
+
+def month_range(year, month):
+    """``(start, end)`` of a calendar month in ``TIME_ZONE``, end exclusive."""
+    start = timezone.make_aware(datetime.datetime(year, month, 1))
+    end = timezone.make_aware(datetime.datetime(year + month // 12, month % 12 + 1, 1))
+    return start, end
+
+
+def adjust_month(year, month, delta):
+    if not ArchiveMonth.objects.filter(year=year, month=month).update(post_count=F('post_count') + delta):
+        ArchiveMonth.objects.get_or_create(year=year, month=month)
+        ArchiveMonth.objects.filter(year=year, month=month).update(post_count=F('post_count') + delta)
+
+
+def adjust_tag_count(tag_id, delta):
+    Tag.objects.filter(pk=tag_id).update(post_count=F('post_count') + delta)
+
+
+def post_changed(post, previous):
+    """
+    Bookkeeping after ``post`` was saved. ``previous`` is its
+    ``(is_published, published_at)`` before the save, ``None`` for a new post.
+    """
+    was_published, was_published_at = previous or (False, None)
+    if (was_published, was_published_at) == (post.is_published, post.published_at):
+        return
+    archived_in = month_of(was_published_at) if was_published else None
+    now_archived_in = month_of(post.published_at) if post.is_published else None
+    if archived_in != now_archived_in:
+        if archived_in is not None:
+            adjust_month(*archived_in, -1)
+        if now_archived_in is not None:
+            adjust_month(*now_archived_in, 1)
+    if previous is None:
+        # Tags are only added after the post exists.
+        return
+    PostTag.objects.filter(post=post).update(is_published=post.is_published, published_at=post.published_at)
+    if was_published != post.is_published:
+        Tag.objects.filter(pk__in=PostTag.objects.filter(post=post).values('tag')).update(
+            post_count=F('post_count') + (1 if post.is_published else -1)
+        )
+
+
+def posts_created(posts):
+    """Count bulk-created ``posts`` into the archive; ``Post.save()`` does it through signals."""
+    months = Counter(month_of(post.published_at) for post in posts if post.is_published)
+    for (year, month), count in months.items():
+        adjust_month(year, month, count)
+
+
+def sync_post_tags(rows):
+    """Copy each post's publish state and date onto ``rows``, a ``PostTag`` queryset."""
+    post = Post.objects.filter(pk=OuterRef('post'))
+    return rows.update(
+        is_published=Subquery(post.values('is_published')),
+        published_at=Subquery(post.values('published_at')),
+    )
+
+
+def tags_added(rows):
+    """Fill in and count ``rows``, ``PostTag`` rows just bulk-created."""
+    # Pinned first: filling them in may take them out of the queryset.
+    rows = PostTag.objects.filter(pk__in=list(rows.values_list('pk', flat=True)))
+    sync_post_tags(rows)
+    counts = rows.filter(is_published=True).order_by().values('tag').annotate(total=Count('pk'))
+    for tag_id, total in counts.values_list('tag', 'total'):
+        adjust_tag_count(tag_id, total)
+
+
+def refresh_tag_counts(tag_ids=None):
+    """Recount published posts for ``tag_ids`` (every tag if ``None``) in one query."""
+    published = (
+        PostTag.objects.filter(tag=OuterRef('pk'), is_published=True)
+        .order_by().values('tag').annotate(total=Count('pk')).values('total')
+    )
+    tags = Tag.objects.all() if tag_ids is None else Tag.objects.filter(pk__in=tag_ids)
+    return tags.update(post_count=Coalesce(Subquery(published), 0))
+
+
+def refresh_archive():
+    """Rebuild the month table, the ``PostTag`` copies and every tag count from ``Post``."""
+    months = (
+        Post.objects.filter(is_published=True).order_by()
+        .annotate(month=TruncMonth('published_at')).values('month').annotate(total=Count('pk'))
+    )
+    with transaction.atomic():
+        ArchiveMonth.objects.all().delete()
+        ArchiveMonth.objects.bulk_create([
+            ArchiveMonth(year=row['month'].year, month=row['month'].month, post_count=row['total'])
+            for row in months
+        ])
+        sync_post_tags(PostTag.objects.all())
+        refresh_tag_counts()
+    bump_generation(Post)
+    bump_generation(Tag)
@@ -0,0 +1,183 @@
+"""
+Async read path for the kunnic API.
+
+With ``KUNNIC_ASYNC_READS`` on (run the project under ASGI, e.g.
+``gunicorn backend.asgi -k uvicorn_worker.UvicornWorker``), anonymous JSON
+``GET``/``HEAD`` on the post, song and gallery list and detail routes is
+served here on the async ORM. Querysets, validators and serializers still
+come from the viewsets in ``kunnic/views.py``, and responses share the same
+ETags and cache entries as the sync path, so either path can answer the
+next request.
+
+Anything else is delegated to the viewset: writes, authenticated users, the
+browsable API and keyset (``?cursor=``) pages.
+
+``/api/home/`` gathers the latest posts, songs and gallery images in one
+round trip and is always async.
+"""
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework.exceptions import APIException, Throttled
+from rest_framework.request import Request
+
+from kunnic.cache import get_cached_response, get_response_key, is_enabled, store_response
+from kunnic.conditional import aget_validator, get_not_modified, set_validator_headers
+from kunnic.renderers import FastJSONRenderer
+from kunnic.throttling import BucketThrottle, aget_wait, retry_after
+from kunnic.views import GalleryImageViewSet, PostViewSet, SongViewSet
+
+renderer = FastJSONRenderer()
+
+
+def json_response(data, status=200):
+    return HttpResponse(renderer.render(data), status=status, content_type=renderer.media_type)
+
+
+def not_found(viewset):
+    model = viewset.queryset.model
+    return json_response({'detail': f'No {model._meta.object_name} matches the given query.'}, status=404)
+
+
+async def can_serve(request):
+    """Anonymous JSON page-number reads; the rest goes to the sync viewset."""
+    params = request.GET
+    if params.get('format', 'json') != 'json' or 'text/html' in request.headers.get('Accept', ''):
+        return False
+    if 'cursor' in params or params.get('pagination') == 'cursor':
+        return False
+    user = await request.auser()
+    return not user.is_authenticated
+
+
+async def throttled(request):
+    """The ``read`` bucket the sync views charge through DRF; a 429 when empty."""
+    user = await request.auser()
+    key = f'user:{user.pk}' if user.is_authenticated else f'ip:{BucketThrottle().get_ident(request)}'
+    wait = await aget_wait('read', key)
+    if not wait:
+        return None
+    response = json_response({'detail': Throttled(wait).detail}, status=429)
+    response['Retry-After'] = retry_after(wait)
+    return response
+
+
+def get_view(viewset, request, action, kwargs):
+    """A viewset instance set up like DRF would, for its querysets and serializers."""
+    request = Request(request)
+    request.accepted_renderer = renderer
+    request.accepted_media_type = renderer.media_type
+    return viewset(action=action, request=request, args=(), kwargs=kwargs, format_kwarg=None)
+
+
+async def list_data(view):
+    queryset = view.filter_queryset(view.get_queryset())
+    paginator = view.paginator
+    page = await paginator.apaginate_queryset(queryset, view.request, view=view)
+    if page is None:
+        return view.get_serializer([obj async for obj in queryset], many=True).data
+    return paginator.get_paginated_data(view.get_serializer(page, many=True).data)
+
+
+async def retrieve_data(view):
+    queryset = view.filter_queryset(view.get_queryset())
+    lookup_url_kwarg = view.lookup_url_kwarg or view.lookup_field
+    try:
+        obj = await queryset.aget(**{view.lookup_field: view.kwargs[lookup_url_kwarg]})
+    except (queryset.model.DoesNotExist, ValueError):
+        return None
+    return view.get_serializer(obj).data
+
+
+async def serve(views, request, fetch):
+    """
+    Validate, then answer from the cache or ``fetch()``. ``views`` are the
+    viewset instances whose cache models the response depends on; the
+    first one's request is used for keys and URLs.
+    """
+    drf_request = views[0].request
+    models = tuple({model: None for view in views for model in view.cache_models})
+
+    etag, last_modified = await aget_validator(drf_request, models)
+    response = get_not_modified(request, etag, last_modified)
+    if response is None:
+        key = None
+        if is_enabled():
+            key = await sync_to_async(get_response_key)(drf_request, models)
+            response = await sync_to_async(get_cached_response)(key)
+        if response is None:
+            data = await fetch()
+            if data is None:
+                return None
+            response = json_response(data)
+            if key is not None:
+                await sync_to_async(store_response)(key, response)
+                response['X-Cache'] = 'MISS'
+    return set_validator_headers(response, etag, last_modified, authenticated=False)
+
+
+def async_read_view(viewset, actions):
+    """
+    Route ``actions`` (``{'get': 'list', 'post': 'create'}``) to ``viewset``,
+    serving ``list``/``retrieve`` reads on the async path when possible.
+    """
+    sync_view = sync_to_async(viewset.as_view(actions))
+    action = actions['get']
+
+    @csrf_exempt
+    async def view(request, **kwargs):
+        if request.method not in ('GET', 'HEAD') or not await can_serve(request):
+            return await sync_view(request, **kwargs)
+        if response := await throttled(request):
+            return response
+        instance = get_view(viewset, request, action, kwargs)
+        try:
+            if action == 'list':
+                return await serve([instance], request, lambda: list_data(instance))
+            response = await serve([instance], request, lambda: retrieve_data(instance))
+        except APIException as exc:
+            # e.g. an out-of-range ?page= or an unknown ?fields= name; shaped
+            # like DRF's exception handler.
+            data = exc.detail if isinstance(exc.detail, (list, dict)) else {'detail': exc.detail}
+            return json_response(data, status=exc.status_code)
+        return response or not_found(viewset)
+    return view
+
+
+HOME_SECTIONS = (
+    ('posts', PostViewSet, 5),
+    ('songs', SongViewSet, 5),
+    ('gallery', GalleryImageViewSet, 8),
+)
+
+
+async def home(request):
+    """
+    ``GET /api/home/``: the latest posts, songs and gallery images, fetched
+    concurrently.
+    """
+    if request.method not in ('GET', 'HEAD'):
+        return json_response({'detail': f'Method "{request.method}" not allowed.'}, status=405)
+    if response := await throttled(request):
+        return response
+    views = [get_view(viewset, request, 'list', {}) for _, viewset, _ in HOME_SECTIONS]
+    for view in views:
+        # ?fields= names one resource's fields; the sections are three.
+        view.sparse_fields = False
+
+    async def section(view, limit):
+        queryset = view.filter_queryset(view.get_queryset())
+        return view.get_serializer([obj async for obj in queryset[:limit]], many=True).data
+
+    async def fetch():
+        results = await asyncio.gather(*(
+            section(view, limit) for view, (_, _, limit) in zip(views, HOME_SECTIONS)
+        ))
+        return {name: data for (name, _, _), data in zip(HOME_SECTIONS, results)}
+
+    if (await request.auser()).is_authenticated:
+        # Private responses skip the shared cache and validators.
+        return json_response(await fetch())
+    return await serve(views, request, fetch)
@@ -0,0 +1,222 @@
+"""
+Audio metadata and waveform peaks for uploaded songs.
+
+:func:`process_song` decodes ``Song.audio_file`` with the first decoder in
+``KUNNIC_AUDIO['DECODERS']`` that accepts it, stores duration, sample rate,
+channel count and average bitrate on the song and writes min/max peaks at
+every resolution in ``RESOLUTIONS`` to a binary sidecar (``Song.peaks_file``).
+The player reads one resolution from the sidecar through
+``/api/songs/<id>/peaks/`` instead of decoding the whole track.
+
+Sidecar layout, little endian::
+
+    b'KPKS' | version u8 | count u8
+    count x (resolution u32, buckets u32)
+    count x int8[buckets * 2]   # min, max interleaved, scaled to -127..127
+
+A decoder is any class with ``decode(fieldfile)`` returning
+:class:`DecodedAudio` or raising :class:`UnsupportedAudio`.
+"""
+import collections
+import io
+import logging
+import os
+import shutil
+import struct
+import subprocess
+import wave
+
+import numpy as np
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'DECODERS': ['kunnic.audio.WavDecoder', 'kunnic.audio.FFmpegDecoder'],
+    # Buckets across the whole track; the player asks for the one nearest its width.
+    'RESOLUTIONS': [256, 1024, 4096],
+    'DEFAULT_RESOLUTION': 1024,
+}
+
+MAGIC = b'KPKS'
+VERSION = 1
+HEADER = struct.Struct('<4sBB')
+ENTRY = struct.Struct('<II')
+
+# ``frames`` is an (n, channels) integer array at ``frame_rate`` and ``scale`` its
+# full-scale value; ``sample_rate`` and ``channels`` describe the source.
+DecodedAudio = collections.namedtuple(
+    'DecodedAudio', ['frames', 'scale', 'frame_rate', 'sample_rate', 'channels'],
+)
+
+
+def get_setting(name):
+    return getattr(settings, 'KUNNIC_AUDIO', {}).get(name, DEFAULTS[name])
+
+
+class UnsupportedAudio(Exception):
+    pass
+
+
+class WavDecoder:
+    """PCM WAV through the standard library; samples are never copied to floats."""
+
+    def decode(self, fieldfile):
+        fieldfile.open('rb')
+        try:
+            with wave.open(fieldfile.file) as wav:
+                channels, width, rate = wav.getnchannels(), wav.getsampwidth(), wav.getframerate()
+                data = wav.readframes(wav.getnframes())
+        except (wave.Error, EOFError) as exc:
+            raise UnsupportedAudio(str(exc) or 'Not a PCM WAV file') from exc
+        finally:
+            fieldfile.close()
+
+        if width == 1:
+            # 8-bit WAV is unsigned.
+            samples = np.frombuffer(data, np.uint8).astype(np.int16) - 128
+        elif width == 2:
+            samples = np.frombuffer(data, '<i2')
+        elif width == 3:
+            raw = np.frombuffer(data, np.uint8).reshape(-1, 3).astype(np.int32)
+            samples = raw[:, 0] | (raw[:, 1] << 8) | (raw[:, 2] << 16)
+            samples = np.where(samples & 0x800000, samples - 0x1000000, samples)
+        elif width == 4:
+            samples = np.frombuffer(data, '<i4')
+        else:
+            raise UnsupportedAudio(f'Unsupported sample width: {width}')
+        return DecodedAudio(samples.reshape(-1, channels), float(1 << (8 * width - 1)), rate, rate, channels)
+
+
+class FFmpegDecoder:
+    """
+    Anything ffmpeg can read (MP3, AAC, FLAC, Ogg...). Decodes to mono 16-bit
+    PCM at ``peak_rate``, which is plenty for peaks; the source sample rate
+    and channel count come from ffprobe.
+    """
+    peak_rate = 8000
+
+    def decode(self, fieldfile):
+        if not shutil.which('ffmpeg') or not shutil.which('ffprobe'):
+            raise UnsupportedAudio('ffmpeg is not installed')
+        try:
+            source, data = fieldfile.path, None
+        except NotImplementedError:
+            # Remote storage: pipe the file through stdin instead.
+            fieldfile.open('rb')
+            try:
+                source, data = 'pipe:0', fieldfile.read()
+            finally:
+                fieldfile.close()
+
+        probe = self.run(
+            ['ffprobe', '-v', 'error', '-select_streams', 'a:0',
+             '-show_entries', 'stream=sample_rate,channels', '-of', 'csv=p=0', source], data,
+        )
+        try:
+            rate, channels = (int(value) for value in probe.decode().strip().split(',')[:2])
+        except ValueError as exc:
+            raise UnsupportedAudio('No audio stream') from exc
+
+        pcm = self.run(
+            ['ffmpeg', '-v', 'error', '-i', source, '-f', 's16le', '-ac', '1', '-ar', str(self.peak_rate), 'pipe:1'],
+            data,
+        )
+        return DecodedAudio(np.frombuffer(pcm, '<i2').reshape(-1, 1), 32768.0, self.peak_rate, rate, channels)
+
+    def run(self, command, data):
+        try:
+            return subprocess.run(command, input=data, capture_output=True, check=True).stdout
+        except subprocess.CalledProcessError as exc:
+            raise UnsupportedAudio(exc.stderr.decode(errors='replace').strip()) from exc
+
+
+def get_decoders():
+    return [import_string(path)() for path in get_setting('DECODERS')]
+
+
+def decode(fieldfile):
+    errors = []
+    for decoder in get_decoders():
+        try:
+            return decoder.decode(fieldfile)
+        except UnsupportedAudio as exc:
+            errors.append(f'{type(decoder).__name__}: {exc}')
+    raise UnsupportedAudio('; '.join(errors) or 'No decoders configured')
+
+
+def compute_peaks(frames, scale, resolution):
+    """
+    Return an int8 ``(buckets, 2)`` array of per-bucket min and max over all
+    channels, ``buckets = min(resolution, len(frames))``.
+    """
+    buckets = min(resolution, len(frames))
+    if not buckets:
+        return np.zeros((0, 2), np.int8)
+    low, high = frames.min(axis=1), frames.max(axis=1)
+    edges = np.linspace(0, len(frames), buckets + 1).astype(np.intp)[:-1]
+    peaks = np.stack([np.minimum.reduceat(low, edges), np.maximum.reduceat(high, edges)], axis=1)
+    return np.clip(np.rint(peaks * (127 / scale)), -127, 127).astype(np.int8)
+
+
+def pack_peaks(peaks_by_resolution):
+    entries = sorted(peaks_by_resolution.items())
+    buffer = io.BytesIO()
+    buffer.write(HEADER.pack(MAGIC, VERSION, len(entries)))
+    for resolution, peaks in entries:
+        buffer.write(ENTRY.pack(resolution, len(peaks)))
+    for _, peaks in entries:
+        buffer.write(peaks.tobytes())
+    return buffer.getvalue()
+
+
+def read_peaks(file, resolution=None):
+    """
+    Read one resolution from a sidecar: the smallest stored resolution of at
+    least ``resolution``, else the largest. Returns ``(resolution,
+    available, peaks)``; only the chosen block is read.
+    """
+    magic, version, count = HEADER.unpack(file.read(HEADER.size))
+    if magic != MAGIC or version != VERSION:
+        raise ValueError('Not a peaks sidecar')
+    entries = [ENTRY.unpack(file.read(ENTRY.size)) for _ in range(count)]
+    available = [entry[0] for entry in entries]
+
+    wanted = resolution or get_setting('DEFAULT_RESOLUTION')
+    index = next((i for i, value in enumerate(available) if value >= wanted), count - 1)
+    offset = HEADER.size + ENTRY.size * count + 2 * sum(buckets for _, buckets in entries[:index])
+    file.seek(offset)
+    buckets = entries[index][1]
+    peaks = np.frombuffer(file.read(2 * buckets), np.int8).reshape(-1, 2)
+    return available[index], available, peaks
+
+
+def process_song(song):
+    """
+    Fill the song's audio metadata and peaks sidecar and save those fields.
+    Undecodable files are logged and leave the fields empty.
+    """
+    try:
+        decoded = decode(song.audio_file)
+    except (UnsupportedAudio, OSError) as exc:
+        logger.warning('Could not decode audio for song %s: %s', song.pk, exc)
+        return False
+
+    duration = len(decoded.frames) / decoded.frame_rate
+    song.duration = round(duration, 3)
+    song.sample_rate = decoded.sample_rate
+    song.channels = decoded.channels
+    song.bitrate = round(song.audio_file.size * 8 / duration) if duration else None
+
+    peaks = {
+        resolution: compute_peaks(decoded.frames, decoded.scale, resolution)
+        for resolution in get_setting('RESOLUTIONS')
+    }
+    if song.peaks_file:
+        song.peaks_file.delete(save=False)
+    name = os.path.splitext(os.path.basename(song.audio_file.name))[0] + '.peaks'
+    song.peaks_file.save(name, ContentFile(pack_peaks(peaks)), save=False)
+    song.save(update_fields=['duration', 'sample_rate', 'channels', 'bitrate', 'peaks_file'])
+    return True
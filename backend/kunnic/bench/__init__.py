@@ -0,0 +1,12 @@
+"""
+Load-testing kit for the kunnic API.
+
+* :mod:`kunnic.bench.seed` generates large, realistic datasets
+  (``manage.py seed_bench_data``);
+* :mod:`kunnic.bench.scenarios` scripts a scenario per router endpoint and
+  the comments action;
+* :mod:`kunnic.bench.driver` is the concurrent HTTP load driver.
+
+``manage.py run_bench`` ties them together against a local gunicorn and
+saves a JSON report to compare between commits.
+"""
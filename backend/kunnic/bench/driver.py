@@ -0,0 +1,155 @@
+"""
+A small concurrent HTTP/1.1 load driver on asyncio streams.
+
+Each client keeps its connection alive when the server allows it, sends
+one request at a time and times it from write to last body byte. Query
+counts and database time come from the ``db`` entry of the
+``Server-Timing`` header (see kunnic/metrics.py), cache hits from
+``X-Cache``. Responses must carry ``Content-Length``, as every kunnic
+response does.
+"""
+import asyncio
+import re
+import socket
+import statistics
+import subprocess
+import time
+from collections import Counter
+
+DB_TIMING = re.compile(r'db;dur=([\d.]+);desc="(\d+) queries"')
+
+
+class Request:
+    __slots__ = ('method', 'path', 'body', 'headers')
+
+    def __init__(self, method, path, body=b'', headers=None):
+        self.method = method
+        self.path = path
+        self.body = body
+        self.headers = headers or {}
+
+    def encode(self, host):
+        headers = {'Host': host, 'Accept': 'application/json', **self.headers}
+        if self.body or self.method not in ('GET', 'HEAD'):
+            headers['Content-Length'] = str(len(self.body))
+        head = ''.join(f'{name}: {value}\r\n' for name, value in headers.items())
+        return f'{self.method} {self.path} HTTP/1.1\r\n{head}\r\n'.encode('latin-1') + self.body
+
+
+class Result:
+    """Samples from one run; ``latencies`` and ``queries`` cover successful responses only."""
+
+    def __init__(self):
+        self.latencies = []
+        self.queries = []
+        self.db_durations = []
+        self.statuses = Counter()
+        self.cache_hits = 0
+        self.errors = 0
+        self.elapsed = 0.0
+
+    def summary(self):
+        latencies = sorted(self.latencies)
+        return {
+            'requests': len(latencies),
+            'errors': self.errors,
+            'statuses': {str(status): count for status, count in sorted(self.statuses.items())},
+            'throughput': len(latencies) / self.elapsed if self.elapsed else 0.0,
+            'latency_ms': {
+                'mean': statistics.fmean(latencies) * 1000 if latencies else 0.0,
+                'p50': percentile(latencies, 0.50) * 1000,
+                'p90': percentile(latencies, 0.90) * 1000,
+                'p99': percentile(latencies, 0.99) * 1000,
+                'max': (latencies[-1] if latencies else 0.0) * 1000,
+            },
+            'cache_hit_ratio': self.cache_hits / len(latencies) if latencies else 0.0,
+            'queries_per_request': statistics.fmean(self.queries) if self.queries else None,
+            'db_ms_per_request': statistics.fmean(self.db_durations) if self.db_durations else None,
+        }
+
+
+def percentile(ordered, fraction):
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+async def run_load(port, make_request, concurrency, duration, ok=(200,), host='localhost'):
+    """
+    Send ``make_request(i)`` (a :class:`Request`) from ``concurrency``
+    clients for ``duration`` seconds; statuses outside ``ok`` count as errors.
+    """
+    result = Result()
+    stop = time.monotonic() + duration
+
+    async def client(offset):
+        reader = writer = None
+        i = offset
+        while time.monotonic() < stop:
+            request = make_request(i)
+            i += concurrency
+            started = time.perf_counter()
+            try:
+                if writer is None:
+                    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+                writer.write(request.encode(host))
+                status, headers = await read_response(reader)
+            except (OSError, asyncio.IncompleteReadError, ValueError):
+                result.errors += 1
+                writer = None
+                continue
+            result.statuses[status] += 1
+            if status in ok:
+                result.latencies.append(time.perf_counter() - started)
+                result.cache_hits += headers.get('x-cache') == 'HIT'
+                match = DB_TIMING.search(headers.get('server-timing', ''))
+                if match:
+                    result.db_durations.append(float(match.group(1)))
+                    result.queries.append(int(match.group(2)))
+            else:
+                result.errors += 1
+            if headers.get('connection', '').lower() == 'close':
+                # Sync gunicorn workers close the connection after every response.
+                writer.close()
+                writer = None
+        if writer is not None:
+            writer.close()
+
+    started = time.monotonic()
+    await asyncio.gather(*(client(offset) for offset in range(concurrency)))
+    result.elapsed = time.monotonic() - started
+    return result
+
+
+async def read_response(reader):
+    head = await reader.readuntil(b'\r\n\r\n')
+    lines = head.decode('latin-1').split('\r\n')
+    status = int(lines[0].split()[1])
+    headers = {}
+    for line in lines[1:]:
+        if ':' in line:
+            name, value = line.split(':', 1)
+            headers[name.strip().lower()] = value.strip()
+    await reader.readexactly(int(headers.get('content-length', 0)))
+    return status, headers
+
+
+def start_server(command, port, cwd, env, name='server'):
+    """Start ``command`` and wait until it listens on ``port``; raises ``RuntimeError`` if it doesn't."""
+    server = subprocess.Popen(command, cwd=cwd, env=env)
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f'{name} exited with {server.returncode}.')
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return server
+        except OSError:
+            time.sleep(0.2)
+    server.terminate()
+    raise RuntimeError(f'{name} did not start listening on port {port}.')
+
+
+def stop_server(server):
+    server.terminate()
+    server.wait(timeout=30)
@@ -0,0 +1,118 @@
+"""
+Load-test scenarios: one per router endpoint and action.
+
+A scenario turns a request number into a :class:`~kunnic.bench.driver.Request`,
+drawing slugs and ids from a :class:`Sample` of the database so requests
+spread over the data the way real traffic would. List scenarios walk up to
+the first ``LIST_PAGES`` pages. Comment reads and writes go to the posts with
+the most comments.
+"""
+import json
+import math
+from importlib import import_module
+
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY
+from django.contrib.auth.models import User
+from django.utils.crypto import get_random_string
+from rest_framework.settings import api_settings
+
+from kunnic.bench.driver import Request
+from kunnic.models import GalleryImage, Post, Song, Tag
+
+LIST_PAGES = 50
+SAMPLE_SIZE = 1000
+SEARCH_TERMS = ('lorem', 'dolor sit', 'tempor', 'magna aliqua', 'voluptate', 'laborum', 'bench artist')
+
+
+def login(user):
+    """
+    ``(username, cookie, csrf token)`` for a session of ``user``, created
+    directly in the session store as the browser frontend's would be after
+    logging in. Password checks would dominate a write scenario otherwise.
+    """
+    session = import_module(settings.SESSION_ENGINE).SessionStore()
+    session[SESSION_KEY] = str(user.pk)
+    session[BACKEND_SESSION_KEY] = 'django.contrib.auth.backends.ModelBackend'
+    session[HASH_SESSION_KEY] = user.get_session_auth_hash()
+    session.create()
+    token = get_random_string(32)
+    cookie = f'{settings.SESSION_COOKIE_NAME}={session.session_key}; {settings.CSRF_COOKIE_NAME}={token}'
+    return user.get_username(), cookie, token
+
+
+class Sample:
+    """Slugs, ids and user sessions the scenarios draw from, made once before a run."""
+
+    def __init__(self, size=SAMPLE_SIZE):
+        published = Post.objects.filter(is_published=True)
+        self.slugs = list(published.order_by('?').values_list('slug', flat=True)[:size])
+        self.hot_slugs = list(published.order_by('-comment_count').values_list('slug', flat=True)[:max(1, size // 10)])
+        self.song_ids = list(Song.objects.order_by('?').values_list('pk', flat=True)[:size])
+        self.peak_song_ids = list(Song.objects.exclude(peaks_file='').order_by('?').values_list('pk', flat=True)[:size])
+        self.image_ids = list(GalleryImage.objects.order_by('?').values_list('pk', flat=True)[:size])
+        self.tags = list(Tag.objects.filter(post_count__gt=0).values_list('slug', flat=True)[:size])
+        self.sessions = [login(user) for user in User.objects.filter(username__startswith='bench-user-')[:20]]
+        self.pages = {
+            f'/api/{prefix}/': max(1, min(LIST_PAGES, math.ceil(queryset.count() / api_settings.PAGE_SIZE)))
+            for prefix, queryset in (('posts', published), ('songs', Song.objects), ('gallery', GalleryImage.objects))
+        }
+
+
+def pick(values, i):
+    return values[(i * 7919) % len(values)]
+
+
+def get(path):
+    return lambda sample: lambda i: Request('GET', path)
+
+
+def get_pages(prefix):
+    return lambda sample: lambda i: Request('GET', f'{prefix}?page={i % sample.pages[prefix] + 1}')
+
+
+def get_each(template, values):
+    return lambda sample: lambda i: Request('GET', template.format(pick(getattr(sample, values), i)))
+
+
+def stream_song(sample):
+    # A player's first range request.
+    return lambda i: Request('GET', f'/api/songs/{pick(sample.peak_song_ids or sample.song_ids, i)}/stream/',
+                             headers={'Range': 'bytes=0-65535'})
+
+
+def post_comment(sample):
+    def make(i):
+        username, cookie, token = pick(sample.sessions, i)
+        body = json.dumps({'author': username, 'content': f'Benchmark comment {i}.'}).encode()
+        return Request('POST', f'/api/posts/{pick(sample.hot_slugs, i)}/comments/', body=body, headers={
+            'Content-Type': 'application/json', 'Cookie': cookie, 'X-CSRFToken': token,
+        })
+    return make
+
+
+def search(sample):
+    return lambda i: Request('GET', f'/api/search/?q={pick(SEARCH_TERMS, i).replace(" ", "+")}')
+
+
+# name: (build(sample) -> make(i), statuses that count as success, sample attributes it needs)
+SCENARIOS = {
+    'api-root': (get('/api/'), (200,), ()),
+    'home': (get('/api/home/'), (200,), ()),
+    'post-list': (get_pages('/api/posts/'), (200,), ()),
+    'post-tag-list': (get_each('/api/posts/?tag={}', 'tags'), (200,), ('tags',)),
+    'post-archive': (get('/api/posts/archive/'), (200,), ()),
+    'post-detail': (get_each('/api/posts/{}/', 'slugs'), (200,), ('slugs',)),
+    # What the blog window asks for: a trimmed list, and a post with its comments.
+    'post-list-sparse': (get('/api/posts/?fields=id,title,slug,excerpt,tags,created_at,author'), (200,), ()),
+    'post-detail-expand': (get_each('/api/posts/{}/?expand=comments,tags', 'hot_slugs'), (200,), ('hot_slugs',)),
+    'post-comments': (get_each('/api/posts/{}/comments/', 'hot_slugs'), (200,), ('hot_slugs',)),
+    'comment-create': (post_comment, (201,), ('hot_slugs', 'sessions')),
+    'song-list': (get_pages('/api/songs/'), (200,), ()),
+    'song-detail': (get_each('/api/songs/{}/', 'song_ids'), (200,), ('song_ids',)),
+    'song-peaks': (get_each('/api/songs/{}/peaks/', 'peak_song_ids'), (200,), ('peak_song_ids',)),
+    'song-stream': (stream_song, (206,), ('song_ids',)),
+    'gallery-list': (get_pages('/api/gallery/'), (200,), ()),
+    'gallery-detail': (get_each('/api/gallery/{}/', 'image_ids'), (200,), ('image_ids',)),
+    'search': (search, (200,), ()),
+}
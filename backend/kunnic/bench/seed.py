@@ -0,0 +1,267 @@
+"""
+Seed the database with realistic volumes for load tests.
+
+:data:`VOLUMES` is the full dataset; ``scale`` shrinks every table alike.
+Rows are bulk-inserted in batches, which sends no signals, so their
+bookkeeping runs once at the end: comment counts, the archive and tag
+counts, cache generations and, when asked, the search index.
+
+* Posts have HTML bodies of varied length, are spread over three years and
+  10% are drafts. Authors are drawn from the seeded users. Each post has up
+  to four tags, a few tags being on most posts.
+* Comments follow a long-tailed distribution, a few hot posts carrying
+  most of them, with 3% hidden.
+* Songs and gallery images go through the real upload processing jobs for a
+  few generated samples: sine-tone WAVs and gradient JPEGs. Every other row
+  points at a sample's files, metadata and derivatives; the media reference
+  counts are recounted at the end.
+
+Everything seeded is recognizable by name (``bench-`` usernames and slugs,
+"Bench sample" songs and images and the rows sharing their files).
+:meth:`Seeder.clear` removes it.
+"""
+import datetime
+import io
+import itertools
+import math
+import random
+import struct
+import time
+import wave
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.db import transaction
+from django.utils import timezone
+
+from kunnic.archive import refresh_archive
+from kunnic.cache import bump_generation
+from kunnic.jobs import run_now
+from kunnic.mediafiles import refresh_refs
+from kunnic.moderation import refresh_comment_counts
+from kunnic.models import Comment, GalleryImage, Post, PostTag, Song, Tag
+from kunnic.transfer import keep_timestamps
+
+VOLUMES = {
+    'users': 1_000,
+    'tags': 200,
+    'posts': 100_000,
+    'comments': 1_000_000,
+    'songs': 10_000,
+    'gallery': 50_000,
+}
+
+# Password of every seeded user, to log in as one by hand.
+PASSWORD = 'bench-password'
+SAMPLES = 8
+
+WORDS = (
+    'lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod tempor incididunt ut labore et dolore '
+    'magna aliqua enim ad minim veniam quis nostrud exercitation ullamco laboris nisi aliquip ex ea commodo '
+    'consequat duis aute irure in reprehenderit voluptate velit esse cillum fugiat nulla pariatur excepteur sint '
+    'occaecat cupidatat non proident sunt culpa qui officia deserunt mollit anim id est laborum'
+).split()
+
+
+class Seeder:
+    """
+    ``Seeder(scale=0.01).run()`` seeds 1% of :data:`VOLUMES`. ``log`` is
+    called with a line of progress per table.
+    """
+
+    def __init__(self, scale=1.0, batch_size=5000, seed=0, log=print):
+        self.volumes = {name: max(1, round(count * scale)) for name, count in VOLUMES.items()}
+        self.batch_size = batch_size
+        self.random = random.Random(seed)
+        self.log = log
+        self.now = timezone.now()
+
+    def run(self, index=False):
+        for name in ('users', 'tags', 'posts', 'comments', 'songs', 'gallery'):
+            started = time.perf_counter()
+            count = getattr(self, f'seed_{name}')(self.volumes[name])
+            elapsed = time.perf_counter() - started
+            self.log(f'Seeded {count} {name} in {elapsed:.1f}s ({count / elapsed if elapsed else 0:,.0f} rows/s)')
+        refresh_comment_counts(Post.objects.filter(slug__startswith='bench-post-').values('pk'))
+        refresh_archive()
+        refresh_refs()
+        for model in (Post, Comment, Song, GalleryImage):
+            bump_generation(model)
+        if index:
+            call_command('rebuild_search_index', stdout=io.StringIO())
+
+    def insert(self, model, rows):
+        """Bulk-insert ``rows`` (an iterable of unsaved objects) in batches; returns the count."""
+        count = 0
+        rows = iter(rows)
+        with keep_timestamps(model):
+            while batch := list(itertools.islice(rows, self.batch_size)):
+                with transaction.atomic():
+                    model.objects.bulk_create(batch)
+                count += len(batch)
+        return count
+
+    def text(self, words):
+        text = ' '.join(self.random.choices(WORDS, k=words))
+        return text[:1].upper() + text[1:] + '.'
+
+    def moment(self, days):
+        return self.now - datetime.timedelta(seconds=self.random.uniform(0, days * 24 * 60 * 60))
+
+    def seed_users(self, count):
+        password = make_password(PASSWORD)
+        return self.insert(User, (
+            User(username=f'bench-user-{i}', email=f'bench-user-{i}@example.com', password=password,
+                 date_joined=self.now)
+            for i in range(count)
+        ))
+
+    def seed_tags(self, count):
+        return self.insert(Tag, (Tag(name=f'Bench tag {i}', slug=f'bench-tag-{i}') for i in range(count)))
+
+    def seed_posts(self, count):
+        authors = list(User.objects.filter(username__startswith='bench-user-').values_list('pk', flat=True))
+
+        def build(i):
+            published_at = self.moment(3 * 365)
+            paragraphs = ''.join(f'<p>{self.text(self.random.randint(20, 80))}</p>'
+                                 for _ in range(self.random.randint(1, 8)))
+            updated_at = min(self.now, published_at + datetime.timedelta(hours=self.random.randint(0, 72)))
+            return Post(
+                title=self.text(self.random.randint(3, 9))[:-1], slug=f'bench-post-{i}', content=paragraphs,
+                is_published=self.random.random() >= 0.1, published_at=published_at,
+                created_at=published_at, updated_at=updated_at,
+                author_id=self.random.choice(authors),
+            )
+        count = self.insert(Post, (build(i) for i in range(count)))
+        self.seed_post_tags()
+        return count
+
+    def seed_post_tags(self):
+        tags = list(Tag.objects.filter(slug__startswith='bench-tag-').values_list('pk', flat=True))
+        weights = list(itertools.accumulate(1 / (rank + 1) for rank in range(len(tags))))
+        posts = Post.objects.filter(slug__startswith='bench-post-').values_list('pk', 'is_published', 'published_at')
+
+        def build():
+            for post_id, is_published, published_at in posts.iterator(chunk_size=self.batch_size):
+                for tag_id in set(self.random.choices(tags, cum_weights=weights, k=self.random.randint(0, 4))):
+                    yield PostTag(post_id=post_id, tag_id=tag_id, is_published=is_published, published_at=published_at)
+        return self.insert(PostTag, build())
+
+    def seed_comments(self, count):
+        posts = list(Post.objects.filter(slug__startswith='bench-post-').values_list('pk', 'published_at'))
+        self.random.shuffle(posts)
+        # Zipf-like: the post at rank r gets a share proportional to 1 / (r + 1).
+        weights = list(itertools.accumulate(1 / (rank + 1) for rank in range(len(posts))))
+
+        def build(post_id, published_at):
+            age = (self.now - published_at).total_seconds()
+            return Comment(
+                post_id=post_id, author=f'bench-user-{self.random.randrange(self.volumes["users"])}',
+                content=self.text(self.random.randint(5, 60)), is_approved=self.random.random() >= 0.03,
+                created_at=published_at + datetime.timedelta(seconds=self.random.uniform(0, age)),
+            )
+        chosen = (self.random.choices(posts, cum_weights=weights)[0] for _ in range(count))
+        return self.insert(Comment, (build(*post) for post in chosen))
+
+    def seed_songs(self, count):
+        samples = []
+        for i in range(min(SAMPLES, count)):
+            # Saved one by one so the upload signals queue their processing, run here.
+            sample = Song.objects.create(
+                title=f'Bench sample {i}', artist='Bench', release_date=self.now.date(),
+                audio_file=ContentFile(sine_wav(220 * (i + 1)), name=f'bench-sample-{i}.wav'),
+            )
+            run_now(sample.processing_job)
+            samples.append(Song.objects.get(pk=sample.pk))
+
+        def build(i):
+            sample = samples[i % len(samples)]
+            uploaded = self.moment(2 * 365)
+            return Song(
+                title=self.text(self.random.randint(1, 5))[:-1], artist=f'Bench artist {self.random.randrange(500)}',
+                audio_file=sample.audio_file.name, peaks_file=sample.peaks_file.name, duration=sample.duration,
+                sample_rate=sample.sample_rate, channels=sample.channels, bitrate=sample.bitrate,
+                lyrics=self.text(self.random.randint(50, 200)) if self.random.random() < 0.5 else None,
+                release_date=(uploaded - datetime.timedelta(days=self.random.randint(0, 3650))).date(),
+                upload_date=uploaded,
+            )
+        return len(samples) + self.insert(Song, (build(i) for i in range(count - len(samples))))
+
+    def seed_gallery(self, count):
+        samples = []
+        for i in range(min(SAMPLES, count)):
+            sample = GalleryImage.objects.create(
+                caption=f'Bench sample {i}', image=ContentFile(gradient_jpeg(i), name=f'bench-sample-{i}.jpg'),
+            )
+            run_now(sample.processing_job)
+            samples.append(GalleryImage.objects.get(pk=sample.pk))
+
+        def build(i):
+            sample = samples[i % len(samples)]
+            return GalleryImage(
+                image=sample.image.name, caption=self.text(self.random.randint(2, 12)), width=sample.width,
+                height=sample.height, placeholder=sample.placeholder, derivatives=sample.derivatives,
+                upload_date=self.moment(2 * 365),
+            )
+        return len(samples) + self.insert(GalleryImage, (build(i) for i in range(count - len(samples))))
+
+    def clear(self):
+        """Delete every seeded row and the sample files."""
+        posts = Post.objects.filter(slug__startswith='bench-post-')
+        songs = Song.objects.filter(artist='Bench', title__startswith='Bench sample')
+        images = GalleryImage.objects.filter(caption__startswith='Bench sample')
+        with transaction.atomic():
+            # Copies share the samples' files, so they skip the delete signals.
+            for queryset in (
+                PostTag.objects.filter(post__in=posts),
+                Comment.objects.filter(post__in=posts),
+                posts,
+                Song.objects.filter(audio_file__in=list(songs.values_list('audio_file', flat=True))).exclude(pk__in=songs),
+                GalleryImage.objects.filter(image__in=list(images.values_list('image', flat=True))).exclude(pk__in=images),
+            ):
+                raw_delete(queryset)
+            # Down to the samples' own references, which their deletes drop.
+            refresh_refs()
+            for song in songs:
+                song.delete()
+            for image in images:
+                image.delete()
+            Tag.objects.filter(slug__startswith='bench-tag-').delete()
+            User.objects.filter(username__startswith='bench-user-').delete()
+        refresh_archive()
+        for model in (Post, Comment, Song, GalleryImage):
+            bump_generation(model)
+
+
+def raw_delete(queryset):
+    # _raw_delete can't take joins; resolve the rows to primary keys first.
+    pks = list(queryset.values_list('pk', flat=True))
+    for start in range(0, len(pks), 10_000):
+        batch = queryset.model.objects.filter(pk__in=pks[start:start + 10_000])
+        batch._raw_delete(batch.db)
+
+
+def sine_wav(frequency, seconds=5, rate=22050):
+    frames = b''.join(
+        struct.pack('<h', round(12000 * math.sin(2 * math.pi * frequency * i / rate))) for i in range(seconds * rate)
+    )
+    buffer = io.BytesIO()
+    with wave.open(buffer, 'wb') as file:
+        file.setnchannels(1)
+        file.setsampwidth(2)
+        file.setframerate(rate)
+        file.writeframes(frames)
+    return buffer.getvalue()
+
+
+def gradient_jpeg(index, size=(1600, 1000)):
+    from PIL import Image
+
+    image = Image.linear_gradient('L').resize(size).rotate(index * 45)
+    color = Image.merge('RGB', (image, image.transpose(Image.Transpose.FLIP_LEFT_RIGHT), image.point(lambda v: 255 - v)))
+    buffer = io.BytesIO()
+    color.save(buffer, 'JPEG', quality=85)
+    return buffer.getvalue()
@@ -0,0 +1,235 @@
+"""
+Versioned response cache for the public read API.
+
+Rendered JSON is stored under a key built from the request path, the sorted
+query string and a generation counter for every model the response depends
+on. Saving or deleting one of those models bumps its generation (see
+``kunnic/signals.py``), so stale entries are never read again and simply
+age out of the cache; nothing has to be deleted by pattern.
+
+Generations only work if every process sees the same ones: web workers and
+the job worker all write. They live in the cache when it is shared and in
+the :class:`~kunnic.models.Generation` table otherwise. A generation is the
+time of the model's last change in nanoseconds, which also gives
+``Last-Modified`` (see kunnic/conditional.py). Bodies only go to a shared
+cache, or to a local one (``LocMemCache``) when ``ENABLED`` says so, which
+is safe for a single process such as runserver.
+"""
+import hashlib
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import IntegrityError, transaction
+from django.db.models import F, Value
+from django.db.models.functions import Greatest
+from django.http import HttpResponse
+from django.utils.encoding import iri_to_uri
+
+from kunnic.models import Generation
+
+DEFAULTS = {
+    'ALIAS': 'default',
+    # None: on when ALIAS is a cache every process shares.
+    'ENABLED': None,
+    'TIMEOUT': 60 * 60,
+    'KEY_PREFIX': 'kunnic',
+    # Cache-Control max-age for anonymous responses (see kunnic/conditional.py).
+    'MAX_AGE': 0,
+}
+
+STAT_KEYS = ('hits', 'misses', 'stores')
+
+
+def get_setting(name):
+    return getattr(settings, 'KUNNIC_API_CACHE', {}).get(name, DEFAULTS[name])
+
+
+def get_cache():
+    return caches[get_setting('ALIAS')]
+
+
+def is_shared(cache):
+    """Whether other processes see what ``cache`` stores."""
+    return not isinstance(cache, (LocMemCache, DummyCache))
+
+
+def is_enabled():
+    enabled = get_setting('ENABLED')
+    return is_shared(get_cache()) if enabled is None else enabled
+
+
+def _key(*parts):
+    return ':'.join([get_setting('KEY_PREFIX'), *parts])
+
+
+def _generation_key(model):
+    return _key('gen', model._meta.label_lower)
+
+
+def get_generations(models):
+    """The generation of each of ``models``, as strings."""
+    if not is_shared(get_cache()):
+        return _get_stored_generations(models)
+    cache = get_cache()
+    keys = [_generation_key(model) for model in models]
+    generations = cache.get_many(keys)
+    for key in keys:
+        if key not in generations:
+            # A generation that was evicted restarts from the clock rather
+            # than from zero, so entries written before the eviction can't match.
+            cache.add(key, time.time_ns(), timeout=None)
+            generations[key] = cache.get(key)
+    return [str(generations[key]) for key in keys]
+
+
+def _get_stored_generations(models):
+    labels = [model._meta.label_lower for model in models]
+    generations = dict(Generation.objects.filter(label__in=labels).values_list('label', 'value'))
+    for label in labels:
+        if label not in generations:
+            generations[label] = Generation.objects.get_or_create(label=label, defaults={'value': time.time_ns()})[0].value
+    return [str(generations[label]) for label in labels]
+
+
+def bump_generation(model):
+    """Move ``model``'s generation on, once the current transaction commits."""
+    if not is_shared(get_cache()):
+        # Part of the transaction, so it commits or rolls back with the change.
+        _bump_stored_generation(model._meta.label_lower)
+        return
+    key = _generation_key(model)
+    transaction.on_commit(lambda: _bump_cached_generation(key))
+
+
+def _bump_cached_generation(key):
+    cache = get_cache()
+    # Later than both the clock and the last value, so it never repeats one.
+    cache.set(key, max(time.time_ns(), (cache.get(key) or 0) + 1), timeout=None)
+
+
+def _bump_stored_generation(label):
+    now = time.time_ns()
+    if Generation.objects.filter(label=label).update(value=Greatest(F('value') + 1, Value(now))):
+        return
+    try:
+        with transaction.atomic():
+            Generation.objects.create(label=label, value=now)
+    except IntegrityError:
+        # Created concurrently; move that one on.
+        Generation.objects.filter(label=label).update(value=Greatest(F('value') + 1, Value(now)))
+
+
+def _count(stat):
+    cache = get_cache()
+    key = _key('stats', stat)
+    try:
+        cache.incr(key)
+    except ValueError:
+        if not cache.add(key, 1, timeout=None):
+            cache.incr(key)
+
+
+def get_stats():
+    cache = get_cache()
+    values = cache.get_many([_key('stats', stat) for stat in STAT_KEYS])
+    stats = {stat: values.get(_key('stats', stat), 0) for stat in STAT_KEYS}
+    lookups = stats['hits'] + stats['misses']
+    stats['hit_ratio'] = round(stats['hits'] / lookups, 4) if lookups else None
+    return stats
+
+
+def reset_stats():
+    get_cache().delete_many([_key('stats', stat) for stat in STAT_KEYS])
+
+
+def get_response_key(request, models):
+    query = '&'.join(sorted(request.META.get('QUERY_STRING', '').split('&')))
+    # Bodies hold absolute URLs, so the origin is part of the key.
+    url = f'{request.scheme}://{request.get_host()}{iri_to_uri(request.path)}?{query}'
+    digest = hashlib.sha1(url.encode('utf-8')).hexdigest()
+    return _key('response', request.accepted_renderer.format, digest, *get_generations(models))
+
+
+def is_cacheable(request):
+    return (
+        is_enabled()
+        and request.method == 'GET'
+        and not request.user.is_authenticated
+        and request.accepted_renderer.format == 'json'
+    )
+
+
+def cache_response(method):
+    """
+    Serve a viewset handler from the cache for anonymous JSON ``GET`` requests.
+
+    The viewset lists the models its responses depend on in ``cache_models``.
+    On a miss the key is left on the request and ``CachedResponseMixin``
+    stores the body once the response has been rendered.
+    """
+    @wraps(method)
+    def wrapper(self, request, *args, **kwargs):
+        if not is_cacheable(request):
+            return method(self, request, *args, **kwargs)
+
+        key = get_response_key(request, self.cache_models)
+        response = get_cached_response(key)
+        if response is not None:
+            return response
+
+        request._kunnic_cache_key = key
+        return method(self, request, *args, **kwargs)
+    return wrapper
+
+
+def get_cached_response(key):
+    """Return the cached response for ``key``, counting the hit or miss."""
+    cached = get_cache().get(key)
+    if cached is None:
+        _count('misses')
+        return None
+    _count('hits')
+    content, content_type = cached
+    response = HttpResponse(content, content_type=content_type)
+    response['X-Cache'] = 'HIT'
+    return response
+
+
+def store_response(key, response):
+    if response.status_code == 200:
+        get_cache().set(key, (response.content, response['Content-Type']), get_setting('TIMEOUT'))
+        _count('stores')
+
+
+def _store(key):
+    def callback(response):
+        store_response(key, response)
+    return callback
+
+
+class CachedResponseMixin:
+    """
+    Cache ``list`` and ``retrieve`` for a viewset. Other handlers opt in with
+    the :func:`cache_response` decorator.
+    """
+    cache_models = ()
+
+    @cache_response
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    @cache_response
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        key = getattr(request, '_kunnic_cache_key', None)
+        if key is not None and hasattr(response, 'add_post_render_callback'):
+            response['X-Cache'] = 'MISS'
+            response.add_post_render_callback(_store(key))
+        return response
@@ -0,0 +1,94 @@
+"""
+Conditional GET support for the kunnic API.
+
+Validators come from the cache generations of the models a response
+depends on (see ``kunnic/cache.py``): the ETag hashes them with the URL and
+format, and the newest is the ``Last-Modified``. Every process sees the
+same generations and reading them costs no query over the data, so a
+matching ``If-None-Match`` or ``If-Modified-Since`` is answered with 304
+before anything is queried, serialized, cached or rendered.
+"""
+import hashlib
+from datetime import datetime, timezone
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+
+from kunnic.cache import get_generations, get_setting
+
+
+def get_validator(request, models):
+    """Return ``(etag, last_modified)`` for a response depending on ``models``."""
+    return _build_validator(request, get_generations(models))
+
+
+async def aget_validator(request, models):
+    """:func:`get_validator` for async views."""
+    return _build_validator(request, await sync_to_async(get_generations)(models))
+
+
+def _build_validator(request, generations):
+    parts = [request.path, request.META.get('QUERY_STRING', ''), request.accepted_renderer.format, *generations]
+    digest = hashlib.sha1('|'.join(parts).encode('utf-8')).hexdigest()
+    # Generations are nanosecond timestamps of the last change.
+    last_modified = datetime.fromtimestamp(max(map(int, generations)) / 1e9, timezone.utc) if generations else None
+    return 'W/' + quote_etag(digest), last_modified
+
+
+def get_not_modified(request, etag, last_modified):
+    """Return a 304/412 for the request's preconditions, or ``None``."""
+    return get_conditional_response(request, etag=etag, last_modified=_timestamp(last_modified))
+
+
+def set_validator_headers(response, etag, last_modified, authenticated):
+    response['ETag'] = etag
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(_timestamp(last_modified))
+    if authenticated:
+        patch_cache_control(response, private=True, no_cache=True)
+    else:
+        patch_cache_control(response, public=True, max_age=get_setting('MAX_AGE'), must_revalidate=True)
+    return response
+
+
+def _timestamp(last_modified):
+    return int(last_modified.timestamp()) if last_modified else None
+
+
+def conditional_response(method):
+    """
+    Answer conditional ``GET``/``HEAD`` requests for a viewset handler.
+
+    Validators come from the viewset's ``cache_models``; full responses get
+    the same ``ETag``, ``Last-Modified`` and ``Cache-Control`` headers as
+    the 304.
+    """
+    @wraps(method)
+    def wrapper(self, request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD'):
+            return method(self, request, *args, **kwargs)
+
+        etag, last_modified = get_validator(request, self.cache_models)
+        response = get_not_modified(request, etag, last_modified)
+        if response is None:
+            response = method(self, request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+        return set_validator_headers(response, etag, last_modified, request.user.is_authenticated)
+    return wrapper
+
+
+class ConditionalGetMixin:
+    """Add validators and 304 handling to ``list`` and ``retrieve``."""
+    cache_models = ()
+
+    @conditional_response
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    @conditional_response
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
@@ -0,0 +1,94 @@
+"""
+Engine profiles for ``DATABASES``.
+
+``backend/settings.py`` passes the ``dj_database_url`` config through
+:func:`apply_profile`. ``DATABASE_PROFILE`` picks the profile: ``tuned``
+(the default) applies the settings below for the configured engine, and
+``plain`` leaves Django's defaults, e.g. for comparing the two with
+``manage.py bench_database``.
+
+SQLite, tuned:
+
+* WAL journal, so readers never wait for the writer and the writer never
+  waits for readers;
+* ``synchronous=NORMAL``, safe under WAL and one fsync per checkpoint
+  instead of per commit;
+* ``mmap_size``, so reads come straight from the page cache;
+* a busy timeout, so a second writer waits for the lock instead of failing
+  with "database is locked";
+* ``BEGIN IMMEDIATE`` transactions. A deferred transaction that reads and
+  then writes can't wait for the lock: SQLite fails it at once, whatever the
+  timeout.
+
+PostgreSQL, tuned: Django's native psycopg 3 pool, with a health check when
+a connection is handed out. Pooled connections can't also be persistent, so
+``CONN_MAX_AGE`` is 0. Without ``psycopg_pool`` the profile keeps persistent
+connections with health checks instead. ``QuerySet.iterator()`` (export,
+reindexing, media processing) streams over server-side cursors unless
+``PGBOUNCER`` is set, since pgbouncer's transaction pooling can't hold them.
+"""
+import importlib.util
+
+PROFILES = ('tuned', 'plain')
+
+SQLITE_DEFAULTS = {
+    'MMAP_SIZE': 256 * 1024 * 1024,
+    # Seconds a writer waits for the lock.
+    'BUSY_TIMEOUT': 20,
+}
+
+POSTGRES_DEFAULTS = {
+    'POOL_MIN_SIZE': 2,
+    'POOL_MAX_SIZE': 10,
+    # Seconds a request waits for a free connection before failing.
+    'POOL_TIMEOUT': 10,
+    'PGBOUNCER': False,
+}
+
+
+def apply_profile(config, profile='tuned', options=None):
+    """
+    Return a copy of the ``DATABASES`` entry ``config`` with ``profile``
+    applied. ``options`` override :data:`SQLITE_DEFAULTS` or
+    :data:`POSTGRES_DEFAULTS`.
+    """
+    options = options or {}
+    if profile not in PROFILES:
+        raise ValueError(f'Unknown database profile {profile!r}; use one of {", ".join(PROFILES)}.')
+    config = {**config, 'OPTIONS': dict(config.get('OPTIONS', {}))}
+    if profile == 'plain':
+        return config
+    engine = config['ENGINE']
+    if engine == 'django.db.backends.sqlite3':
+        return tune_sqlite(config, {**SQLITE_DEFAULTS, **options})
+    if engine == 'django.db.backends.postgresql':
+        return tune_postgres(config, {**POSTGRES_DEFAULTS, **options})
+    return config
+
+
+def tune_sqlite(config, options):
+    pragmas = [
+        'PRAGMA journal_mode=WAL',
+        'PRAGMA synchronous=NORMAL',
+        f'PRAGMA mmap_size={int(options["MMAP_SIZE"])}',
+    ]
+    config['OPTIONS'].update({
+        'init_command': ';'.join(pragmas),
+        'timeout': float(options['BUSY_TIMEOUT']),
+        'transaction_mode': 'IMMEDIATE',
+    })
+    return config
+
+
+def tune_postgres(config, options):
+    config['CONN_HEALTH_CHECKS'] = True
+    config['DISABLE_SERVER_SIDE_CURSORS'] = bool(options['PGBOUNCER'])
+    if importlib.util.find_spec('psycopg_pool') is None:
+        return config
+    config['CONN_MAX_AGE'] = 0
+    config['OPTIONS']['pool'] = {
+        'min_size': int(options['POOL_MIN_SIZE']),
+        'max_size': int(options['POOL_MAX_SIZE']),
+        'timeout': float(options['POOL_TIMEOUT']),
+    }
+    return config
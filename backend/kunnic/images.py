@@ -0,0 +1,209 @@
+"""
+Responsive derivatives for gallery images.
+
+:func:`render_derivatives` resizes an upload to each of
+``KUNNIC_IMAGES['WIDTHS']`` (never upscaling) in every supported format of
+``FORMATS`` and computes a BlurHash placeholder. It works on bytes only, so
+:func:`process_images` can fan it out over a process pool; the parent
+process does all storage and database writes.
+
+Derivative names are kept on ``GalleryImage.derivatives`` as
+``{format: {width: name}}`` and exposed by the serializer as ``srcset``
+strings.
+"""
+import io
+import itertools
+import logging
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+from django.conf import settings
+from django.core.files.base import ContentFile
+from PIL import Image, ImageOps, UnidentifiedImageError, features
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'WIDTHS': [320, 640, 1280],
+    # Listed best first; formats this Pillow build can't write are skipped.
+    'FORMATS': ['avif', 'webp'],
+    'QUALITY': {'avif': 50, 'webp': 75},
+    'BLURHASH_COMPONENTS': (4, 3),
+    # None uses every core.
+    'PROCESSES': None,
+    'UPLOAD_TO': 'gallery/derivatives/',
+}
+
+# What Pillow raises for bytes it can't or won't decode. A decompression
+# bomb isn't an OSError; trying again won't help with any of them.
+UNDECODABLE = (UnidentifiedImageError, Image.DecompressionBombError, OSError, ValueError)
+
+BASE83 = '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz#$%*+,-.:;=?@[]^_{|}~'
+
+
+def get_setting(name):
+    return getattr(settings, 'KUNNIC_IMAGES', {}).get(name, DEFAULTS[name])
+
+
+def get_formats():
+    return [fmt for fmt in get_setting('FORMATS') if features.check(fmt)]
+
+
+def _base83(value, length):
+    return ''.join(BASE83[value // 83 ** (length - i - 1) % 83] for i in range(length))
+
+
+def _to_srgb(value):
+    value = min(max(value, 0.0), 1.0)
+    if value <= 0.0031308:
+        return int(value * 12.92 * 255 + 0.5)
+    return int((1.055 * value ** (1 / 2.4) - 0.055) * 255 + 0.5)
+
+
+def blurhash(image, components=(4, 3)):
+    """Encode a BlurHash (https://blurha.sh) for a small RGB image."""
+    cx, cy = components
+    pixels = np.asarray(image.convert('RGB'), dtype=np.float64) / 255
+    height, width = pixels.shape[:2]
+    linear = np.where(pixels <= 0.04045, pixels / 12.92, ((pixels + 0.055) / 1.055) ** 2.4)
+
+    basis_x = np.cos(np.pi * np.outer(np.arange(cx), np.arange(width)) / width)
+    basis_y = np.cos(np.pi * np.outer(np.arange(cy), np.arange(height)) / height)
+    # factors[j, i] = mean over pixels of basis_y[j, y] * basis_x[i, x] * linear[y, x]
+    factors = np.einsum('jy,ix,yxc->jic', basis_y, basis_x, linear) / (width * height)
+    factors[1:] *= 2
+    factors[0, 1:] *= 2
+    factors = factors.reshape(-1, 3)
+    dc, ac = factors[0], factors[1:]
+
+    result = _base83((cx - 1) + (cy - 1) * 9, 1)
+    if len(ac):
+        quantised_max = int(max(0, min(82, math.floor(np.abs(ac).max() * 166 - 0.5))))
+        max_value = (quantised_max + 1) / 166
+    else:
+        quantised_max, max_value = 0, 1
+    result += _base83(quantised_max, 1)
+    result += _base83((_to_srgb(dc[0]) << 16) + (_to_srgb(dc[1]) << 8) + _to_srgb(dc[2]), 4)
+
+    scaled = ac / max_value
+    quantised = np.clip(np.floor(np.sign(scaled) * np.sqrt(np.abs(scaled)) * 9 + 9.5), 0, 18).astype(int)
+    for r, g, b in quantised:
+        result += _base83(r * 19 * 19 + g * 19 + b, 2)
+    return result
+
+
+def render_derivatives(data, widths, formats, quality, components):
+    """
+    Return ``(width, height, placeholder, {(format, width): bytes})`` for an
+    encoded image. Runs in pool workers, so it touches neither the database
+    nor storage.
+    """
+    with Image.open(io.BytesIO(data)) as source:
+        image = ImageOps.exif_transpose(source)
+        image = image.convert('RGBA' if image.has_transparency_data else 'RGB')
+    width, height = image.size
+
+    thumbnail = image.copy()
+    thumbnail.thumbnail((32, 32))
+    placeholder = blurhash(thumbnail, components)
+
+    rendered = {}
+    for target in sorted({min(w, width) for w in widths}):
+        resized = image if target == width else image.resize(
+            (target, max(1, round(height * target / width))), Image.Resampling.LANCZOS,
+        )
+        for fmt in formats:
+            buffer = io.BytesIO()
+            resized.save(buffer, format=fmt.upper(), quality=quality.get(fmt, 75))
+            rendered[(fmt, target)] = buffer.getvalue()
+    return width, height, placeholder, rendered
+
+
+def _read(fieldfile):
+    fieldfile.open('rb')
+    try:
+        return fieldfile.read()
+    finally:
+        fieldfile.close()
+
+
+def _render_args(gallery_image):
+    return (
+        _read(gallery_image.image), get_setting('WIDTHS'), get_formats(),
+        get_setting('QUALITY'), tuple(get_setting('BLURHASH_COMPONENTS')),
+    )
+
+
+def delete_derivatives(gallery_image):
+    storage = gallery_image.image.storage
+    for names in (gallery_image.derivatives or {}).values():
+        for name in names.values():
+            storage.delete(name)
+
+
+def store_derivatives(gallery_image, result):
+    """Save rendered derivatives and the measurements on ``gallery_image``."""
+    width, height, placeholder, rendered = result
+    storage = gallery_image.image.storage
+    stem = os.path.splitext(os.path.basename(gallery_image.image.name))[0]
+
+    delete_derivatives(gallery_image)
+    derivatives = {}
+    for (fmt, target), content in rendered.items():
+        name = storage.save(f'{get_setting("UPLOAD_TO")}{stem}-{target}.{fmt}', ContentFile(content))
+        derivatives.setdefault(fmt, {})[str(target)] = name
+
+    gallery_image.width = width
+    gallery_image.height = height
+    gallery_image.placeholder = placeholder
+    gallery_image.derivatives = derivatives
+    gallery_image.save(update_fields=['width', 'height', 'placeholder', 'derivatives'])
+
+
+def process_image(gallery_image, run=None):
+    """
+    Render and store derivatives for one upload. ``run(fn, *args)`` calls
+    the renderer, e.g. on a job worker's process pool; by default it runs here.
+    Returns ``False`` if the upload can't be decoded; storage errors reading
+    it propagate.
+    """
+    args = _render_args(gallery_image)
+    try:
+        result = run(render_derivatives, *args) if run else render_derivatives(*args)
+    except UNDECODABLE as exc:
+        logger.warning('Could not render derivatives for gallery image %s: %s', gallery_image.pk, exc)
+        return False
+    store_derivatives(gallery_image, result)
+    return True
+
+
+def process_images(gallery_images, processes=None, batch_size=64):
+    """
+    Render derivatives for many images over a process pool and store each
+    as it finishes. Sources are read ``batch_size`` at a time so a backfill
+    never holds every original in memory. Returns ``(processed, failed)``.
+    """
+    processed = failed = 0
+    gallery_images = iter(gallery_images)
+    with ProcessPoolExecutor(max_workers=processes or get_setting('PROCESSES')) as pool:
+        while batch := list(itertools.islice(gallery_images, batch_size)):
+            futures = {}
+            for gallery_image in batch:
+                try:
+                    futures[pool.submit(render_derivatives, *_render_args(gallery_image))] = gallery_image
+                except OSError as exc:
+                    logger.warning('Could not read gallery image %s: %s', gallery_image.pk, exc)
+                    failed += 1
+            for future in as_completed(futures):
+                gallery_image = futures[future]
+                try:
+                    result = future.result()
+                except UNDECODABLE as exc:
+                    logger.warning('Could not render derivatives for gallery image %s: %s', gallery_image.pk, exc)
+                    failed += 1
+                    continue
+                store_derivatives(gallery_image, result)
+                processed += 1
+    return processed, failed
@@ -0,0 +1,326 @@
+"""
+Background jobs: slow work done outside the request by ``manage.py runworker``.
+
+:func:`enqueue` stores a :class:`~kunnic.models.Job` naming a task in
+``KUNNIC_JOBS['TASKS']`` with its keyword arguments. While a job is queued,
+enqueueing the same kind and arguments again returns it instead of adding
+another, so a file replaced twice before a worker gets to it is processed
+once.
+
+Workers claim due jobs with ``SELECT ... FOR UPDATE SKIP LOCKED`` where the
+database has it (PostgreSQL) and with compare-and-set updates on
+``attempts`` elsewhere (SQLite, which runs one writer at a time anyway). A
+claim is a lease: ``run_at`` moves ``LEASE`` seconds ahead and is renewed
+while the job runs, so the job of a worker that died is claimed again once
+its lease runs out.
+
+A task that raises is retried after ``BACKOFF * 2 ** (attempt - 1)``
+seconds, at most ``BACKOFF_MAX`` and jittered, until ``MAX_ATTEMPTS``;
+:class:`JobFailed` gives up at once. Finished jobs are kept ``KEEP``
+seconds for their status URL.
+
+:class:`Worker` runs jobs on a thread pool. Tasks hand CPU-bound work to
+its process pool with :func:`run_cpu`, which runs it inline without one.
+With ``EAGER`` jobs run in the process that queued them once its
+transaction commits, for development without a worker.
+"""
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import random
+import socket
+import threading
+import time
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, close_old_connections, connection, transaction
+from django.db.models import Count, F, Min
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from kunnic.metrics import job_registry
+from kunnic.models import Job
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    # Job kind: dotted path of the task.
+    'TASKS': {
+        'process_song': 'kunnic.tasks.process_song',
+        'process_gallery_image': 'kunnic.tasks.process_gallery_image',
+    },
+    'EAGER': False,
+    'THREADS': 4,
+    # Processes for run_cpu(); 0 runs CPU-bound work on the job's thread, None uses every core.
+    'PROCESSES': 0,
+    'LEASE': 300,
+    'MAX_ATTEMPTS': 5,
+    'BACKOFF': 10,
+    'BACKOFF_MAX': 60 * 60,
+    # Seconds done and failed jobs are kept after finishing.
+    'KEEP': 7 * 24 * 60 * 60,
+    'POLL_INTERVAL': 1.0,
+}
+
+# Seconds between sweeps of finished jobs older than KEEP.
+PRUNE_INTERVAL = 600
+
+_cpu_pool = None
+
+
+def get_setting(name):
+    return getattr(settings, 'KUNNIC_JOBS', {}).get(name, DEFAULTS[name])
+
+
+class JobFailed(Exception):
+    """Raised by a task whose job should fail without further attempts."""
+
+
+def job_key(kind, args):
+    payload = json.dumps(args, sort_keys=True, separators=(',', ':')).encode()
+    return f'{kind}:{hashlib.sha1(payload).hexdigest()}'
+
+
+def enqueue(kind, **args):
+    """
+    Queue task ``kind`` with keyword arguments ``args`` (JSON-able) and
+    return its job, or the identical job already queued.
+    """
+    if kind not in get_setting('TASKS'):
+        raise ValueError(f'Unknown job kind {kind!r}; add it to KUNNIC_JOBS["TASKS"].')
+    key = job_key(kind, args)
+    now = timezone.now()
+    job = Job.objects.filter(key=key, status=Job.QUEUED).first()
+    if job is not None:
+        if job.run_at > now:
+            # Waiting out a backoff; the new request makes it due again.
+            Job.objects.filter(pk=job.pk, status=Job.QUEUED).update(run_at=now)
+    else:
+        try:
+            with transaction.atomic():
+                job = Job.objects.create(kind=kind, args=args, key=key, run_at=now,
+                                         max_attempts=get_setting('MAX_ATTEMPTS'))
+        except IntegrityError:
+            # Queued concurrently; that one will do.
+            job = Job.objects.filter(key=key, status=Job.QUEUED).first()
+            if job is None:
+                return enqueue(kind, **args)
+    if get_setting('EAGER'):
+        transaction.on_commit(lambda: run_now(job))
+    return job
+
+
+def run_now(job):
+    """Claim and run ``job`` in this process if it is due, then refresh it."""
+    for claimed in claim(worker_name(), pk=job.pk):
+        run_job(claimed)
+        job.refresh_from_db()
+
+
+def worker_name():
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+def claim(worker, limit=1, pk=None):
+    """
+    Claim up to ``limit`` due jobs (only job ``pk`` if given) for
+    ``worker`` and return them, their attempt counted. Each gets ``due_at``,
+    when it became due.
+    """
+    now = timezone.now()
+    due = Job.objects.filter(status__in=(Job.QUEUED, Job.RUNNING), run_at__lte=now).order_by('run_at', 'pk')
+    if pk is not None:
+        due = due.filter(pk=pk)
+    claimed = {
+        'status': Job.RUNNING, 'worker': worker, 'attempts': F('attempts') + 1,
+        'started_at': now, 'run_at': now + timedelta(seconds=get_setting('LEASE')),
+    }
+    if connection.features.has_select_for_update_skip_locked:
+        with transaction.atomic():
+            candidates = list(due.select_for_update(skip_locked=True).values_list('pk', 'attempts', 'run_at')[:limit])
+            Job.objects.filter(pk__in=[pk for pk, attempts, run_at in candidates]).update(**claimed)
+    else:
+        # Every claim bumps attempts, so a row still at the attempts read
+        # here has not been claimed by anyone else in between.
+        candidates = [
+            (pk, attempts, run_at) for pk, attempts, run_at in due.values_list('pk', 'attempts', 'run_at')[:limit]
+            if due.filter(pk=pk, attempts=attempts).update(**claimed)
+        ]
+    due_at = {pk: run_at for pk, attempts, run_at in candidates}
+    jobs = list(Job.objects.filter(pk__in=due_at, worker=worker).order_by('run_at', 'pk'))
+    for job in jobs:
+        job.due_at = due_at[job.pk]
+    return jobs
+
+
+def backoff(attempts):
+    delay = min(get_setting('BACKOFF_MAX'), get_setting('BACKOFF') * 2 ** (attempts - 1))
+    return random.uniform(delay / 2, delay)
+
+
+def finish(job, status, **fields):
+    """
+    Record the end of ``job``'s attempt, unless its lease ran out and
+    another worker claimed it meanwhile. Returns whether it was recorded.
+    """
+    if status != Job.QUEUED:
+        fields['finished_at'] = fields['run_at'] = timezone.now()
+    current = Job.objects.filter(pk=job.pk, status=Job.RUNNING, worker=job.worker, attempts=job.attempts)
+    try:
+        with transaction.atomic():
+            recorded = current.update(status=status, **fields)
+    except IntegrityError:
+        # A retry, but the same job was queued again while this one ran.
+        status = Job.FAILED
+        fields['error'] = fields.get('error', '') + '\nNot retried: an identical job is queued.'
+        fields['finished_at'] = fields['run_at'] = timezone.now()
+        recorded = current.update(status=status, **fields)
+    if recorded:
+        job.status = status
+        for name, value in fields.items():
+            setattr(job, name, value)
+    return bool(recorded)
+
+
+def run_job(job):
+    """Run a job returned by :func:`claim` and record how it went; returns its status."""
+    started = time.perf_counter()
+    outcome = 'failed'
+    path = get_setting('TASKS').get(job.kind)
+    if path is None:
+        finish(job, Job.FAILED, error=f'Unknown job kind {job.kind!r}.')
+    elif job.attempts > job.max_attempts:
+        # Claimed again after its lease ran out on the last attempt.
+        finish(job, Job.FAILED, error=job.error or 'The worker running the last attempt stopped.')
+    else:
+        try:
+            result = import_string(path)(**job.args)
+        except JobFailed as exc:
+            finish(job, Job.FAILED, error=str(exc))
+        except Exception as exc:
+            logger.exception('Job %s (%s) failed on attempt %s.', job.pk, job.kind, job.attempts)
+            error = f'{type(exc).__name__}: {exc}'
+            if job.attempts < job.max_attempts:
+                retry_at = timezone.now() + timedelta(seconds=backoff(job.attempts))
+                if finish(job, Job.QUEUED, error=error, run_at=retry_at) and job.status == Job.QUEUED:
+                    outcome = 'retried'
+            else:
+                finish(job, Job.FAILED, error=error)
+        else:
+            finish(job, Job.DONE, result=result, error='')
+            outcome = 'completed'
+    wait_duration = max(0.0, (job.started_at - getattr(job, 'due_at', job.started_at)).total_seconds())
+    job_registry.observe(job.kind, outcome, wait_duration, time.perf_counter() - started)
+    return job.status
+
+
+def run_cpu(fn, *args):
+    """
+    ``fn(*args)`` on the worker's process pool, or on this thread without
+    one. ``fn`` and its arguments must pickle; it must not touch the
+    database or storage.
+    """
+    pool = _cpu_pool
+    if pool is None:
+        return fn(*args)
+    return pool.submit(fn, *args).result()
+
+
+def queue_depth():
+    """``(kind, status, count, oldest run_at)`` for every kind and status in the table."""
+    return list(
+        Job.objects.order_by('kind', 'status').values('kind', 'status')
+        .annotate(total=Count('pk'), oldest=Min('run_at')).values_list('kind', 'status', 'total', 'oldest')
+    )
+
+
+def prune():
+    """Delete jobs that finished more than ``KEEP`` seconds ago; returns how many."""
+    cutoff = timezone.now() - timedelta(seconds=get_setting('KEEP'))
+    deleted, _ = Job.objects.filter(status__in=(Job.DONE, Job.FAILED), finished_at__lt=cutoff).delete()
+    return deleted
+
+
+class Worker:
+    """
+    Claim and run jobs ``threads`` at a time until :meth:`stop`; tasks'
+    :func:`run_cpu` calls go to ``processes`` processes. ``burst`` stops
+    once nothing is due. Jobs already running finish before :meth:`run`
+    returns.
+    """
+
+    def __init__(self, threads=None, processes=None, burst=False):
+        self.threads = threads or get_setting('THREADS')
+        self.processes = get_setting('PROCESSES') if processes is None else processes
+        self.burst = burst
+        self.name = worker_name()
+        self.stopping = threading.Event()
+        # future: job pk
+        self.running = {}
+        # Status each attempt ended in.
+        self.finished = Counter()
+
+    def stop(self, *args):
+        self.stopping.set()
+
+    def run(self):
+        global _cpu_pool
+        poll = get_setting('POLL_INTERVAL')
+        lease = get_setting('LEASE')
+        renewed = time.monotonic()
+        pruned = 0.0
+        if self.processes != 0:
+            # The pool starts processes as job threads submit work; forked from
+            # here they could inherit a lock another thread holds, or its
+            # database connection. The fork server forks from a clean process.
+            method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+            _cpu_pool = ProcessPoolExecutor(max_workers=self.processes, mp_context=multiprocessing.get_context(method))
+        try:
+            with ThreadPoolExecutor(self.threads, thread_name_prefix='kunnic-job') as threads:
+                while not self.stopping.is_set() or self.running:
+                    jobs = []
+                    if not self.stopping.is_set() and len(self.running) < self.threads:
+                        jobs = claim(self.name, self.threads - len(self.running))
+                        for job in jobs:
+                            self.running[threads.submit(self.run_job, job)] = job.pk
+                    if self.burst and not jobs and not self.running:
+                        break
+                    if self.running:
+                        done, _ = wait(self.running, timeout=poll, return_when=FIRST_COMPLETED)
+                        for future in done:
+                            pk = self.running.pop(future)
+                            if future.exception() is not None:
+                                # Its lease runs out and another attempt picks it up.
+                                logger.error('Could not record job %s.', pk, exc_info=future.exception())
+                            else:
+                                self.finished[future.result()] += 1
+                    else:
+                        self.stopping.wait(poll)
+                    now = time.monotonic()
+                    if self.running and now - renewed >= lease / 3:
+                        renewed = now
+                        Job.objects.filter(pk__in=self.running.values(), status=Job.RUNNING, worker=self.name).update(
+                            run_at=timezone.now() + timedelta(seconds=lease),
+                        )
+                    if now - pruned >= PRUNE_INTERVAL:
+                        pruned = now
+                        prune()
+                    job_registry.flush_if_due()
+        finally:
+            if _cpu_pool is not None:
+                _cpu_pool.shutdown()
+                _cpu_pool = None
+            job_registry.flush()
+            close_old_connections()
+
+    def run_job(self, job):
+        close_old_connections()
+        try:
+            return run_job(job)
+        finally:
+            close_old_connections()
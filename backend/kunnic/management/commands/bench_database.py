@@ -0,0 +1,159 @@
+import argparse
+import datetime
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connection, transaction
+from django.utils import timezone
+
+from kunnic.db import PROFILES
+from kunnic.models import Comment, Post
+
+
+class Command(BaseCommand):
+    help = ('Concurrent read/write load on a scratch database under each DATABASE_PROFILE: several worker '
+            'processes with several threads each list posts and comments while a share of them adds comments. '
+            'Reports throughput, "database is locked" failures and latency per profile.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--profiles', default='plain,tuned')
+        parser.add_argument('--processes', type=int, default=4)
+        parser.add_argument('--threads', type=int, default=4, help='Threads per process.')
+        parser.add_argument('--duration', type=float, default=10.0, help='Seconds of load per profile.')
+        parser.add_argument('--write-ratio', type=float, default=0.2, help='Share of operations that write.')
+        parser.add_argument('--posts', type=int, default=200, help='Posts seeded into the scratch database.')
+        parser.add_argument('--database-url', default='',
+                            help='Scratch database to use instead of a temporary SQLite file; it is migrated, '
+                                 'seeded and written to.')
+        # Internal: the parent runs itself with these in each worker process.
+        parser.add_argument('--seed', action='store_true', help=argparse.SUPPRESS)
+        parser.add_argument('--worker', action='store_true', help=argparse.SUPPRESS)
+
+    def handle(self, *args, **options):
+        if options['seed']:
+            return self.seed(options['posts'])
+        if options['worker']:
+            return self.work(options)
+
+        self.stdout.write(f'{"profile":>8} {"reads/s":>9} {"writes/s":>9} {"locked":>7} {"read p50":>10} '
+                          f'{"read p99":>10} {"write p50":>10} {"write p99":>10}')
+        for profile in options['profiles'].split(','):
+            if profile not in PROFILES:
+                raise CommandError(f'Unknown profile {profile!r}; choose from {", ".join(PROFILES)}.')
+            with tempfile.TemporaryDirectory() as directory:
+                url = options['database_url'] or f'sqlite:///{os.path.join(directory, "bench.sqlite3")}'
+                env = {**os.environ, 'DATABASE_URL': url, 'DATABASE_PROFILE': profile}
+                self.manage(env, 'migrate', '--verbosity', '0')
+                self.manage(env, 'bench_database', '--seed', '--posts', str(options['posts']))
+                results = self.run_workers(env, options)
+            self.report(profile, results, options['duration'])
+
+    def manage(self, env, *args):
+        subprocess.run([sys.executable, 'manage.py', *args], cwd=settings.BASE_DIR, env=env, check=True)
+
+    def run_workers(self, env, options):
+        command = [
+            sys.executable, 'manage.py', 'bench_database', '--worker',
+            '--threads', str(options['threads']), '--duration', str(options['duration']),
+            '--write-ratio', str(options['write_ratio']),
+        ]
+        workers = [
+            subprocess.Popen(command, cwd=settings.BASE_DIR, env=env, stdout=subprocess.PIPE, text=True)
+            for _ in range(options['processes'])
+        ]
+        results = []
+        for worker in workers:
+            output, _ = worker.communicate()
+            if worker.returncode:
+                raise CommandError(f'A worker exited with {worker.returncode}.')
+            results.append(json.loads(output.strip().splitlines()[-1]))
+        return results
+
+    def report(self, profile, results, duration):
+        reads = [latency for result in results for latency in result['reads']]
+        writes = [latency for result in results for latency in result['writes']]
+        locked = sum(result['locked'] for result in results)
+        self.stdout.write(
+            f'{profile:>8} {len(reads) / duration:>9.1f} {len(writes) / duration:>9.1f} {locked:>7} '
+            f'{percentile(reads, 0.5):>8.2f}ms {percentile(reads, 0.99):>8.2f}ms '
+            f'{percentile(writes, 0.5):>8.2f}ms {percentile(writes, 0.99):>8.2f}ms'
+        )
+
+    def seed(self, posts):
+        now = timezone.now()
+        author, _ = User.objects.get_or_create(username='bench-author')
+        Post.objects.bulk_create(
+            Post(title=f'Bench post {i}', slug=f'bench-post-{i}', content='Lorem ipsum dolor sit amet ' * 40,
+                 is_published=True, published_at=now - datetime.timedelta(minutes=i), author=author)
+            for i in range(posts)
+        )
+
+    def work(self, options):
+        post_ids = list(Post.objects.values_list('pk', flat=True))
+        connection.close()
+        stop = time.monotonic() + options['duration']
+        results = {'reads': [], 'writes': [], 'locked': 0}
+        lock = threading.Lock()
+
+        def run():
+            reads, writes, locked = [], [], 0
+            try:
+                while time.monotonic() < stop:
+                    post_id = random.choice(post_ids)
+                    write = random.random() < options['write_ratio']
+                    started = time.perf_counter()
+                    try:
+                        if write:
+                            add_comment(post_id)
+                        else:
+                            read_page(post_id)
+                    except OperationalError as exc:
+                        if 'locked' not in str(exc):
+                            raise
+                        locked += 1
+                        continue
+                    (writes if write else reads).append((time.perf_counter() - started) * 1000)
+            finally:
+                connection.close()
+            with lock:
+                results['reads'] += reads
+                results['writes'] += writes
+                results['locked'] += locked
+
+        threads = [threading.Thread(target=run) for _ in range(options['threads'])]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.stdout.write(json.dumps(results))
+
+
+def read_page(post_id):
+    list(Post.objects.filter(is_published=True).select_related('author').defer('content')[:10])
+    list(Comment.objects.filter(post_id=post_id, is_approved=True).order_by('-created_at', '-id')[:20])
+
+
+def add_comment(post_id):
+    # Like the comments endpoint: read the post, then write in one transaction.
+    with transaction.atomic():
+        post = Post.objects.get(pk=post_id)
+        Comment.objects.create(post=post, author='bench', content='Nice post! ' * 5)
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    if fraction == 0.5:
+        return statistics.median(values)
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
@@ -0,0 +1,113 @@
+import datetime
+import statistics
+import time
+from urllib.parse import parse_qs, urlsplit
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from kunnic.models import GalleryImage, Post, Song
+from kunnic.pagination import KeysetPagination, KunnicPagination
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Compare page-N latency of page-number, count-free and keyset pagination on a seeded table.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--model', choices=['post', 'song', 'gallery'], default='song')
+        parser.add_argument('--rows', type=int, default=1_000_000)
+        parser.add_argument('--page-size', type=int, default=10)
+        parser.add_argument('--pages', default='1,10,100,1000,10000,50000',
+                            help='Comma-separated page numbers to measure.')
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--keep', action='store_true',
+                            help='Keep the seeded rows instead of rolling them back.')
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                queryset = self.seed(options['model'], options['rows'], options['batch_size'])
+                self.run(queryset, options)
+                if not options['keep']:
+                    raise Rollback
+        except Rollback:
+            self.stdout.write('Seeded rows rolled back.')
+
+    def seed(self, model, rows, batch_size):
+        now = timezone.now()
+        if model == 'post':
+            author, _ = User.objects.get_or_create(username='bench-author')
+
+            def build(i):
+                return Post(
+                    title=f'Bench post {i}', slug=f'bench-post-{i}', content='Lorem ipsum ' * 50,
+                    is_published=i % 10 != 0, published_at=now - datetime.timedelta(minutes=i), author=author,
+                )
+            queryset = Post.objects.filter(is_published=True)
+        elif model == 'song':
+            def build(i):
+                return Song(
+                    title=f'Bench song {i}', artist=f'Artist {i % 500}', audio_file=f'songs/bench-{i}.mp3',
+                    release_date=(now - datetime.timedelta(hours=i)).date(),
+                )
+            queryset = Song.objects.all()
+        else:
+            def build(i):
+                return GalleryImage(image=f'gallery/bench-{i}.jpg', caption=f'Bench image {i}')
+            queryset = GalleryImage.objects.all()
+
+        started = time.perf_counter()
+        for start in range(0, rows, batch_size):
+            queryset.model.objects.bulk_create(build(i) for i in range(start, min(start + batch_size, rows)))
+        elapsed = time.perf_counter() - started
+        self.stdout.write(f'Seeded {rows} {queryset.model.__name__} rows in {elapsed:.1f}s')
+        return queryset
+
+    def run(self, queryset, options):
+        factory = APIRequestFactory()
+        page_size = options['page_size']
+        keyset = KeysetPagination()
+        field_name, descending = keyset.get_ordering(queryset, None)
+        keyset.field = queryset.model._meta.get_field(field_name)
+        keyset.base_url = ''
+        prefix = '-' if descending else ''
+        ordered = queryset.order_by(prefix + field_name, prefix + 'id')
+
+        self.stdout.write(f'{"page":>8} {"page-number":>14} {"count=false":>14} {"keyset":>14}')
+        for page in [int(p) for p in options['pages'].split(',')]:
+            offset = (page - 1) * page_size
+            if offset >= options['rows']:
+                continue
+
+            cursor_params = {'page_size': page_size}
+            if offset:
+                # Build the cursor a client would have after walking to page N.
+                link = keyset.encode_cursor(ordered[offset - 1], reverse=False)
+                cursor_params['cursor'] = parse_qs(urlsplit(link).query)['cursor'][0]
+
+            timings = [
+                self.measure(queryset, factory, {'page': page, 'page_size': page_size}, options['repeat']),
+                self.measure(queryset, factory, {'page': page, 'page_size': page_size, 'count': 'false'},
+                             options['repeat']),
+                self.measure(queryset, factory, cursor_params, options['repeat']),
+            ]
+            self.stdout.write(f'{page:>8} ' + ' '.join(f'{t * 1000:>12.2f}ms' for t in timings))
+
+    def measure(self, queryset, factory, params, repeat):
+        samples = []
+        for _ in range(repeat):
+            request = Request(factory.get('/', params, HTTP_HOST='localhost'))
+            paginator = KunnicPagination()
+            started = time.perf_counter()
+            paginator.paginate_queryset(queryset, request)
+            samples.append(time.perf_counter() - started)
+        return statistics.median(samples)
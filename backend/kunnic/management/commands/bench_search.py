@@ -0,0 +1,131 @@
+import datetime
+import itertools
+import random
+import statistics
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from kunnic.management.commands.rebuild_search_index import index_queryset
+from kunnic.models import Comment, Post, Song
+from kunnic.search import get_backend, parse_terms
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Compare icontains scans with the full-text index on a seeded corpus of posts, songs and comments.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--posts', type=int, default=20_000)
+        parser.add_argument('--songs', type=int, default=5_000)
+        parser.add_argument('--comments', type=int, default=100_000)
+        parser.add_argument('--vocabulary', type=int, default=20_000)
+        parser.add_argument('--queries', default='',
+                            help='Comma-separated queries; defaults to common, mid and rare seeded words.')
+        parser.add_argument('--page-size', type=int, default=10)
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        backend = get_backend()
+        if backend is None:
+            self.stderr.write('This database has no search backend.')
+            return
+        try:
+            with transaction.atomic():
+                words = self.seed(backend, options)
+                queries = options['queries'].split(',') if options['queries'] else [
+                    words[0], words[len(words) // 100], words[len(words) // 2], f'{words[1]} {words[50]}',
+                ]
+                self.run(backend, queries, options)
+                raise Rollback
+        except Rollback:
+            self.stdout.write('Seeded rows rolled back.')
+
+    def seed(self, backend, options):
+        rng = random.Random(0)
+        words = [''.join(rng.choices('abcdefghijklmnopqrstuvwxyz', k=rng.randint(3, 9)))
+                 for _ in range(options['vocabulary'])]
+        # Zipf-like frequencies, so queries range from very common to rare words.
+        cum_weights = list(itertools.accumulate(1 / (rank + 1) for rank in range(len(words))))
+
+        def text(count):
+            return ' '.join(rng.choices(words, cum_weights=cum_weights, k=count))
+
+        started = time.perf_counter()
+        now = timezone.now()
+        batch_size = options['batch_size']
+        author, _ = User.objects.get_or_create(username='bench-author')
+        for start in range(0, options['posts'], batch_size):
+            Post.objects.bulk_create(
+                Post(title=text(6), slug=f'bench-search-{i}', content=f'<p>{text(300)}</p>', is_published=True,
+                     published_at=now - datetime.timedelta(minutes=i), author=author)
+                for i in range(start, min(start + batch_size, options['posts']))
+            )
+        for start in range(0, options['songs'], batch_size):
+            Song.objects.bulk_create(
+                Song(title=text(3), artist=text(2), lyrics=text(150), audio_file=f'songs/bench-{i}.mp3',
+                     release_date=now.date())
+                for i in range(start, min(start + batch_size, options['songs']))
+            )
+        post_ids = list(Post.objects.filter(slug__startswith='bench-search-').values_list('pk', flat=True))
+        for start in range(0, options['comments'], batch_size):
+            Comment.objects.bulk_create(
+                Comment(post_id=rng.choice(post_ids), author=text(1), content=text(30))
+                for _ in range(start, min(start + batch_size, options['comments']))
+            )
+        self.stdout.write(f'Seeded corpus in {time.perf_counter() - started:.1f}s')
+
+        started = time.perf_counter()
+        for queryset in (Post.objects.filter(is_published=True), Song.objects.all(),
+                         Comment.objects.select_related('post')):
+            index_queryset(backend, queryset, batch_size)
+        self.stdout.write(f'Indexed corpus in {time.perf_counter() - started:.1f}s')
+        return words
+
+    def run(self, backend, queries, options):
+        page_size = options['page_size']
+        self.stdout.write(f'{"query":>24} {"matches":>9} {"icontains":>12} {"index":>12}')
+        for query in queries:
+            terms = parse_terms(query)
+            matches = []
+
+            def scan():
+                # What the admin's search_fields do: one icontains per field, per word.
+                total, page = 0, []
+                for queryset, fields in (
+                    (Post.objects.filter(is_published=True), ['title', 'content']),
+                    (Song.objects.all(), ['title', 'artist', 'lyrics']),
+                    (Comment.objects.filter(post__is_published=True), ['author', 'content']),
+                ):
+                    for term in terms:
+                        condition = Q()
+                        for field in fields:
+                            condition |= Q(**{f'{field}__icontains': term})
+                        queryset = queryset.filter(condition)
+                    total += queryset.count()
+                    page += list(queryset[:page_size])
+                return total
+
+            def indexed():
+                results = backend.search(terms)
+                matches.append(results.count())
+                results[0:page_size]
+
+            timings = [self.measure(scan, options['repeat']), self.measure(indexed, options['repeat'])]
+            self.stdout.write(f'{query[:24]:>24} {matches[0]:>9} ' + ' '.join(f'{t * 1000:>10.2f}ms' for t in timings))
+
+    def measure(self, func, repeat):
+        samples = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            func()
+            samples.append(time.perf_counter() - started)
+        return statistics.median(samples)
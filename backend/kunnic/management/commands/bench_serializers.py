@@ -0,0 +1,115 @@
+import datetime
+import statistics
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models.functions import Length, Substr
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from kunnic.models import GalleryImage, Post, Song
+from kunnic.renderers import FastJSONRenderer, orjson
+from kunnic.serializers import (
+    GalleryImageSerializer, GalleryImageValuesSerializer, PostListSerializer, SongSerializer, SongValuesSerializer,
+)
+from kunnic.views import PostViewSet
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = ('Measure serialization and rendering throughput of list pages: ModelSerializer + JSONRenderer '
+            'against the values-mode serializers + FastJSONRenderer.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--models', default='song,gallery,post', help='Comma-separated: song, gallery, post.')
+        parser.add_argument('--sizes', default='10,100,1000', help='Comma-separated page sizes.')
+        parser.add_argument('--repeat', type=int, default=20)
+
+    def handle(self, *args, **options):
+        if orjson is None:
+            self.stderr.write('orjson is not installed; FastJSONRenderer falls back to the stdlib.')
+        sizes = [int(size) for size in options['sizes'].split(',')]
+        try:
+            with transaction.atomic():
+                self.seed(max(sizes))
+                self.run(options['models'].split(','), sizes, options['repeat'])
+                raise Rollback
+        except Rollback:
+            self.stdout.write('Seeded rows rolled back.')
+
+    def seed(self, rows):
+        now = timezone.now()
+        author, _ = User.objects.get_or_create(username='bench-author')
+        Post.objects.bulk_create(
+            Post(title=f'Bench post {i}', slug=f'bench-post-{i}', content='<p>Lorem ipsum dolor sit amet</p> ' * 40,
+                 is_published=True, published_at=now - datetime.timedelta(minutes=i), author=author)
+            for i in range(rows)
+        )
+        Song.objects.bulk_create(
+            Song(title=f'Bench song {i}', artist=f'Artist {i % 50}', audio_file=f'songs/bench-{i}.mp3',
+                 release_date=(now - datetime.timedelta(hours=i)).date(), duration=180.5 + i, sample_rate=44100,
+                 channels=2, bitrate=192000, lyrics='La la la\n' * 20)
+            for i in range(rows)
+        )
+        derivatives = {fmt: {str(width): f'gallery/derived/bench-{width}.{fmt}' for width in (320, 640, 1280)}
+                       for fmt in ('avif', 'webp')}
+        GalleryImage.objects.bulk_create(
+            GalleryImage(image=f'gallery/bench-{i}.jpg', caption=f'Bench image {i}', width=1920, height=1080,
+                         placeholder='LEHV6nWB2yk8pyo0adR*.7kCMdnj', derivatives=derivatives)
+            for i in range(rows)
+        )
+
+    def run(self, models, sizes, repeat):
+        request = Request(APIRequestFactory().get('/api/', HTTP_HOST='localhost'))
+        context = {'request': request, 'format': None}
+        cases = {
+            'song': (Song.objects.order_by('-release_date'), SongSerializer, SongValuesSerializer),
+            'gallery': (GalleryImage.objects.order_by('-upload_date'), GalleryImageSerializer,
+                        GalleryImageValuesSerializer),
+            # No values mode for posts; only the renderer changes.
+            'post': (
+                Post.objects.filter(is_published=True).select_related('author').prefetch_related('tags').order_by('-published_at')
+                .defer('content').annotate(content_head=Substr('content', 1, PostViewSet.excerpt_source_length),
+                                           content_length=Length('content')),
+                PostListSerializer, None,
+            ),
+        }
+        stock, fast = JSONRenderer(), FastJSONRenderer()
+
+        self.stdout.write(f'{"model":<8} {"rows":>5} {"serializer":>11} {"values":>11} {"json":>11} '
+                          f'{"orjson":>11} {"before rows/s":>14} {"after rows/s":>13}')
+        for name in models:
+            queryset, serializer_class, values_class = cases[name]
+            for size in sizes:
+                objects = list(queryset[:size])
+                data = serializer_class(objects, many=True, context=context).data
+                serialize = self.measure(lambda: serializer_class(objects, many=True, context=context).data, repeat)
+                render = self.measure(lambda: stock.render(data), repeat)
+                fast_render = self.measure(lambda: fast.render(data), repeat)
+                if values_class is not None:
+                    rows = list(queryset.values_list(*values_class.get_columns(), named=True)[:size])
+                    values = self.measure(lambda: values_class(rows, many=True, context=context).data, repeat)
+                    assert fast.render(values_class(rows, many=True, context=context).data) == stock.render(data)
+                else:
+                    values = serialize
+                before, after = serialize + render, values + fast_render
+                self.stdout.write(
+                    f'{name:<8} {len(objects):>5} {serialize * 1000:>9.2f}ms '
+                    f'{values * 1000 if values_class else float("nan"):>9.2f}ms {render * 1000:>9.2f}ms '
+                    f'{fast_render * 1000:>9.2f}ms {len(objects) / before:>14,.0f} {len(objects) / after:>13,.0f}'
+                )
+
+    def measure(self, func, repeat):
+        samples = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            func()
+            samples.append(time.perf_counter() - started)
+        return statistics.median(samples)
@@ -0,0 +1,52 @@
+import asyncio
+import os
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from kunnic.bench.driver import Request, percentile, run_load, start_server, stop_server
+from kunnic.management.commands.run_bench import MODES
+
+
+class Command(BaseCommand):
+    help = ('Load-test the read API under gunicorn with sync WSGI workers and with uvicorn ASGI workers '
+            '(async reads on) at the same worker count; reports requests per second and latency.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--modes', default='wsgi,asgi')
+        parser.add_argument('--workers', type=int, default=2)
+        parser.add_argument('--concurrency', type=int, default=32)
+        parser.add_argument('--duration', type=float, default=10.0, help='Seconds of load per mode.')
+        parser.add_argument('--paths', default='/api/home/,/api/posts/,/api/songs/,/api/gallery/')
+        parser.add_argument('--port', type=int, default=8765)
+
+    def handle(self, *args, **options):
+        paths = options['paths'].split(',')
+        self.stdout.write(f'{"mode":>6} {"requests":>9} {"errors":>7} {"req/s":>9} {"p50":>10} {"p99":>10}')
+        for mode in options['modes'].split(','):
+            if mode not in MODES:
+                raise CommandError(f'Unknown mode {mode!r}; choose from {", ".join(MODES)}.')
+            server = self.start(mode, options['workers'], options['port'])
+            try:
+                result = asyncio.run(run_load(
+                    options['port'], lambda i: Request('GET', paths[i % len(paths)]),
+                    options['concurrency'], options['duration'],
+                ))
+            finally:
+                stop_server(server)
+            latencies = sorted(result.latencies)
+            self.stdout.write(
+                f'{mode:>6} {len(latencies):>9} {result.errors:>7} {len(latencies) / result.elapsed:>9.1f} '
+                f'{percentile(latencies, 0.5) * 1000:>8.2f}ms {percentile(latencies, 0.99) * 1000:>8.2f}ms'
+            )
+
+    def start(self, mode, workers, port):
+        app, env = MODES[mode]
+        command = [sys.executable, '-m', 'gunicorn', *app, '-w', str(workers), '-b', f'127.0.0.1:{port}',
+                   '--log-level', 'warning']
+        try:
+            return start_server(command, port, settings.BASE_DIR, {**os.environ, **env, 'KUNNIC_THROTTLE_OFF': '1'},
+                                name=f'{mode} server')
+        except RuntimeError as exc:
+            raise CommandError(str(exc))
@@ -0,0 +1,87 @@
+import os
+import random
+import statistics
+import tempfile
+import threading
+import time
+import tracemalloc
+
+from django.core.files.base import ContentFile
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client, override_settings
+from django.utils import timezone
+
+from kunnic.models import Song
+
+
+class Command(BaseCommand):
+    help = ('Measure time to first byte and Python memory for concurrent seeks into a song, '
+            'through /api/songs/<id>/stream/ and by downloading from the start.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size-mb', type=int, default=50)
+        parser.add_argument('--concurrency', type=int, default=8)
+        parser.add_argument('--seeks', type=int, default=64, help='Total seeks, spread over the threads.')
+        parser.add_argument('--chunk', type=int, default=64 * 1024,
+                            help='Bytes each client reads from the seek position.')
+
+    def handle(self, *args, **options):
+        with tempfile.TemporaryDirectory() as media_root, override_settings(MEDIA_ROOT=media_root):
+            size = options['size_mb'] * 1024 * 1024
+            song = Song(title='Bench song', artist='Bench', release_date=timezone.now().date())
+            song.audio_file.save('bench.mp3', ContentFile(os.urandom(size)))
+            try:
+                self.stdout.write(f'{"mode":>10} {"ttfb p50":>12} {"ttfb p95":>12} {"peak mem":>12}')
+                for mode in ('range', 'full'):
+                    ttfb, peak = self.run(song, size, mode, options)
+                    self.stdout.write(
+                        f'{mode:>10} {statistics.median(ttfb) * 1000:>10.2f}ms '
+                        f'{self.percentile(ttfb, 95) * 1000:>10.2f}ms {peak / 1024 / 1024:>10.2f}MB'
+                    )
+            finally:
+                song.delete()
+
+    def run(self, song, size, mode, options):
+        url = f'/api/songs/{song.pk}/stream/'
+        offsets = [random.randrange(size - options['chunk']) for _ in range(options['seeks'])]
+        lock = threading.Lock()
+        ttfb = []
+
+        def worker(batch):
+            client = Client(HTTP_HOST='localhost')
+            for offset in batch:
+                started = time.perf_counter()
+                if mode == 'range':
+                    response = client.get(url, HTTP_RANGE=f'bytes={offset}-{offset + options["chunk"] - 1}')
+                    next(iter(response.streaming_content))
+                else:
+                    # Without Range support the player has to read up to the seek position.
+                    response = client.get(url)
+                    read = 0
+                    for chunk in response.streaming_content:
+                        read += len(chunk)
+                        if read > offset:
+                            break
+                elapsed = time.perf_counter() - started
+                response.close()
+                with lock:
+                    ttfb.append(elapsed)
+            connection.close()
+
+        # Warm up URL resolution and the first database connection outside the measurement.
+        Client(HTTP_HOST='localhost').get(url, HTTP_RANGE='bytes=0-0').close()
+        batches = [offsets[i::options['concurrency']] for i in range(options['concurrency'])]
+        threads = [threading.Thread(target=worker, args=(batch,)) for batch in batches]
+        tracemalloc.start()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        return ttfb, peak
+
+    def percentile(self, samples, percent):
+        ordered = sorted(samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * percent / 100))]
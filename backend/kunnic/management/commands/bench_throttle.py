@@ -0,0 +1,78 @@
+import os
+import statistics
+import tempfile
+import time
+
+from django.contrib.auth.models import AnonymousUser
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from kunnic.throttling import BucketThrottle, FileStore, MemoryStore, RedisStore, get_store
+from kunnic.views import PostViewSet
+
+
+class Command(BaseCommand):
+    help = ('Measure what the rate limiter adds per request: the throttle check alone on each store, '
+            'and a full DRF read with and without it.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=100_000)
+        parser.add_argument('--requests', type=int, default=2000)
+        parser.add_argument('--redis', default='', help='redis:// URL to include RedisStore.')
+
+    def handle(self, *args, **options):
+        iterations = options['iterations']
+        factory = APIRequestFactory()
+        request = Request(factory.get('/api/posts/'))
+        request.user = AnonymousUser()
+        view = PostViewSet(action='list', request=request)
+        # A rate no run can exhaust, so every check takes the allowed path.
+        rate = (10 ** 12, 10 ** 12)
+
+        stores = {'memory': MemoryStore()}
+        directory = tempfile.mkdtemp()
+        stores['file'] = FileStore(os.path.join(directory, 'throttle.sqlite3'))
+        if options['redis']:
+            stores['redis'] = RedisStore(options['redis'])
+
+        throttle = BucketThrottle()
+        scope, key = throttle.get_scope(request, view), throttle.get_key(request)
+        self.stdout.write(f'{"store":>8} {"per check":>12}')
+        for name, store in stores.items():
+            count = iterations if name == 'memory' else iterations // 20
+            started = time.perf_counter()
+            for _ in range(count):
+                store.consume(f'bench:{scope}:{key}', *rate)
+            self.stdout.write(f'{name:>8} {(time.perf_counter() - started) / count * 1e6:>10.2f}µs')
+
+        # The whole check as DRF runs it, on the configured store.
+        started = time.perf_counter()
+        for _ in range(iterations):
+            throttle.allow_request(request, view)
+        self.stdout.write(f'BucketThrottle.allow_request ({type(get_store()).__name__}): '
+                          f'{(time.perf_counter() - started) / iterations * 1e6:.2f}µs')
+
+        list_view = PostViewSet.as_view({'get': 'list'})
+        unthrottled_view = PostViewSet.as_view({'get': 'list'}, throttle_classes=[])
+        # Same store, but a read rate the run can't exhaust, so both sides serve cached 200s.
+        with override_settings(KUNNIC_THROTTLE={'RATES': {'read': f'{10 ** 9}/s'}}):
+            results = {}
+            for label, target in (('with', list_view), ('without', unthrottled_view)) * 2:
+                samples, errors = [], 0
+                for _ in range(options['requests']):
+                    started = time.perf_counter()
+                    response = target(factory.get('/api/posts/', HTTP_HOST='localhost'))
+                    if hasattr(response, 'render'):
+                        # Cache misses come back unrendered; hits are plain HttpResponses.
+                        response.render()
+                    samples.append(time.perf_counter() - started)
+                    errors += response.status_code != 200
+                # The first pass of each warms up; the second is reported.
+                results[label] = statistics.median(samples), errors
+            medians = {}
+            for label, (median, errors) in results.items():
+                medians[label] = median
+                self.stdout.write(f'GET /api/posts/ {label} throttle: median {median * 1e6:.1f}µs, {errors} errors')
+            self.stdout.write(f'Throttle overhead: {(medians["with"] - medians["without"]) * 1e6:.1f}µs per request')
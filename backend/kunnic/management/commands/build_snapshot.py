@@ -0,0 +1,29 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from kunnic.snapshot import SnapshotBuilder
+
+
+class Command(BaseCommand):
+    help = ('Render the public list pages and detail endpoints of the API to content-hashed, precompressed '
+            'JSON under STATIC_ROOT for WhiteNoise, with a manifest mapping API paths to files. Only objects '
+            'changed since the last build are re-rendered unless --full is given.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help='Re-render everything.')
+        parser.add_argument('--base-url', default=None,
+                            help='Scheme and host for absolute URLs in the files (default: KUNNIC_SNAPSHOT["BASE_URL"]).')
+        parser.add_argument('--root', default=None, help='Output directory (default: KUNNIC_SNAPSHOT["ROOT"]).')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        builder = SnapshotBuilder(root=options['root'], base_url=options['base_url'])
+        manifest = builder.build(full=options['full'])
+        stats = builder.stats
+        self.stdout.write(
+            f'{len(manifest["routes"])} routes in {builder.root}: {stats["rendered"]} files rendered, '
+            f'{stats["unchanged"]} unchanged, {stats["removed"]} removed '
+            f'({time.perf_counter() - started:.1f}s).'
+        )
+        self.stdout.write('Reload the web workers so WhiteNoise serves the new files.')
@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+
+from kunnic.uploads import clear_expired
+
+
+class Command(BaseCommand):
+    help = 'Delete resumable uploads that expired before being committed, with their staged chunks. Run it daily.'
+
+    def handle(self, *args, **options):
+        self.stdout.write(f'Deleted {clear_expired()} expired uploads.')
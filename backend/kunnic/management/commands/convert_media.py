@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from kunnic.cache import bump_generation
+from kunnic.mediafiles import convert_media
+from kunnic.models import GalleryImage, Song
+
+
+class Command(BaseCommand):
+    help = ('Move song audio, peaks and gallery images saved before content-addressed storage to their hashed '
+            'names, in place, and count their references. Safe to run again; stop uploads while it runs.')
+
+    def handle(self, *args, **options):
+        converted, missing = convert_media()
+        if converted:
+            bump_generation(Song)
+            bump_generation(GalleryImage)
+        self.stdout.write(f'Converted {len(converted)} files.')
+        for name in missing:
+            self.stderr.write(f'Missing from storage: {name}')
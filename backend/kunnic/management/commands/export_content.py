@@ -0,0 +1,36 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from kunnic.transfer import SPECS, export_records, open_archive
+
+
+class Command(BaseCommand):
+    help = ('Stream posts, songs, gallery images and comments to a JSONL archive (gzipped for .gz, '
+            'stdout for -) for import_content.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('output', help='Archive path, or - for stdout.')
+        parser.add_argument('--models', default=','.join(SPECS),
+                            help='Comma-separated labels to export; posts must come before comments.')
+        parser.add_argument('--chunk-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        labels = options['models'].split(',')
+        unknown = set(labels) - SPECS.keys()
+        if unknown:
+            raise CommandError(f'Unknown models: {", ".join(sorted(unknown))}; choose from {", ".join(SPECS)}.')
+
+        counts = dict.fromkeys(labels, 0)
+        started = time.perf_counter()
+        with open_archive(options['output'], 'w') as archive:
+            for label, line in export_records(labels, options['chunk_size']):
+                archive.write(line)
+                archive.write('\n')
+                counts[label] += 1
+        elapsed = time.perf_counter() - started
+        total = sum(counts.values())
+        # Reports go to stderr so the archive can go to stdout.
+        for label, count in counts.items():
+            self.stderr.write(f'Exported {count} {label} rows.')
+        self.stderr.write(f'{total} rows in {elapsed:.1f}s ({total / max(elapsed, 1e-9):.0f} rows/s).')
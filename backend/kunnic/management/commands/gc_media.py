@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from kunnic.mediafiles import GRACE, collect_garbage, refresh_refs
+
+
+class Command(BaseCommand):
+    help = ('Recount references to content-addressed media from the rows and delete files nothing uses, '
+            'e.g. after bulk deletes. Run it off-peak: uploads while it counts may be undercounted.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--grace', type=int, default=GRACE,
+                            help='Seconds an uncounted file is kept, as its save may not have committed yet.')
+
+    def handle(self, *args, **options):
+        missing = refresh_refs()
+        files, size = collect_garbage(options['grace'])
+        self.stdout.write(f'Deleted {files} unused files ({size / 1024 / 1024:.1f} MB).')
+        for name in missing:
+            self.stderr.write(f'Missing from storage: {name}')
@@ -0,0 +1,54 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from kunnic.mediafiles import refresh_refs
+from kunnic.transfer import Importer, open_archive
+
+
+class Command(BaseCommand):
+    help = ('Load a JSONL archive from export_content with batched inserts. With --checkpoint, progress is '
+            'saved after every batch and an interrupted import resumes where it stopped.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('input', help='Archive path, or - for stdin.')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--checkpoint', default=None,
+                            help='Checkpoint file (default: <input>.checkpoint; none when reading stdin).')
+        parser.add_argument('--no-checkpoint', action='store_true')
+        parser.add_argument('--no-index', action='store_true',
+                            help='Skip the search index; run rebuild_search_index afterwards.')
+
+    def handle(self, *args, **options):
+        checkpoint = None
+        if not options['no_checkpoint']:
+            checkpoint = options['checkpoint'] or (
+                f'{options["input"]}.checkpoint' if options['input'] != '-' else None
+            )
+        importer = Importer(options['batch_size'], checkpoint=checkpoint, index=not options['no_index'])
+        skip = 0
+        if checkpoint and os.path.exists(checkpoint):
+            skip = importer.load_checkpoint()
+            self.stdout.write(f'Resuming after line {skip} from {checkpoint}.')
+
+        try:
+            with open_archive(options['input'], 'r') as archive:
+                importer.run(archive, skip=skip)
+        except ValueError as exc:
+            raise CommandError(f'{exc}; lines up to {importer.line} were imported.') from exc
+
+        # Imported rows share stored files without counting them.
+        refresh_refs()
+
+        total_rows = total_seconds = 0
+        for label, (rows, skipped, seconds) in importer.stats.items():
+            if rows or skipped:
+                self.stdout.write(f'{label}: {rows} rows in {seconds:.1f}s '
+                                  f'({rows / max(seconds, 1e-9):.0f} rows/s), {skipped} skipped.')
+                total_rows += rows
+                total_seconds += seconds
+        if importer.renamed:
+            self.stdout.write(f'{len(importer.renamed)} post slugs were taken and got a suffix.')
+        self.stdout.write(f'Imported {total_rows} rows ({total_rows / max(total_seconds, 1e-9):.0f} rows/s). '
+                          'Songs and images keep their archived metadata; run process_songs and '
+                          'process_gallery for any without it.')
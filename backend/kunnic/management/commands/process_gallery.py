@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from kunnic.images import process_images
+from kunnic.models import GalleryImage
+
+
+class Command(BaseCommand):
+    help = 'Render responsive derivatives and placeholders for gallery images that have none yet.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help='Reprocess every image, not only missing ones.')
+        parser.add_argument('--processes', type=int, default=None,
+                            help='Worker processes (default: KUNNIC_IMAGES["PROCESSES"], then every core).')
+        parser.add_argument('--batch-size', type=int, default=64)
+
+    def handle(self, *args, **options):
+        images = GalleryImage.objects.exclude(image='')
+        if not options['all']:
+            images = images.filter(placeholder='')
+        processed, failed = process_images(
+            images.iterator(), processes=options['processes'], batch_size=options['batch_size'],
+        )
+        self.stdout.write(f'Processed {processed} images, {failed} could not be rendered.')
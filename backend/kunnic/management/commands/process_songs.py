@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from kunnic.audio import process_song
+from kunnic.models import Song
+
+
+class Command(BaseCommand):
+    help = 'Extract audio metadata and waveform peaks for songs that have none yet.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help='Reprocess every song, not only missing ones.')
+
+    def handle(self, *args, **options):
+        songs = Song.objects.exclude(audio_file='')
+        if not options['all']:
+            songs = songs.filter(peaks_file='')
+        processed = failed = 0
+        for song in songs.iterator():
+            if process_song(song):
+                processed += 1
+            else:
+                failed += 1
+        self.stdout.write(f'Processed {processed} songs, {failed} could not be decoded.')
@@ -0,0 +1,106 @@
+import json
+import os
+import re
+import subprocess
+import sys
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# Run in a fresh interpreter: every import is a cold one, as in a new worker.
+SCRIPT = """
+import json, os, time
+started = time.perf_counter()
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
+import django
+django.setup()
+setup = time.perf_counter()
+from backend.wsgi import application
+app = time.perf_counter()
+from kunnic.warmup import warmup
+steps = warmup() if {warm!r} else {{}}
+print(json.dumps({{'setup': setup - started, 'application': app - setup,
+                  'warmup': time.perf_counter() - app, 'steps': steps}}))
+"""
+
+IMPORT_LINE = re.compile(r'^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)$')
+
+
+class Command(BaseCommand):
+    help = ('Profile worker cold start in a fresh interpreter with -X importtime: phase timings, the slowest '
+            'modules and time per top-level package. --save writes a baseline; --baseline compares with one '
+            'and fails on regressions.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top', type=int, default=20, help='Modules to list, slowest self time first.')
+        parser.add_argument('--repeat', type=int, default=3,
+                            help='Runs to take the fastest time per module from; import times are noisy.')
+        parser.add_argument('--no-warmup', action='store_true', help='Stop after loading the WSGI application.')
+        parser.add_argument('--save', metavar='PATH', help='Write the per-package times here as JSON.')
+        parser.add_argument('--baseline', metavar='PATH', help='Compare with a file written by --save.')
+        parser.add_argument('--tolerance', type=float, default=0.2,
+                            help='Allowed growth per package over the baseline, as a fraction.')
+        parser.add_argument('--min-regression', type=float, default=5.0,
+                            help='Ignore package regressions smaller than this many milliseconds.')
+
+    def handle(self, *args, **options):
+        runs = [self.run(not options['no_warmup']) for _ in range(max(1, options['repeat']))]
+        modules = {}
+        for _, imports in runs:
+            for name, (own, cumulative) in imports.items():
+                best = modules.get(name)
+                if best is None or own < best[0]:
+                    modules[name] = (own, cumulative)
+        phases = {name: min(run[0][name] for run in runs) for name in ('setup', 'application', 'warmup')}
+        packages = defaultdict(float)
+        for name, (own, _) in modules.items():
+            packages[name.split('.')[0]] += own
+
+        self.stdout.write('Phases: ' + ', '.join(f'{name} {seconds * 1000:.0f}ms' for name, seconds in phases.items()))
+        steps = runs[0][0]['steps']
+        if steps:
+            self.stdout.write('Warmup: ' + ', '.join(f'{name} {seconds * 1000:.0f}ms' for name, seconds in steps.items()))
+        self.stdout.write(f'{len(modules)} modules imported in {sum(packages.values()):.0f}ms (self time, fastest run)')
+
+        self.stdout.write(f'\n{"self":>9} {"cumulative":>11}  module')
+        for name, (own, cumulative) in sorted(modules.items(), key=lambda item: -item[1][0])[:options['top']]:
+            self.stdout.write(f'{own:>7.1f}ms {cumulative:>9.1f}ms  {name}')
+
+        self.stdout.write(f'\n{"self":>9}  package')
+        for name, own in sorted(packages.items(), key=lambda item: -item[1])[:options['top']]:
+            self.stdout.write(f'{own:>7.1f}ms  {name}')
+
+        report = {'phases': phases, 'packages': dict(packages)}
+        if options['save']:
+            with open(options['save'], 'w', encoding='utf-8') as file:
+                json.dump(report, file, indent=1, sort_keys=True)
+        if options['baseline']:
+            self.compare(report, options)
+
+    def run(self, warm):
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', SCRIPT.format(warm=warm)],
+            cwd=settings.BASE_DIR, env=os.environ.copy(), capture_output=True, text=True,
+        )
+        if result.returncode:
+            raise CommandError(f'Startup failed:\n{result.stderr[-2000:]}')
+        imports = {}
+        for line in result.stderr.splitlines():
+            match = IMPORT_LINE.match(line)
+            if match:
+                own, cumulative, _, name = match.groups()
+                imports[name] = (int(own) / 1000, int(cumulative) / 1000)
+        return json.loads(result.stdout.strip().splitlines()[-1]), imports
+
+    def compare(self, report, options):
+        with open(options['baseline'], encoding='utf-8') as file:
+            baseline = json.load(file)
+        regressions = []
+        for name, own in report['packages'].items():
+            before = baseline['packages'].get(name, 0.0)
+            if own - before >= options['min_regression'] and own > before * (1 + options['tolerance']):
+                regressions.append(f'{name}: {before:.1f}ms -> {own:.1f}ms')
+        if regressions:
+            raise CommandError('Startup regressions over the baseline:\n  ' + '\n  '.join(regressions))
+        self.stdout.write('\nNo package grew past the baseline tolerance.')
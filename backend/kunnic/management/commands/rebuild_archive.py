@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from kunnic.archive import refresh_archive
+from kunnic.models import ArchiveMonth, Tag
+
+
+class Command(BaseCommand):
+    help = 'Recount the monthly post archive and tag counts from scratch, e.g. after bulk changes to posts.'
+
+    def handle(self, *args, **options):
+        refresh_archive()
+        self.stdout.write(f'Counted {ArchiveMonth.objects.count()} months and {Tag.objects.count()} tags.')
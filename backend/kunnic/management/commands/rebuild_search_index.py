@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from kunnic.models import Comment, Post, Song
+from kunnic.search import get_backend
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the full-text search index from published posts, songs and approved comments.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        backend = get_backend()
+        if backend is None:
+            self.stderr.write('This database has no search backend; see KUNNIC_SEARCH["BACKENDS"].')
+            return
+
+        querysets = [
+            Post.objects.filter(is_published=True),
+            Song.objects.all(),
+            Comment.objects.filter(is_approved=True, post__is_published=True).select_related('post'),
+        ]
+        with transaction.atomic():
+            backend.clear()
+            for queryset in querysets:
+                indexed = index_queryset(backend, queryset, options['batch_size'])
+                self.stdout.write(f'Indexed {indexed} {queryset.model._meta.verbose_name_plural.lower()}.')
+
+
+def index_queryset(backend, queryset, batch_size):
+    indexed, batch = 0, []
+    for obj in queryset.iterator(chunk_size=batch_size):
+        batch.append(obj)
+        if len(batch) == batch_size:
+            indexed += backend.index_many(batch)
+            batch = []
+    if batch:
+        indexed += backend.index_many(batch)
+    return indexed
@@ -0,0 +1,129 @@
+import asyncio
+import datetime
+import json
+import os
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from kunnic.bench.driver import run_load, start_server, stop_server
+from kunnic.bench.scenarios import SCENARIOS, Sample
+from kunnic.models import Comment, GalleryImage, Post, Song
+
+MODES = {
+    'wsgi': (['backend.wsgi'], {}),
+    'asgi': (['backend.asgi', '-k', 'uvicorn_worker.UvicornWorker'], {'KUNNIC_ASYNC_READS': '1'}),
+}
+
+
+class Command(BaseCommand):
+    help = ('Run the load-test scenarios (see kunnic/bench/scenarios.py) one after another against a local '
+            'gunicorn and report throughput, latency percentiles and queries per request. --output saves the '
+            'report as JSON; --compare prints the change against an earlier one.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scenarios', default=','.join(SCENARIOS),
+                            help='Comma-separated scenario names (default: all).')
+        parser.add_argument('--mode', choices=list(MODES), default='wsgi')
+        parser.add_argument('--workers', type=int, default=4)
+        parser.add_argument('--concurrency', type=int, default=16)
+        parser.add_argument('--duration', type=float, default=10.0, help='Seconds per scenario.')
+        parser.add_argument('--warmup', type=float, default=2.0, help='Unrecorded seconds before each scenario.')
+        parser.add_argument('--port', type=int, default=8766)
+        parser.add_argument('--external', action='store_true',
+                            help='Use a server already listening on --port instead of starting one.')
+        parser.add_argument('--output', metavar='PATH', help='Save the report here as JSON.')
+        parser.add_argument('--compare', metavar='PATH', help='A report saved by an earlier run.')
+
+    def handle(self, *args, **options):
+        names = options['scenarios'].split(',')
+        unknown = set(names) - set(SCENARIOS)
+        if unknown:
+            raise CommandError(f'Unknown scenarios: {", ".join(sorted(unknown))}; choose from {", ".join(SCENARIOS)}.')
+        sample = Sample()
+        report = {
+            'commit': git_commit(),
+            'started_at': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            'options': {key: options[key] for key in ('mode', 'workers', 'concurrency', 'duration')},
+            'dataset': {model._meta.model_name: model.objects.count() for model in (Post, Comment, Song, GalleryImage)},
+            'scenarios': {},
+        }
+
+        server = None if options['external'] else self.start(options)
+        try:
+            self.stdout.write(f'{"scenario":<16} {"req/s":>9} {"errors":>7} {"p50":>9} {"p90":>9} {"p99":>9} '
+                              f'{"queries":>8} {"db ms":>7} {"cached":>7}')
+            for name in names:
+                build, ok, needs = SCENARIOS[name]
+                if any(not getattr(sample, attribute) for attribute in needs):
+                    self.stdout.write(f'{name:<16} skipped: no data (run seed_bench_data)')
+                    continue
+                make_request = build(sample)
+                if options['warmup']:
+                    asyncio.run(run_load(options['port'], make_request, options['concurrency'], options['warmup'], ok))
+                result = asyncio.run(
+                    run_load(options['port'], make_request, options['concurrency'], options['duration'], ok)
+                )
+                summary = report['scenarios'][name] = result.summary()
+                self.stdout.write(self.format(name, summary))
+        finally:
+            if server is not None:
+                stop_server(server)
+
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                json.dump(report, file, indent=1)
+        if options['compare']:
+            self.compare(report, options['compare'])
+
+    def start(self, options):
+        app, env = MODES[options['mode']]
+        command = [sys.executable, '-m', 'gunicorn', *app, '-c', 'gunicorn.conf.py', '-w', str(options['workers']),
+                   '-b', f'127.0.0.1:{options["port"]}', '--log-level', 'warning']
+        env = {**os.environ, **env, 'KUNNIC_THROTTLE_OFF': '1'}
+        try:
+            return start_server(command, options['port'], settings.BASE_DIR, env, name=f'{options["mode"]} server')
+        except RuntimeError as exc:
+            raise CommandError(str(exc))
+
+    def format(self, name, summary):
+        latency = summary['latency_ms']
+        queries = summary['queries_per_request']
+        db = summary['db_ms_per_request']
+        return (
+            f'{name:<16} {summary["throughput"]:>9.1f} {summary["errors"]:>7} {latency["p50"]:>7.1f}ms '
+            f'{latency["p90"]:>7.1f}ms {latency["p99"]:>7.1f}ms {"-" if queries is None else f"{queries:.1f}":>8} '
+            f'{"-" if db is None else f"{db:.1f}":>7} {summary["cache_hit_ratio"]:>7.0%}'
+        )
+
+    def compare(self, report, path):
+        with open(path, encoding='utf-8') as file:
+            baseline = json.load(file)
+        self.stdout.write(f'\nAgainst {baseline.get("commit") or path}:')
+        self.stdout.write(f'{"scenario":<16} {"req/s":>16} {"p99":>22} {"queries":>16}')
+        for name, summary in report['scenarios'].items():
+            before = baseline['scenarios'].get(name)
+            if before is None:
+                continue
+            self.stdout.write(
+                f'{name:<16} {change(before["throughput"], summary["throughput"]):>16} '
+                f'{change(before["latency_ms"]["p99"], summary["latency_ms"]["p99"], "ms"):>22} '
+                f'{change(before["queries_per_request"], summary["queries_per_request"]):>16}'
+            )
+
+
+def change(before, after, unit=''):
+    if before is None or after is None:
+        return '-'
+    percent = f' ({(after - before) / before:+.0%})' if before else ''
+    return f'{after:.1f}{unit}{percent}'
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
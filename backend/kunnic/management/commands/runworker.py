@@ -0,0 +1,30 @@
+import signal
+
+from django.core.management.base import BaseCommand
+
+from kunnic.jobs import Worker, get_setting
+from kunnic.models import Job
+
+
+class Command(BaseCommand):
+    help = ('Run background jobs (see kunnic/jobs.py) until stopped with SIGTERM or Ctrl-C; jobs already running '
+            'finish first. --burst stops once no job is due.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=None,
+                            help='Jobs run at a time (default: KUNNIC_JOBS["THREADS"]).')
+        parser.add_argument('--processes', type=int, default=None,
+                            help='Processes for CPU-bound work, 0 for none (default: KUNNIC_JOBS["PROCESSES"]).')
+        parser.add_argument('--burst', action='store_true', help='Exit once the queue has nothing due.')
+
+    def handle(self, *args, **options):
+        worker = Worker(threads=options['threads'], processes=options['processes'], burst=options['burst'])
+        signal.signal(signal.SIGTERM, worker.stop)
+        signal.signal(signal.SIGINT, worker.stop)
+        self.stdout.write(f'Worker {worker.name}: {worker.threads} threads, '
+                          f'{worker.processes if worker.processes is not None else "all"} processes, '
+                          f'{get_setting("LEASE")}s lease.')
+        worker.run()
+        counts = worker.finished
+        self.stdout.write(f'Worker {worker.name} stopped after {sum(counts.values())} attempts: {counts[Job.DONE]} done, '
+                          f'{counts[Job.QUEUED]} to be retried, {counts[Job.FAILED]} failed.')
@@ -0,0 +1,28 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from kunnic.bench.seed import VOLUMES, Seeder
+
+
+class Command(BaseCommand):
+    help = ('Seed load-test data: by default ' + ', '.join(f'{count:,} {name}' for name, count in VOLUMES.items())
+            + '. Use --scale for a fraction of that and --clear to remove it again.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', type=float, default=1.0, help='Fraction of the full volumes to seed.')
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--seed', type=int, default=0, help='Random seed; the same seed gives the same data.')
+        parser.add_argument('--index', action='store_true', help='Rebuild the search index afterwards.')
+        parser.add_argument('--clear', action='store_true', help='Delete previously seeded data and stop.')
+
+    def handle(self, *args, **options):
+        seeder = Seeder(scale=options['scale'], batch_size=options['batch_size'], seed=options['seed'],
+                        log=self.stdout.write)
+        started = time.perf_counter()
+        if options['clear']:
+            seeder.clear()
+            self.stdout.write(f'Seeded data removed in {time.perf_counter() - started:.1f}s.')
+            return
+        seeder.run(index=options['index'])
+        self.stdout.write(f'Done in {time.perf_counter() - started:.1f}s.')
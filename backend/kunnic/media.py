@@ -0,0 +1,224 @@
+"""
+Seekable delivery of uploaded media files.
+
+:func:`serve_file` answers ``GET``/``HEAD`` for a ``FieldFile`` with a strong
+ETag built from the stored name, size and modification time, honours
+``If-None-Match``/``If-Modified-Since``/``If-Range`` and a single ``Range``
+(206 partial content, 416 when unsatisfiable). The body is a
+``FileResponse`` over a window of the open file, so gunicorn hands it to
+``sendfile()`` and other servers read it in ``CHUNK_SIZE`` blocks; nothing
+is read into worker memory up front.
+
+With ``OFFLOAD`` set, the bytes are left to the front server instead:
+``'x-accel-redirect'`` for nginx (an ``internal`` location under
+``ACCEL_PREFIX`` aliasing ``MEDIA_ROOT``) or ``'x-sendfile'`` for Apache and
+lighttpd. Both handle ``Range`` themselves.
+
+:func:`serve_media` serves ``MEDIA_URL`` in development. Content-addressed
+names (see kunnic/storage.py) never change their bytes, so they are sent
+``immutable`` with a year's ``max-age``; the stream endpoint's URL outlives
+a replaced file and keeps ``MAX_AGE``.
+"""
+import hashlib
+import mimetypes
+import os
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, parse_http_date_safe, quote_etag
+from rest_framework.negotiation import BaseContentNegotiation
+
+from kunnic.storage import get_media_storage, is_content_addressed
+
+DEFAULTS = {
+    'CHUNK_SIZE': 64 * 1024,
+    # None streams from the worker; 'x-accel-redirect' or 'x-sendfile' offload.
+    'OFFLOAD': None,
+    'ACCEL_PREFIX': '/protected-media/',
+    'MAX_AGE': 0,
+}
+
+IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60
+
+RANGE_RE = re.compile(r'^\s*bytes\s*=\s*(\d*)\s*-\s*(\d*)\s*$', re.IGNORECASE)
+
+
+def get_setting(name):
+    return getattr(settings, 'KUNNIC_MEDIA', {}).get(name, DEFAULTS[name])
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+def parse_range(header, size):
+    """
+    Return the inclusive ``(start, end)`` byte range requested by ``header``,
+    or ``None`` to send the whole file. Malformed and multi-range headers are
+    ignored, as RFC 9110 allows; a range starting past the end raises
+    :class:`RangeNotSatisfiable`.
+    """
+    match = RANGE_RE.match(header or '')
+    if match is None:
+        return None
+    first, last = match.groups()
+    if not first:
+        if not last:
+            return None
+        # Suffix range: the final N bytes.
+        length = int(last)
+        if not length or not size:
+            raise RangeNotSatisfiable
+        return max(size - length, 0), size - 1
+    start = int(first)
+    if last and int(last) < start:
+        return None
+    if start >= size:
+        raise RangeNotSatisfiable
+    end = int(last) if last else size - 1
+    return start, min(end, size - 1)
+
+
+def get_validators(fieldfile):
+    """Return ``(etag, size, last_modified)`` for a stored file, stat only."""
+    storage, name = fieldfile.storage, fieldfile.name
+    size = storage.size(name)
+    modified = storage.get_modified_time(name)
+    last_modified = int(modified.timestamp())
+    digest = hashlib.sha1(f'{name}|{size}|{modified.isoformat()}'.encode('utf-8')).hexdigest()
+    return quote_etag(digest), size, last_modified
+
+
+def if_range_passes(request, etag, last_modified):
+    """``If-Range`` needs a strong ETag match or the exact modification date."""
+    value = request.META.get('HTTP_IF_RANGE')
+    if not value:
+        return True
+    if value.startswith(('"', 'W/')):
+        return value == etag
+    return parse_http_date_safe(value) == last_modified
+
+
+class RangedFile:
+    """
+    Read at most ``length`` bytes of ``file`` from ``start``.
+
+    Only ``read``, ``fileno`` and ``close`` are exposed: ``FileResponse``
+    then leaves ``Content-Length`` to the caller, and gunicorn's sendfile
+    path picks up the offset from the file descriptor and the length from
+    ``Content-Length``.
+    """
+
+    def __init__(self, file, start, length):
+        file.seek(start)
+        self.file = file
+        self.name = file.name
+        self.remaining = length
+
+    def read(self, size=-1):
+        if size is None or size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size) if size else b''
+        self.remaining -= len(data)
+        return data
+
+    def fileno(self):
+        return self.file.fileno()
+
+    def close(self):
+        self.file.close()
+
+
+def serve_file(request, fieldfile, content_type=None, immutable=False):
+    """
+    Serve ``fieldfile`` with validators, ``Range`` support and offload.
+    ``immutable`` is for URLs that always name the same bytes.
+    """
+    etag, size, last_modified = get_validators(fieldfile)
+    content_type = content_type or mimetypes.guess_type(fieldfile.name)[0] or 'application/octet-stream'
+
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        offload = get_setting('OFFLOAD')
+        if offload == 'x-accel-redirect':
+            response = HttpResponse(content_type=content_type)
+            response['X-Accel-Redirect'] = get_setting('ACCEL_PREFIX') + quote(fieldfile.name)
+        elif offload == 'x-sendfile':
+            response = HttpResponse(content_type=content_type)
+            response['X-Sendfile'] = fieldfile.path
+        else:
+            response = _stream(request, fieldfile, content_type, etag, size, last_modified)
+
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    response['Accept-Ranges'] = 'bytes'
+    if immutable:
+        patch_cache_control(response, public=True, max_age=IMMUTABLE_MAX_AGE, immutable=True)
+    else:
+        patch_cache_control(response, public=True, max_age=get_setting('MAX_AGE'))
+    return response
+
+
+class StoredFile:
+    """A stored name with the ``FieldFile`` attributes :func:`serve_file` reads."""
+
+    def __init__(self, storage, name):
+        self.storage = storage
+        self.name = name
+
+    @property
+    def path(self):
+        return self.storage.path(self.name)
+
+
+def serve_media(request, path):
+    """Serve the media file ``path``, cached for good if it is content-addressed."""
+    storage = get_media_storage()
+    try:
+        found = os.path.isfile(storage.path(path))
+    except SuspiciousFileOperation:
+        found = False
+    if not found:
+        raise Http404('No such media file.')
+    return serve_file(request, StoredFile(storage, path), immutable=is_content_addressed(path))
+
+
+def _stream(request, fieldfile, content_type, etag, size, last_modified):
+    byte_range = None
+    if if_range_passes(request, etag, last_modified):
+        try:
+            byte_range = parse_range(request.META.get('HTTP_RANGE'), size)
+        except RangeNotSatisfiable:
+            response = HttpResponse(status=416, content_type=content_type)
+            response['Content-Range'] = f'bytes */{size}'
+            return response
+
+    start, end = byte_range or (0, size - 1)
+    length = end - start + 1 if size else 0
+    response = FileResponse(
+        RangedFile(fieldfile.storage.open(fieldfile.name, 'rb'), start, length),
+        content_type=content_type,
+        status=206 if byte_range else 200,
+    )
+    response.block_size = get_setting('CHUNK_SIZE')
+    response['Content-Length'] = length
+    if byte_range:
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    return response
+
+
+class MediaContentNegotiation(BaseContentNegotiation):
+    """
+    Skip ``Accept`` matching for media actions. Players send ``audio/*`` or
+    ``*/*`` and the response is never rendered by a DRF renderer anyway.
+    """
+
+    def select_parser(self, request, parsers):
+        return parsers[0]
+
+    def select_renderer(self, request, renderers, format_suffix=None):
+        return renderers[0], renderers[0].media_type
@@ -0,0 +1,132 @@
+"""
+Reference counts, garbage collection and conversion for content-addressed
+media (see kunnic/storage.py).
+
+Saves and deletes through the fields keep ``MediaFile.refs`` current.
+Bulk-created rows (the load-test seeder, ``import_content``) and raw
+deletes don't, so :func:`refresh_refs` recounts every reference from the
+rows and :func:`collect_garbage` then deletes what nothing uses. A recount
+is exact only while nothing is uploaded meanwhile; run both off-peak with
+``manage.py gc_media``.
+
+:func:`convert_media` gives files saved before content addressing their
+hashed names in place, with hard links rather than copies, then points the
+rows at them.
+"""
+import os
+from collections import Counter
+from datetime import timedelta
+
+from django.db import transaction
+from django.utils import timezone
+
+from kunnic.models import GalleryImage, MediaFile, Song
+from kunnic.storage import get_media_storage, is_content_addressed
+
+# (model, file field) of every column holding a stored name.
+FILE_FIELDS = ((Song, 'audio_file'), (Song, 'peaks_file'), (GalleryImage, 'image'))
+# Seconds a file without a MediaFile row is left alone: it may belong to a
+# save whose transaction hasn't committed yet.
+GRACE = 60 * 60
+BATCH_SIZE = 1000
+
+
+def referenced_names():
+    """How many rows and derivatives use each stored name."""
+    counts = Counter()
+    for model, field in FILE_FIELDS:
+        counts.update(model.objects.exclude(**{field: ''}).values_list(field, flat=True).iterator(BATCH_SIZE))
+    for derivatives in GalleryImage.objects.exclude(derivatives={}).values_list('derivatives', flat=True).iterator(BATCH_SIZE):
+        counts.update(name for names in derivatives.values() for name in names.values())
+    return counts
+
+
+def refresh_refs():
+    """
+    Recount ``MediaFile.refs`` from the rows, adding rows for counted files
+    that have none. Returns the names referenced but missing from storage.
+    """
+    storage = get_media_storage()
+    counts = {name: refs for name, refs in referenced_names().items() if is_content_addressed(name)}
+    missing = []
+    with transaction.atomic():
+        changed = []
+        for media_file in MediaFile.objects.select_for_update().iterator(BATCH_SIZE):
+            refs = counts.pop(media_file.name, 0)
+            if media_file.refs != refs:
+                media_file.refs = refs
+                changed.append(media_file)
+        MediaFile.objects.bulk_update(changed, ['refs'], batch_size=BATCH_SIZE)
+        created = []
+        for name, refs in counts.items():
+            if storage.exists(name):
+                created.append(MediaFile(name=name, size=storage.size(name), refs=refs))
+            else:
+                missing.append(name)
+        MediaFile.objects.bulk_create(created, batch_size=BATCH_SIZE)
+    return missing
+
+
+def collect_garbage(grace=GRACE):
+    """
+    Delete files nothing references: those counted down to 0 and
+    content-addressed files without a ``MediaFile`` row, once older than
+    ``grace`` seconds. Returns ``(files, bytes)`` deleted.
+    """
+    storage = get_media_storage()
+    files = size = 0
+    for pk in MediaFile.objects.filter(refs=0).values_list('pk', flat=True):
+        with transaction.atomic():
+            # Unless it was saved again since.
+            media_file = MediaFile.objects.select_for_update().filter(pk=pk, refs=0).first()
+            if media_file is not None:
+                storage.delete(media_file.name)
+                size += media_file.size
+                files += 1
+    known = set(MediaFile.objects.values_list('name', flat=True))
+    cutoff = (timezone.now() - timedelta(seconds=grace)).timestamp()
+    for root, directories, names in os.walk(storage.location):
+        for filename in names:
+            path = os.path.join(root, filename)
+            name = os.path.relpath(path, storage.location).replace(os.sep, '/')
+            if is_content_addressed(name) and name not in known and os.path.getmtime(path) < cutoff:
+                size += os.path.getsize(path)
+                os.remove(path)
+                files += 1
+    return files, size
+
+
+def convert_media():
+    """
+    Move every referenced file that isn't content-addressed yet to its
+    hashed name and recount. Returns ``(converted, missing)`` names.
+    """
+    storage = get_media_storage()
+    renamed, missing = {}, []
+    for name in referenced_names():
+        if is_content_addressed(name):
+            continue
+        if storage.exists(name):
+            renamed[name] = storage.adopt(name)
+        else:
+            missing.append(name)
+    if renamed:
+        with transaction.atomic():
+            for model, field in FILE_FIELDS:
+                for old, new in renamed.items():
+                    model.objects.filter(**{field: old}).update(**{field: new})
+            changed = []
+            for image in GalleryImage.objects.exclude(derivatives={}).only('pk', 'derivatives').iterator(BATCH_SIZE):
+                derivatives = {
+                    fmt: {width: renamed.get(name, name) for width, name in names.items()}
+                    for fmt, names in image.derivatives.items()
+                }
+                if derivatives != image.derivatives:
+                    image.derivatives = derivatives
+                    changed.append(image)
+            GalleryImage.objects.bulk_update(changed, ['derivatives'], batch_size=BATCH_SIZE)
+            refresh_refs()
+        # Linked above; the old names have no MediaFile row, so this removes them.
+        for old in renamed:
+            storage.delete(old)
+    return list(renamed), missing
@@ -0,0 +1,479 @@
+"""
+Per-request performance metrics for the kunnic API.
+
+:class:`MetricsMiddleware` times every request and labels it with its URL
+name (``post-list``, ``song-peaks``...) and method. An execute wrapper on
+every database connection counts queries and their time. It also flags
+duplicate queries (same SQL and parameters) and N+1 patterns (the same SQL
+run ``N_PLUS_ONE_THRESHOLD`` times or more). :class:`MetricsMixin` splits
+DRF views into ``serialize`` (view code outside queries) and ``render``.
+
+Each response gets a ``Server-Timing`` header. Per-route totals are kept
+in process and published to the API cache every ``FLUSH_INTERVAL`` seconds,
+so ``/metrics`` can sum every worker in the Prometheus text format. That
+takes a shared API cache (``API_CACHE_URL``); with local memory each scrape
+only sees the worker it reaches and the output says so.
+
+Job workers (see kunnic/jobs.py) publish per-kind totals the same way
+through :data:`job_registry`; ``/metrics`` adds them and the queue depth,
+which it reads from the database.
+"""
+import logging
+import os
+import threading
+import time
+from contextvars import ContextVar
+from collections import Counter, defaultdict
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.http import HttpResponse, HttpResponseForbidden
+from django.utils.crypto import constant_time_compare
+
+from kunnic.cache import get_cache, get_setting as get_cache_setting, is_shared
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'SERVER_TIMING': True,
+    'N_PLUS_ONE_THRESHOLD': 5,
+    'FLUSH_INTERVAL': 15,
+    # Bearer token for /metrics; without one only loopback may scrape, and
+    # only with DEBUG on.
+    'TOKEN': None,
+}
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Per-route totals, in this order; see RouteStats.
+FIELDS = (
+    'requests', 'errors', 'duration', 'db_queries', 'db_duration', 'serialize_duration',
+    'render_duration', 'response_bytes', 'duplicate_queries', 'n_plus_one',
+)
+JOB_DURATION_BUCKETS = (0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0, 900.0)
+# Per-kind job totals, in this order; see JobStats.
+JOB_FIELDS = ('completed', 'retried', 'failed', 'wait_duration', 'run_duration')
+
+current = ContextVar('kunnic_request_metrics', default=None)
+
+
+def get_setting(name):
+    return getattr(settings, 'KUNNIC_METRICS', {}).get(name, DEFAULTS[name])
+
+
+class RequestMetrics:
+    """What one request spent; the execute wrapper and :class:`MetricsMixin` fill it in."""
+    __slots__ = ('queries', 'db_duration', 'serialize_duration', 'render_duration', 'statements', 'view_started')
+
+    def __init__(self):
+        self.queries = 0
+        self.db_duration = 0.0
+        self.serialize_duration = None
+        self.render_duration = None
+        self.statements = Counter()
+        self.view_started = None
+
+    def record(self, sql, params, many, elapsed):
+        self.queries += 1
+        self.db_duration += elapsed
+        self.statements[sql, None if many else _freeze(params)] += 1
+
+    def repeated(self):
+        """``(duplicates, n_plus_one_sql)``: exact repeats, and SQL run too often with any parameters."""
+        duplicates = 0
+        templates = Counter()
+        for (sql, params), count in self.statements.items():
+            if params is not None:
+                duplicates += count - 1
+            templates[sql] += count
+        threshold = get_setting('N_PLUS_ONE_THRESHOLD')
+        return duplicates, [sql for sql, count in templates.items() if count >= threshold]
+
+
+def _freeze(params):
+    try:
+        return hash(tuple(params)) if params is not None else 0
+    except TypeError:
+        return None
+
+
+def record_query(execute, sql, params, many, context):
+    metrics = current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.record(sql, params, many, time.perf_counter() - started)
+
+
+@receiver(connection_created)
+def install_query_recorder(sender, connection, **kwargs):
+    # Installed once per connection rather than per request, so async views
+    # whose queries run on a worker thread are recorded too.
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+class Stats:
+    """Totals of ``fields`` plus a bucket list per histogram in ``histograms``, ``{name: bounds}``."""
+    __slots__ = ()
+    fields = ()
+    histograms = {}
+
+    def __init__(self):
+        for field in self.fields:
+            setattr(self, field, 0)
+        for name, bounds in self.histograms.items():
+            setattr(self, name, [0] * len(bounds))
+
+    def observe(self, histogram, value):
+        for index, bound in enumerate(self.histograms[histogram]):
+            if value <= bound:
+                getattr(self, histogram)[index] += 1
+                break
+
+    def add(self, other):
+        for field in self.fields:
+            setattr(self, field, getattr(self, field) + getattr(other, field))
+        for name in self.histograms:
+            setattr(self, name, [a + b for a, b in zip(getattr(self, name), getattr(other, name))])
+
+    def dump(self):
+        return [getattr(self, field) for field in self.fields] + [getattr(self, name) for name in self.histograms]
+
+    @classmethod
+    def load(cls, values):
+        stats = cls()
+        for field, value in zip(cls.fields + tuple(cls.histograms), values):
+            setattr(stats, field, value)
+        return stats
+
+
+class RouteStats(Stats):
+    __slots__ = FIELDS + ('buckets',)
+    fields = FIELDS
+    histograms = {'buckets': DURATION_BUCKETS}
+
+
+class JobStats(Stats):
+    __slots__ = JOB_FIELDS + ('wait_buckets', 'run_buckets')
+    fields = JOB_FIELDS
+    histograms = {'wait_buckets': JOB_DURATION_BUCKETS, 'run_buckets': JOB_DURATION_BUCKETS}
+
+
+class Registry:
+    """
+    This process's totals, ``{key: stats_class}``, published to the API
+    cache under ``namespace`` now and then.
+    """
+    namespace = 'metrics'
+    stats_class = RouteStats
+
+    def __init__(self):
+        self.routes = defaultdict(self.stats_class)
+        self.lock = threading.Lock()
+        self.flushed = time.monotonic()
+        self.reported = set()
+
+    def _due(self):
+        # Call with the lock held.
+        due = time.monotonic() - self.flushed >= get_setting('FLUSH_INTERVAL')
+        if due:
+            self.flushed = time.monotonic()
+        return due
+
+    def observe(self, route, status, duration, metrics, size):
+        duplicates, n_plus_one = metrics.repeated()
+        with self.lock:
+            stats = self.routes[route]
+            stats.requests += 1
+            stats.errors += status >= 500
+            stats.duration += duration
+            stats.db_queries += metrics.queries
+            stats.db_duration += metrics.db_duration
+            stats.serialize_duration += metrics.serialize_duration or 0.0
+            stats.render_duration += metrics.render_duration or 0.0
+            stats.response_bytes += size
+            stats.duplicate_queries += duplicates
+            stats.n_plus_one += bool(n_plus_one)
+            stats.observe('buckets', duration)
+            due = self._due()
+        for sql in n_plus_one:
+            if (route, sql) not in self.reported:
+                self.reported.add((route, sql))
+                logger.warning('Possible N+1 on %s %s: %s', route[1], route[0], sql)
+        if due:
+            self.flush()
+
+    def snapshot(self):
+        with self.lock:
+            return {route: stats.dump() for route, stats in self.routes.items()}
+
+    def flush(self):
+        cache = get_cache()
+        interval = get_setting('FLUSH_INTERVAL')
+        prefix = f'{get_cache_setting("KEY_PREFIX")}:{self.namespace}'
+        pid = os.getpid()
+        cache.set(f'{prefix}:{pid}', self.snapshot(), timeout=interval * 4)
+        workers = cache.get(f'{prefix}:workers') or set()
+        if pid not in workers:
+            cache.set(f'{prefix}:workers', workers | {pid}, timeout=None)
+
+    def collect(self):
+        """Totals over every worker that has published recently, this one included."""
+        self.flush()
+        cache = get_cache()
+        prefix = f'{get_cache_setting("KEY_PREFIX")}:{self.namespace}'
+        workers = cache.get(f'{prefix}:workers') or set()
+        snapshots = cache.get_many([f'{prefix}:{pid}' for pid in workers])
+        live = {int(key.rsplit(':', 1)[1]) for key in snapshots}
+        if live != workers:
+            cache.set(f'{prefix}:workers', live, timeout=None)
+        totals = defaultdict(self.stats_class)
+        for snapshot in snapshots.values():
+            for route, values in snapshot.items():
+                totals[route].add(self.stats_class.load(values))
+        return totals
+
+
+class JobRegistry(Registry):
+    """Per-kind job totals of this process; job workers publish them like web workers do."""
+    namespace = 'jobmetrics'
+    stats_class = JobStats
+
+    def observe(self, kind, outcome, wait, duration):
+        """``outcome`` is ``'completed'``, ``'retried'`` or ``'failed'``; ``wait`` is seconds from due to start."""
+        with self.lock:
+            stats = self.routes[kind]
+            setattr(stats, outcome, getattr(stats, outcome) + 1)
+            stats.wait_duration += wait
+            stats.run_duration += duration
+            stats.observe('wait_buckets', wait)
+            stats.observe('run_buckets', duration)
+            due = self._due()
+        if due:
+            self.flush()
+
+    def flush_if_due(self):
+        """Keep an idle worker's totals in the cache; they expire otherwise."""
+        with self.lock:
+            due = self._due()
+        if due:
+            self.flush()
+
+
+registry = Registry()
+job_registry = JobRegistry()
+
+
+def get_route(request):
+    match = request.resolver_match
+    # Unmatched paths share one label so 404 scans can't explode cardinality.
+    return (match.view_name or match.route) if match else 'unmatched', request.method
+
+
+def server_timing(metrics, duration):
+    parts = [f'db;dur={metrics.db_duration * 1000:.1f};desc="{metrics.queries} queries"']
+    if metrics.serialize_duration is not None:
+        parts.append(f'serialize;dur={metrics.serialize_duration * 1000:.1f}')
+    if metrics.render_duration is not None:
+        parts.append(f'render;dur={metrics.render_duration * 1000:.1f}')
+    parts.append(f'total;dur={duration * 1000:.1f}')
+    return ', '.join(parts)
+
+
+def response_size(response):
+    if response.streaming:
+        return int(response.get('Content-Length') or 0)
+    return len(response.content)
+
+
+class MetricsMiddleware:
+    """Time each request and record it; goes first in ``MIDDLEWARE``."""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        metrics = RequestMetrics()
+        token = current.set(metrics)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            current.reset(token)
+        return self.finish(request, response, metrics, time.perf_counter() - started)
+
+    async def __acall__(self, request):
+        metrics = RequestMetrics()
+        token = current.set(metrics)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            current.reset(token)
+        return self.finish(request, response, metrics, time.perf_counter() - started)
+
+    def finish(self, request, response, metrics, duration):
+        registry.observe(get_route(request), response.status_code, duration, metrics, response_size(response))
+        if get_setting('SERVER_TIMING'):
+            existing = response.get('Server-Timing')
+            timing = server_timing(metrics, duration)
+            response['Server-Timing'] = f'{existing}, {timing}' if existing else timing
+        return response
+
+
+class MetricsMixin:
+    """
+    Time the DRF handler and the render of its response. ``serialize`` is
+    handler time minus its queries, which for these views is mostly
+    serializers; rendering is done here so it can be timed on its own.
+    """
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        metrics = current.get()
+        if metrics is not None:
+            metrics.view_started = (time.perf_counter(), metrics.db_duration)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        metrics = current.get()
+        if metrics is None or metrics.view_started is None:
+            return response
+        started, db_before = metrics.view_started
+        now = time.perf_counter()
+        metrics.serialize_duration = max(0.0, now - started - (metrics.db_duration - db_before))
+        if hasattr(response, 'render') and not response.is_rendered:
+            response.render()
+            metrics.render_duration = time.perf_counter() - now
+        return response
+
+
+def _labels(route):
+    view, method = route
+    view = view.replace('\\', '\\\\').replace('"', '\\"')
+    return f'view="{view}",method="{method}"'
+
+
+def _kind_label(kind):
+    kind = kind.replace('\\', '\\\\').replace('"', '\\"')
+    return f'kind="{kind}"'
+
+
+def _value(value):
+    """Counters stay exact: ints as they are, floats at full precision."""
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+def _family(lines, name, kind, help_text, samples):
+    lines.append(f'# HELP {name} {help_text}')
+    lines.append(f'# TYPE {name} {kind}')
+    lines.extend(samples)
+
+
+def _histogram(name, labels, bounds, buckets, count, total):
+    samples = []
+    cumulative = 0
+    for bound, observed in zip(bounds, buckets):
+        cumulative += observed
+        samples.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+    samples.append(f'{name}_bucket{{{labels},le="+Inf"}} {count}')
+    samples.append(f'{name}_sum{{{labels}}} {_value(total)}')
+    samples.append(f'{name}_count{{{labels}}} {count}')
+    return samples
+
+
+def render_prometheus(totals):
+    lines = []
+    routes = sorted(totals.items())
+    for name, field, help_text in (
+        ('kunnic_requests_total', 'requests', 'Requests handled.'),
+        ('kunnic_request_errors_total', 'errors', 'Requests answered with a 5xx status.'),
+        ('kunnic_db_queries_total', 'db_queries', 'Database queries run.'),
+        ('kunnic_db_duration_seconds_total', 'db_duration', 'Time spent in database queries.'),
+        ('kunnic_serialize_duration_seconds_total', 'serialize_duration',
+         'Time spent in DRF handlers outside queries, mostly serializers.'),
+        ('kunnic_render_duration_seconds_total', 'render_duration', 'Time spent rendering DRF responses.'),
+        ('kunnic_response_bytes_total', 'response_bytes', 'Response body bytes sent.'),
+        ('kunnic_duplicate_queries_total', 'duplicate_queries', 'Queries repeated with identical SQL and parameters.'),
+        ('kunnic_n_plus_one_requests_total', 'n_plus_one', 'Requests that ran one SQL statement N_PLUS_ONE_THRESHOLD times or more.'),
+    ):
+        _family(lines, name, 'counter', help_text,
+                [f'{name}{{{_labels(route)}}} {_value(getattr(stats, field))}' for route, stats in routes])
+
+    samples = []
+    for route, stats in routes:
+        samples += _histogram('kunnic_request_duration_seconds', _labels(route), DURATION_BUCKETS, stats.buckets,
+                              stats.requests, stats.duration)
+    _family(lines, 'kunnic_request_duration_seconds', 'histogram', 'Request duration, middleware to response.', samples)
+    return '\n'.join(lines) + '\n'
+
+
+def render_job_prometheus(totals, queue):
+    """
+    Job totals by kind from :data:`job_registry`, and ``queue``, the
+    ``(kind, status, count, oldest due)`` rows of :func:`kunnic.jobs.queue_depth`.
+    """
+    lines = []
+    kinds = sorted(totals.items())
+    for name, field, help_text in (
+        ('kunnic_jobs_completed_total', 'completed', 'Jobs that ran to completion.'),
+        ('kunnic_jobs_retried_total', 'retried', 'Job attempts that failed and were queued again.'),
+        ('kunnic_jobs_failed_total', 'failed', 'Jobs given up on.'),
+    ):
+        _family(lines, name, 'counter', help_text,
+                [f'{name}{{{_kind_label(kind)}}} {_value(getattr(stats, field))}' for kind, stats in kinds])
+    for name, field, buckets, help_text in (
+        ('kunnic_job_wait_seconds', 'wait_duration', 'wait_buckets', 'Time from a job being due to a worker starting it.'),
+        ('kunnic_job_run_seconds', 'run_duration', 'run_buckets', 'Time a job attempt ran.'),
+    ):
+        samples = []
+        for kind, stats in kinds:
+            count = stats.completed + stats.retried + stats.failed
+            samples += _histogram(name, _kind_label(kind), JOB_DURATION_BUCKETS, getattr(stats, buckets), count,
+                                  getattr(stats, field))
+        _family(lines, name, 'histogram', help_text, samples)
+
+    _family(lines, 'kunnic_jobs', 'gauge', 'Jobs in the queue table by status.', [
+        f'kunnic_jobs{{{_kind_label(kind)},status="{status}"}} {count}' for kind, status, count, oldest in queue
+    ])
+    now = time.time()
+    _family(lines, 'kunnic_job_queue_age_seconds', 'gauge', 'How long the oldest due queued job has waited.', [
+        f'kunnic_job_queue_age_seconds{{{_kind_label(kind)}}} {_value(max(0.0, now - oldest.timestamp()))}'
+        for kind, status, count, oldest in queue if status == 'queued' and oldest is not None
+    ])
+    return '\n'.join(lines) + '\n'
+
+
+def metrics_view(request):
+    """
+    ``GET /metrics``: Prometheus text for every worker sharing the API cache.
+
+    Needs the bearer token. Without one configured, loopback may scrape in
+    development only: behind a reverse proxy on the same host every request
+    comes from loopback.
+    """
+    token = get_setting('TOKEN')
+    if token:
+        authorization = request.headers.get('Authorization', '')
+        if not constant_time_compare(authorization, f'Bearer {token}'):
+            return HttpResponseForbidden()
+    elif not settings.DEBUG or request.META.get('REMOTE_ADDR') not in ('127.0.0.1', '::1'):
+        return HttpResponseForbidden()
+    from kunnic.jobs import queue_depth
+
+    text = render_prometheus(registry.collect()) + render_job_prometheus(job_registry.collect(), queue_depth())
+    if not is_shared(get_cache()):
+        text = '# Local-memory API cache: these totals cover this worker only; set API_CACHE_URL.\n' + text
+    return HttpResponse(text, content_type='text/plain; version=0.0.4')
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.4 on 2026-10-17 16:20
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('kunnic', '0003_comment'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='galleryimage',
+            index=models.Index(fields=['-upload_date', '-id'], name='gallery_upload_keyset_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['is_published', '-published_at', '-id'], name='post_published_keyset_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='song',
+            index=models.Index(fields=['-release_date', '-id'], name='song_release_keyset_idx'),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.4 on 2026-10-17 17:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('kunnic', '0004_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='song',
+            name='bitrate',
+            field=models.PositiveIntegerField(blank=True, editable=False, help_text='Average bitrate of the audio file in bits per second', null=True, verbose_name='Bitrate'),
+        ),
+        migrations.AddField(
+            model_name='song',
+            name='channels',
+            field=models.PositiveSmallIntegerField(blank=True, editable=False, help_text='Number of audio channels', null=True, verbose_name='Channels'),
+        ),
+        migrations.AddField(
+            model_name='song',
+            name='duration',
+            field=models.FloatField(blank=True, editable=False, help_text='Length of the song in seconds', null=True, verbose_name='Duration'),
+        ),
+        migrations.AddField(
+            model_name='song',
+            name='peaks_file',
+            field=models.FileField(blank=True, editable=False, help_text='Precomputed waveform peaks for the audio file', upload_to='songs/peaks/', verbose_name='Peaks File'),
+        ),
+        migrations.AddField(
+            model_name='song',
+            name='sample_rate',
+            field=models.PositiveIntegerField(blank=True, editable=False, help_text='Sample rate of the audio file in Hz', null=True, verbose_name='Sample Rate'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.4 on 2026-10-17 17:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('kunnic', '0005_song_audio_metadata'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='galleryimage',
+            name='derivatives',
+            field=models.JSONField(blank=True, default=dict, editable=False, help_text='Resized copies of the image by format and width', verbose_name='Derivatives'),
+        ),
+        migrations.AddField(
+            model_name='galleryimage',
+            name='height',
+            field=models.PositiveIntegerField(blank=True, editable=False, help_text='Height of the original image in pixels', null=True, verbose_name='Height'),
+        ),
+        migrations.AddField(
+            model_name='galleryimage',
+            name='placeholder',
+            field=models.CharField(blank=True, editable=False, help_text='BlurHash shown while the image loads', max_length=64, verbose_name='Placeholder'),
+        ),
+        migrations.AddField(
+            model_name='galleryimage',
+            name='width',
+            field=models.PositiveIntegerField(blank=True, editable=False, help_text='Width of the original image in pixels', null=True, verbose_name='Width'),
+        ),
+    ]
@@ -0,0 +1,38 @@
+from django.db import migrations
+
+# The schema as of this migration; kunnic.search may move on.
+CREATE = {
+    'sqlite': [
+        "CREATE VIRTUAL TABLE kunnic_search USING fts5(title, body, tokenize='unicode61 remove_diacritics 2')",
+    ],
+    'postgresql': [
+        "CREATE TABLE kunnic_search ("
+        "doc_id bigint PRIMARY KEY, title text NOT NULL, body text NOT NULL, "
+        "document tsvector GENERATED ALWAYS AS ("
+        "setweight(to_tsvector('simple', title), 'A') || "
+        "setweight(to_tsvector('simple', body), 'B')) STORED)",
+        'CREATE INDEX kunnic_search_document_idx ON kunnic_search USING GIN (document)',
+    ],
+}
+
+
+def create_index(apps, schema_editor):
+    for sql in CREATE.get(schema_editor.connection.vendor, []):
+        schema_editor.execute(sql)
+
+
+def drop_index(apps, schema_editor):
+    if schema_editor.connection.vendor in CREATE:
+        schema_editor.execute('DROP TABLE IF EXISTS kunnic_search')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('kunnic', '0006_galleryimage_derivatives'),
+    ]
+
+    operations = [
+        # Vendor-specific (FTS5 / tsvector + GIN); fill with manage.py rebuild_search_index.
+        migrations.RunPython(create_index, drop_index),
+    ]
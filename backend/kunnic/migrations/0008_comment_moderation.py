@@ -0,0 +1,40 @@
+# Generated by Django 5.2.4 on 2026-10-17 17:29
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_comments(apps, schema_editor):
+    Comment = apps.get_model('kunnic', 'Comment')
+    Post = apps.get_model('kunnic', 'Post')
+    approved = (
+        Comment.objects.filter(post=OuterRef('pk'), is_approved=True)
+        .order_by().values('post').annotate(total=Count('pk')).values('total')
+    )
+    Post.objects.update(comment_count=Coalesce(Subquery(approved), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('kunnic', '0007_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='comment',
+            name='is_approved',
+            field=models.BooleanField(default=True, help_text='Indicates if the comment is shown publicly', verbose_name='Is Approved'),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='comment_count',
+            field=models.PositiveIntegerField(default=0, editable=False, help_text='Number of approved comments on the post', verbose_name='Comment Count'),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['post', '-created_at', '-id'], name='comment_thread_keyset_idx'),
+        ),
+        migrations.RunPython(count_comments, migrations.RunPython.noop),
+    ]
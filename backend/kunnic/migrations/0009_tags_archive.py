@@ -0,0 +1,86 @@
+# Generated by Django 5.2.4 on 2026-10-17 17:59
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count
+from django.db.models.functions import TruncMonth
+
+
+def count_months(apps, schema_editor):
+    ArchiveMonth = apps.get_model('kunnic', 'ArchiveMonth')
+    Post = apps.get_model('kunnic', 'Post')
+    months = (
+        Post.objects.filter(is_published=True).order_by()
+        .annotate(month=TruncMonth('published_at')).values('month').annotate(total=Count('pk'))
+    )
+    ArchiveMonth.objects.bulk_create([
+        ArchiveMonth(year=row['month'].year, month=row['month'].month, post_count=row['total'])
+        for row in months
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('kunnic', '0008_comment_moderation'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Tag',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(help_text='Name of the tag', max_length=100, unique=True, verbose_name='Name')),
+                ('slug', models.SlugField(help_text='Unique identifier for the tag', max_length=100, unique=True, verbose_name='Slug')),
+                ('post_count', models.PositiveIntegerField(default=0, editable=False, help_text='Number of published posts with the tag', verbose_name='Post Count')),
+            ],
+            options={
+                'verbose_name': 'Tag',
+                'verbose_name_plural': 'Tags',
+                'ordering': ['name'],
+            },
+        ),
+        migrations.CreateModel(
+            name='ArchiveMonth',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('year', models.PositiveSmallIntegerField(help_text='Year of publication', verbose_name='Year')),
+                ('month', models.PositiveSmallIntegerField(help_text='Month of publication, 1 to 12', verbose_name='Month')),
+                ('post_count', models.PositiveIntegerField(default=0, help_text='Number of published posts in the month', verbose_name='Post Count')),
+            ],
+            options={
+                'verbose_name': 'Archive Month',
+                'verbose_name_plural': 'Archive Months',
+                'ordering': ['-year', '-month'],
+                'constraints': [models.UniqueConstraint(fields=('year', 'month'), name='archivemonth_unique')],
+            },
+        ),
+        migrations.CreateModel(
+            name='PostTag',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('is_published', models.BooleanField(default=False, editable=False, help_text='Whether the tagged post is published', verbose_name='Is Published')),
+                ('published_at', models.DateTimeField(editable=False, help_text='Publication date of the tagged post', null=True, verbose_name='Published At')),
+                ('post', models.ForeignKey(help_text='Tagged post', on_delete=django.db.models.deletion.CASCADE, related_name='post_tags', to='kunnic.post', verbose_name='Post')),
+                ('tag', models.ForeignKey(help_text='Tag of the post', on_delete=django.db.models.deletion.CASCADE, related_name='post_tags', to='kunnic.tag', verbose_name='Tag')),
+            ],
+            options={
+                'verbose_name': 'Post Tag',
+                'verbose_name_plural': 'Post Tags',
+            },
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='tags',
+            field=models.ManyToManyField(blank=True, help_text='Tags of the post', related_name='posts', through='kunnic.PostTag', to='kunnic.tag', verbose_name='Tags'),
+        ),
+        migrations.AddIndex(
+            model_name='posttag',
+            index=models.Index(condition=models.Q(('is_published', True)), fields=['tag', '-published_at', '-post'], name='posttag_tag_keyset_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='posttag',
+            constraint=models.UniqueConstraint(fields=('post', 'tag'), name='posttag_unique'),
+        ),
+        migrations.RunPython(count_months, migrations.RunPython.noop),
+    ]
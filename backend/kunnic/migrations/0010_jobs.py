@@ -0,0 +1,40 @@
+# Generated by Django 5.2.4 on 2026-10-17 18:07
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('kunnic', '0009_tags_archive'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Job',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(help_text="Task name in KUNNIC_JOBS['TASKS']", max_length=100, verbose_name='Kind')),
+                ('args', models.JSONField(blank=True, default=dict, help_text='Keyword arguments for the task', verbose_name='Arguments')),
+                ('key', models.CharField(editable=False, help_text='Kind and arguments; one queued job per key', max_length=255, verbose_name='Key')),
+                ('status', models.CharField(choices=[('queued', 'Queued'), ('running', 'Running'), ('done', 'Done'), ('failed', 'Failed')], default='queued', help_text='Where the job is in its life', max_length=10, verbose_name='Status')),
+                ('attempts', models.PositiveSmallIntegerField(default=0, help_text='Times a worker has claimed the job', verbose_name='Attempts')),
+                ('max_attempts', models.PositiveSmallIntegerField(default=5, help_text='Attempts before the job is given up on', verbose_name='Max Attempts')),
+                ('run_at', models.DateTimeField(default=django.utils.timezone.now, help_text='When the job is next due', verbose_name='Run At')),
+                ('worker', models.CharField(blank=True, help_text='Worker that claimed the job last', max_length=100, verbose_name='Worker')),
+                ('error', models.TextField(blank=True, help_text='Error of the last failed attempt', verbose_name='Error')),
+                ('result', models.JSONField(blank=True, help_text='What the task returned', null=True, verbose_name='Result')),
+                ('created_at', models.DateTimeField(auto_now_add=True, help_text='Date and time when the job was queued', verbose_name='Created At')),
+                ('started_at', models.DateTimeField(blank=True, help_text='Date and time when the last attempt started', null=True, verbose_name='Started At')),
+                ('finished_at', models.DateTimeField(blank=True, help_text='Date and time when the job was done or given up on', null=True, verbose_name='Finished At')),
+            ],
+            options={
+                'verbose_name': 'Job',
+                'verbose_name_plural': 'Jobs',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(condition=models.Q(('status__in', ['queued', 'running'])), fields=['run_at', 'id'], name='job_due_idx')],
+                'constraints': [models.UniqueConstraint(condition=models.Q(('status', 'queued')), fields=('key',), name='job_queued_unique')],
+            },
+        ),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 5.2.4 on 2026-10-17 18:12
+
+import django.db.models.deletion
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('kunnic', '0010_jobs'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Upload',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('target', models.CharField(help_text='Route basename of the endpoint the file is for', max_length=50, verbose_name='Target')),
+                ('filename', models.CharField(help_text='Name of the file on the client', max_length=255, verbose_name='File Name')),
+                ('size', models.PositiveBigIntegerField(help_text='Size of the whole file in bytes', verbose_name='Size')),
+                ('chunk_size', models.PositiveIntegerField(help_text='Size of every chunk but the last in bytes', verbose_name='Chunk Size')),
+                ('checksum', models.CharField(blank=True, help_text="Optional checksum of the whole file, e.g. 'sha256 <base64>'", max_length=200, verbose_name='Checksum')),
+                ('created_at', models.DateTimeField(auto_now_add=True, help_text='Date and time when the upload was started', verbose_name='Created At')),
+                ('expires_at', models.DateTimeField(help_text='When an unfinished upload is thrown away', verbose_name='Expires At')),
+                ('committed_at', models.DateTimeField(blank=True, help_text='Set while the upload is being committed', null=True, verbose_name='Committed At')),
+                ('owner', models.ForeignKey(help_text='User sending the file', on_delete=django.db.models.deletion.CASCADE, related_name='uploads', to=settings.AUTH_USER_MODEL, verbose_name='Owner')),
+            ],
+            options={
+                'verbose_name': 'Upload',
+                'verbose_name_plural': 'Uploads',
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='UploadChunk',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('index', models.PositiveIntegerField(help_text='Position of the chunk, from 0', verbose_name='Index')),
+                ('checksum', models.CharField(help_text='Checksum the chunk was verified against', max_length=200, verbose_name='Checksum')),
+                ('received_at', models.DateTimeField(auto_now=True, help_text='Date and time when the chunk was last written', verbose_name='Received At')),
+                ('upload', models.ForeignKey(help_text='Upload the chunk belongs to', on_delete=django.db.models.deletion.CASCADE, related_name='chunks', to='kunnic.upload', verbose_name='Upload')),
+            ],
+            options={
+                'verbose_name': 'Upload Chunk',
+                'verbose_name_plural': 'Upload Chunks',
+                'constraints': [models.UniqueConstraint(fields=('upload', 'index'), name='uploadchunk_unique')],
+            },
+        ),
+    ]
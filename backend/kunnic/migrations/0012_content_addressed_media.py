@@ -0,0 +1,44 @@
+# Generated by Django 5.2.4 on 2026-10-17 18:19
+
+import kunnic.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('kunnic', '0011_uploads'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MediaFile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(help_text='Stored name of the file, from its SHA-256', max_length=255, unique=True, verbose_name='Name')),
+                ('size', models.PositiveBigIntegerField(help_text='Size of the file in bytes', verbose_name='Size')),
+                ('refs', models.PositiveIntegerField(default=0, help_text='Number of rows and derivatives using the file; it is deleted at 0', verbose_name='References')),
+                ('created_at', models.DateTimeField(auto_now_add=True, help_text='Date and time when the file was first stored', verbose_name='Created At')),
+            ],
+            options={
+                'verbose_name': 'Media File',
+                'verbose_name_plural': 'Media Files',
+                'ordering': ['name'],
+            },
+        ),
+        migrations.AlterField(
+            model_name='galleryimage',
+            name='image',
+            field=models.ImageField(help_text='Image for the gallery', storage=kunnic.storage.get_media_storage, upload_to='gallery/', verbose_name='Image'),
+        ),
+        migrations.AlterField(
+            model_name='song',
+            name='audio_file',
+            field=models.FileField(help_text='Audio file of the song', storage=kunnic.storage.get_media_storage, upload_to='songs/', verbose_name='Audio File'),
+        ),
+        migrations.AlterField(
+            model_name='song',
+            name='peaks_file',
+            field=models.FileField(blank=True, editable=False, help_text='Precomputed waveform peaks for the audio file', storage=kunnic.storage.get_media_storage, upload_to='songs/peaks/', verbose_name='Peaks File'),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.4 on 2026-10-17 18:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('kunnic', '0012_content_addressed_media'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Generation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('label', models.CharField(help_text='Model the generation belongs to, e.g. kunnic.post', max_length=100, unique=True, verbose_name='Label')),
+                ('value', models.BigIntegerField(help_text='When a row of the model last changed, in nanoseconds since the epoch', verbose_name='Value')),
+            ],
+            options={
+                'verbose_name': 'Generation',
+                'verbose_name_plural': 'Generations',
+                'ordering': ['label'],
+            },
+        ),
+    ]
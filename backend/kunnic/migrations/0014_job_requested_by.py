@@ -0,0 +1,21 @@
+# Generated by Django 5.2.4 on 2026-10-17 18:39
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('kunnic', '0013_cache_generations'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='job',
+            name='requested_by',
+            field=models.ForeignKey(blank=True, help_text='User whose request queued the job; only they and staff see its status', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='jobs', to=settings.AUTH_USER_MODEL, verbose_name='Requested By'),
+        ),
+    ]
@@ -1,9 +1,33 @@
+import uuid
+
 from django.db import models
 from django.contrib.auth.models import User
 from django.utils.text import slugify
 from django.utils import timezone
+
+from kunnic.slugs import unique_slugs
+from kunnic.storage import get_media_storage
 # Create your models here.
 
+class Tag(models.Model):
+    name = models.CharField(max_length=100, unique=True, verbose_name="Name", help_text="Name of the tag")
+    slug = models.SlugField(max_length=100, unique=True, verbose_name="Slug", help_text="Unique identifier for the tag")
+    # Published posts, kept current by kunnic/signals.py and kunnic/archive.py.
+    post_count = models.PositiveIntegerField(default=0, editable=False, verbose_name="Post Count", help_text="Number of published posts with the tag")
+
+    class Meta:
+        ordering = ['name']
+        verbose_name = "Tag"
+        verbose_name_plural = "Tags"
+
+    def __str__(self):
+        return self.name
+
+    def save(self, *args, **kwargs):
+        if not self.slug:
+            self.slug = unique_slugs(Tag, [slugify(self.name)], exclude_pk=self.pk)[0]
+        super().save(*args, **kwargs)
+
 class Post(models.Model):
     title = models.CharField(max_length=200, verbose_name="Title", help_text="Title of the post")
     slug = models.SlugField(max_length=200, unique=True, verbose_name="Slug", help_text="Unique identifier for the post")
@@ -19,9 +43,15 @@ class Post(models.Model):
         verbose_name="Author",
         help_text="Author of the post"
     )
+    # Approved comments, kept current by kunnic/signals.py and kunnic/moderation.py.
+    comment_count = models.PositiveIntegerField(default=0, editable=False, verbose_name="Comment Count", help_text="Number of approved comments on the post")
+    tags = models.ManyToManyField(Tag, through='PostTag', related_name='posts', blank=True, verbose_name="Tags", help_text="Tags of the post")
 
     class Meta:
         ordering = ['-published_at']
+        indexes = [
+            models.Index(fields=['is_published', '-published_at', '-id'], name='post_published_keyset_idx'),
+        ]
         verbose_name = "Post"
         verbose_name_plural = "Posts"
 
@@ -30,19 +60,66 @@ class Post(models.Model):
 
     def save(self, *args, **kwargs):
         if not self.slug:
-            self.slug = slugify(self.title)
+            self.slug = unique_slugs(Post, [slugify(self.title)], exclude_pk=self.pk)[0]
         super().save(*args, **kwargs)
 
+class PostTag(models.Model):
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='post_tags', verbose_name="Post", help_text="Tagged post")
+    tag = models.ForeignKey(Tag, on_delete=models.CASCADE, related_name='post_tags', verbose_name="Tag", help_text="Tag of the post")
+    # Copies of the post's, kept current by kunnic/signals.py, so a tag's
+    # published posts page straight off posttag_tag_keyset_idx.
+    is_published = models.BooleanField(default=False, editable=False, verbose_name="Is Published", help_text="Whether the tagged post is published")
+    published_at = models.DateTimeField(null=True, editable=False, verbose_name="Published At", help_text="Publication date of the tagged post")
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['post', 'tag'], name='posttag_unique'),
+        ]
+        indexes = [
+            models.Index(fields=['tag', '-published_at', '-post'], condition=models.Q(is_published=True), name='posttag_tag_keyset_idx'),
+        ]
+        verbose_name = "Post Tag"
+        verbose_name_plural = "Post Tags"
+
+    def __str__(self):
+        return f"{self.tag} on {self.post}"
+
+class ArchiveMonth(models.Model):
+    # Calendar months in TIME_ZONE; kept current by kunnic/signals.py and kunnic/archive.py.
+    year = models.PositiveSmallIntegerField(verbose_name="Year", help_text="Year of publication")
+    month = models.PositiveSmallIntegerField(verbose_name="Month", help_text="Month of publication, 1 to 12")
+    post_count = models.PositiveIntegerField(default=0, verbose_name="Post Count", help_text="Number of published posts in the month")
+
+    class Meta:
+        ordering = ['-year', '-month']
+        constraints = [
+            models.UniqueConstraint(fields=['year', 'month'], name='archivemonth_unique'),
+        ]
+        verbose_name = "Archive Month"
+        verbose_name_plural = "Archive Months"
+
+    def __str__(self):
+        return f"{self.year}-{self.month:02d}"
+
 class Song(models.Model):
     title = models.CharField(max_length=200, verbose_name="Title", help_text="Title of the song")
     artist = models.CharField(max_length=100, verbose_name="Artist", help_text="Artist of the song")
-    audio_file = models.FileField(upload_to='songs/', verbose_name="Audio File", help_text="Audio file of the song")
+    audio_file = models.FileField(upload_to='songs/', storage=get_media_storage, verbose_name="Audio File", help_text="Audio file of the song")
     lyrics = models.TextField(blank=True, null=True, verbose_name="Lyrics", help_text="Lyrics of the song")
     release_date = models.DateField(verbose_name="Release Date", help_text="Release date of the song")
     upload_date = models.DateTimeField(auto_now_add=True, verbose_name="Created At", help_text="Date and time when the song was created")
+    # Filled from audio_file on save (see kunnic/audio.py).
+    duration = models.FloatField(null=True, blank=True, editable=False, verbose_name="Duration", help_text="Length of the song in seconds")
+    sample_rate = models.PositiveIntegerField(null=True, blank=True, editable=False, verbose_name="Sample Rate", help_text="Sample rate of the audio file in Hz")
+    channels = models.PositiveSmallIntegerField(null=True, blank=True, editable=False, verbose_name="Channels", help_text="Number of audio channels")
+    bitrate = models.PositiveIntegerField(null=True, blank=True, editable=False, verbose_name="Bitrate", help_text="Average bitrate of the audio file in bits per second")
+    peaks_file = models.FileField(upload_to='songs/peaks/', storage=get_media_storage, blank=True, editable=False, verbose_name="Peaks File", help_text="Precomputed waveform peaks for the audio file")
 
     class Meta:
         ordering = ['-release_date']
+        indexes = [
+            models.Index(fields=['-release_date', '-id'], name='song_release_keyset_idx'),
+        ]
         verbose_name = "Song"
         verbose_name_plural = "Songs"
 
@@ -50,12 +127,20 @@ class Song(models.Model):
         return f"{self.title} by {self.artist}" if self.artist else self.title
 
 class GalleryImage(models.Model):
-    image = models.ImageField(upload_to='gallery/', verbose_name="Image", help_text="Image for the gallery")
+    image = models.ImageField(upload_to='gallery/', storage=get_media_storage, verbose_name="Image", help_text="Image for the gallery")
     caption = models.CharField(max_length=255, blank=True, null=True, verbose_name="Caption", help_text="Caption for the image")
     upload_date = models.DateTimeField(auto_now_add=True, verbose_name="Upload Date", help_text="Date and time when the image was uploaded")
+    # Filled from image on save (see kunnic/images.py).
+    width = models.PositiveIntegerField(null=True, blank=True, editable=False, verbose_name="Width", help_text="Width of the original image in pixels")
+    height = models.PositiveIntegerField(null=True, blank=True, editable=False, verbose_name="Height", help_text="Height of the original image in pixels")
+    placeholder = models.CharField(max_length=64, blank=True, editable=False, verbose_name="Placeholder", help_text="BlurHash shown while the image loads")
+    derivatives = models.JSONField(default=dict, blank=True, editable=False, verbose_name="Derivatives", help_text="Resized copies of the image by format and width")
 
     class Meta:
         ordering = ['-upload_date']
+        indexes = [
+            models.Index(fields=['-upload_date', '-id'], name='gallery_upload_keyset_idx'),
+        ]
         verbose_name = "Gallery Image"
         verbose_name_plural = "Gallery Images"
 
@@ -66,12 +151,134 @@ class Comment(models.Model):
     post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='comments', verbose_name="Post", help_text="Post to which the comment belongs")
     author = models.CharField(max_length=500, verbose_name="Author", help_text="Name of the comment author")
     content = models.TextField(verbose_name="Content", help_text="Content of the comment")
+    is_approved = models.BooleanField(default=True, verbose_name="Is Approved", help_text="Indicates if the comment is shown publicly")
     created_at = models.DateTimeField(auto_now_add=True, verbose_name="Created At", help_text="Date and time when the comment was created")
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['post', '-created_at', '-id'], name='comment_thread_keyset_idx'),
+        ]
         verbose_name = "Comment"
         verbose_name_plural = "Comments"
 
     def __str__(self):
-        return f"Comment by {self.author} on {self.post.title}"
\ No newline at end of file
+        return f"Comment by {self.author} on {self.post.title}"
+
+class Job(models.Model):
+    # Background work run by "manage.py runworker" (see kunnic/jobs.py).
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUSES = [
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    ]
+
+    kind = models.CharField(max_length=100, verbose_name="Kind", help_text="Task name in KUNNIC_JOBS['TASKS']")
+    args = models.JSONField(default=dict, blank=True, verbose_name="Arguments", help_text="Keyword arguments for the task")
+    key = models.CharField(max_length=255, editable=False, verbose_name="Key", help_text="Kind and arguments; one queued job per key")
+    status = models.CharField(max_length=10, choices=STATUSES, default=QUEUED, verbose_name="Status", help_text="Where the job is in its life")
+    attempts = models.PositiveSmallIntegerField(default=0, verbose_name="Attempts", help_text="Times a worker has claimed the job")
+    max_attempts = models.PositiveSmallIntegerField(default=5, verbose_name="Max Attempts", help_text="Attempts before the job is given up on")
+    # When a queued job is due, or when a running job's lease runs out and
+    # another worker may claim it.
+    run_at = models.DateTimeField(default=timezone.now, verbose_name="Run At", help_text="When the job is next due")
+    worker = models.CharField(max_length=100, blank=True, verbose_name="Worker", help_text="Worker that claimed the job last")
+    error = models.TextField(blank=True, verbose_name="Error", help_text="Error of the last failed attempt")
+    result = models.JSONField(null=True, blank=True, verbose_name="Result", help_text="What the task returned")
+    requested_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='jobs', verbose_name="Requested By", help_text="User whose request queued the job; only they and staff see its status")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Created At", help_text="Date and time when the job was queued")
+    started_at = models.DateTimeField(null=True, blank=True, verbose_name="Started At", help_text="Date and time when the last attempt started")
+    finished_at = models.DateTimeField(null=True, blank=True, verbose_name="Finished At", help_text="Date and time when the job was done or given up on")
+
+    class Meta:
+        ordering = ['-created_at']
+        constraints = [
+            models.UniqueConstraint(fields=['key'], condition=models.Q(status='queued'), name='job_queued_unique'),
+        ]
+        indexes = [
+            models.Index(fields=['run_at', 'id'], condition=models.Q(status__in=['queued', 'running']), name='job_due_idx'),
+        ]
+        verbose_name = "Job"
+        verbose_name_plural = "Jobs"
+
+    def __str__(self):
+        return f"{self.kind} #{self.pk} ({self.status})"
+
+class Upload(models.Model):
+    # A resumable upload in progress (see kunnic/uploads.py); deleted once committed.
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    owner = models.ForeignKey(User, on_delete=models.CASCADE, related_name='uploads', verbose_name="Owner", help_text="User sending the file")
+    target = models.CharField(max_length=50, verbose_name="Target", help_text="Route basename of the endpoint the file is for")
+    filename = models.CharField(max_length=255, verbose_name="File Name", help_text="Name of the file on the client")
+    size = models.PositiveBigIntegerField(verbose_name="Size", help_text="Size of the whole file in bytes")
+    chunk_size = models.PositiveIntegerField(verbose_name="Chunk Size", help_text="Size of every chunk but the last in bytes")
+    checksum = models.CharField(max_length=200, blank=True, verbose_name="Checksum", help_text="Optional checksum of the whole file, e.g. 'sha256 <base64>'")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Created At", help_text="Date and time when the upload was started")
+    expires_at = models.DateTimeField(verbose_name="Expires At", help_text="When an unfinished upload is thrown away")
+    committed_at = models.DateTimeField(null=True, blank=True, verbose_name="Committed At", help_text="Set while the upload is being committed")
+
+    class Meta:
+        ordering = ['-created_at']
+        verbose_name = "Upload"
+        verbose_name_plural = "Uploads"
+
+    def __str__(self):
+        return f"{self.filename} ({self.target})"
+
+    @property
+    def chunk_count(self):
+        return max(1, -(-self.size // self.chunk_size))
+
+    def chunk_range(self, index):
+        """``(offset, length)`` of chunk ``index``."""
+        offset = index * self.chunk_size
+        return offset, min(self.chunk_size, self.size - offset)
+
+class UploadChunk(models.Model):
+    upload = models.ForeignKey(Upload, on_delete=models.CASCADE, related_name='chunks', verbose_name="Upload", help_text="Upload the chunk belongs to")
+    index = models.PositiveIntegerField(verbose_name="Index", help_text="Position of the chunk, from 0")
+    checksum = models.CharField(max_length=200, verbose_name="Checksum", help_text="Checksum the chunk was verified against")
+    received_at = models.DateTimeField(auto_now=True, verbose_name="Received At", help_text="Date and time when the chunk was last written")
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['upload', 'index'], name='uploadchunk_unique'),
+        ]
+        verbose_name = "Upload Chunk"
+        verbose_name_plural = "Upload Chunks"
+
+    def __str__(self):
+        return f"Chunk {self.index} of {self.upload}"
+
+class MediaFile(models.Model):
+    # A file in content-addressed media storage (see kunnic/storage.py).
+    name = models.CharField(max_length=255, unique=True, verbose_name="Name", help_text="Stored name of the file, from its SHA-256")
+    size = models.PositiveBigIntegerField(verbose_name="Size", help_text="Size of the file in bytes")
+    refs = models.PositiveIntegerField(default=0, verbose_name="References", help_text="Number of rows and derivatives using the file; it is deleted at 0")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Created At", help_text="Date and time when the file was first stored")
+
+    class Meta:
+        ordering = ['name']
+        verbose_name = "Media File"
+        verbose_name_plural = "Media Files"
+
+    def __str__(self):
+        return self.name
+
+class Generation(models.Model):
+    # A model's cache generation when the API cache isn't shared between processes (see kunnic/cache.py).
+    label = models.CharField(max_length=100, unique=True, verbose_name="Label", help_text="Model the generation belongs to, e.g. kunnic.post")
+    value = models.BigIntegerField(verbose_name="Value", help_text="When a row of the model last changed, in nanoseconds since the epoch")
+
+    class Meta:
+        ordering = ['label']
+        verbose_name = "Generation"
+        verbose_name_plural = "Generations"
+
+    def __str__(self):
+        return f"{self.label} ({self.value})"
@@ -0,0 +1,71 @@
+"""
+Comment counts and set-based comment moderation.
+
+``Post.comment_count`` holds the number of approved comments. Single saves
+and deletes adjust it with ``F()`` from ``kunnic/signals.py``.
+:func:`moderate` approves, hides or deletes any number of comments with a
+single ``UPDATE`` or ``DELETE``. It then recounts the affected posts in one
+``UPDATE`` and does the cache and search bookkeeping once, where the
+signals would have done it per comment.
+"""
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from kunnic.cache import bump_generation
+from kunnic.models import Comment, Post
+from kunnic.search import doc_id, get_backend
+
+ACTIONS = ('approve', 'hide', 'delete')
+
+
+def adjust_comment_count(post_id, delta):
+    Post.objects.filter(pk=post_id).update(comment_count=F('comment_count') + delta)
+
+
+def refresh_comment_counts(post_ids=None):
+    """Recount approved comments for ``post_ids`` (every post if ``None``) in one query."""
+    approved = (
+        Comment.objects.filter(post=OuterRef('pk'), is_approved=True)
+        .order_by().values('post').annotate(total=Count('pk')).values('total')
+    )
+    posts = Post.objects.all() if post_ids is None else Post.objects.filter(pk__in=post_ids)
+    return posts.update(comment_count=Coalesce(Subquery(approved), 0))
+
+
+def moderate(comments, action):
+    """
+    Apply ``action`` (one of :data:`ACTIONS`) to the ``comments`` queryset.
+    Returns the number of comments changed.
+    """
+    if action not in ACTIONS:
+        raise ValueError(f'Unknown moderation action {action!r}')
+    comments = comments.order_by()
+    if action == 'approve':
+        comments = comments.filter(is_approved=False)
+    elif action == 'hide':
+        comments = comments.filter(is_approved=True)
+
+    with transaction.atomic():
+        ids = list(comments.values_list('pk', flat=True))
+        if not ids:
+            return 0
+        changed = Comment.objects.filter(pk__in=ids)
+        post_ids = set(changed.values_list('post_id', flat=True).distinct())
+        if action == 'delete':
+            # One DELETE, without the collector and a post_delete per row;
+            # nothing references comments, and the bookkeeping is done below.
+            count = changed._raw_delete(changed.db)
+        else:
+            count = changed.update(is_approved=action == 'approve')
+        refresh_comment_counts(post_ids)
+
+        backend = get_backend()
+        if backend is not None:
+            if action == 'approve':
+                backend.index_many(changed.select_related('post').iterator(chunk_size=1000))
+            else:
+                backend.delete([doc_id('comment', pk) for pk in ids])
+    bump_generation(Comment)
+    bump_generation(Post)
+    return count
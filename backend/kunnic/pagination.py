@@ -0,0 +1,308 @@
+import base64
+import json
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+def positive_int(value, strict=False, cutoff=None):
+    """
+    ``value`` as an int, at least 1 with ``strict`` and at least 0 without,
+    capped at ``cutoff``. Raises ``ValueError`` otherwise.
+    """
+    number = int(value)
+    if number < 0 or (strict and number == 0):
+        raise ValueError(value)
+    if cutoff is not None:
+        number = min(number, cutoff)
+    return number
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination keyed on the model's ``Meta.ordering`` field with ``id``
+    as a tiebreaker, e.g. ``(published_at, id)`` for posts.
+
+    Each page is a single indexed range scan (``WHERE (key, id) < (x, y)
+    ORDER BY key, id LIMIT n + 1``), so page N costs the same as page 1 and
+    no ``COUNT(*)`` is ever issued. Views can override the key with a
+    ``keyset_ordering`` attribute such as ``'-published_at'``, and point the
+    key and tiebreak at aliases of a joined copy with ``keyset_lookups``,
+    e.g. ``('tagged_at', 'tagged_post')``, to seek on that table's index
+    instead.
+    """
+    cursor_query_param = 'cursor'
+    page_size = api_settings.PAGE_SIZE
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    tiebreak_field = 'id'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.field_name, self.descending = self.get_ordering(queryset, view)
+        self.field = queryset.model._meta.get_field(self.field_name)
+
+        cursor = self.decode_cursor(request)
+        reverse = cursor[2] if cursor else False
+
+        key, tiebreak = getattr(view, 'keyset_lookups', None) or (self.field_name, self.tiebreak_field)
+
+        # Scanning backwards (for a "previous" link) flips the direction.
+        scan_descending = self.descending != reverse
+        prefix = '-' if scan_descending else ''
+        queryset = queryset.order_by(prefix + key, prefix + tiebreak)
+
+        if cursor is not None:
+            value, pk, _ = cursor
+            op = 'lt' if scan_descending else 'gt'
+            # The outer bound on the key alone lets the composite index seek
+            # straight to the cursor position before the tiebreak is applied.
+            queryset = queryset.filter(
+                Q(**{f'{key}__{op}e': value}),
+                Q(**{f'{key}__{op}': value}) | Q(**{f'{tiebreak}__{op}': pk}),
+            )
+
+        results = list(queryset[:self.page_size + 1])
+        has_more = len(results) > self.page_size
+        results = results[:self.page_size]
+
+        if reverse:
+            results.reverse()
+            self.has_next = True
+            self.has_previous = has_more
+        else:
+            self.has_next = has_more
+            self.has_previous = cursor is not None
+
+        self.page = results
+        return results
+
+    def get_ordering(self, queryset, view):
+        ordering = getattr(view, 'keyset_ordering', None)
+        if ordering is None:
+            ordering = queryset.model._meta.ordering[0]
+        return ordering.lstrip('-'), ordering.startswith('-')
+
+    def get_page_size(self, request):
+        if self.page_size_query_param:
+            try:
+                return positive_int(
+                    request.query_params[self.page_size_query_param],
+                    strict=True,
+                    cutoff=self.max_page_size
+                )
+            except (KeyError, ValueError):
+                pass
+        return self.page_size
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            value, pk, reverse = json.loads(base64.urlsafe_b64decode(encoded.encode('ascii')))
+            return self.field.to_python(value), int(pk), bool(reverse)
+        except (TypeError, ValueError, ValidationError, UnicodeError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, obj, reverse):
+        payload = [self.field.value_to_string(obj), getattr(obj, self.tiebreak_field), int(reverse)]
+        encoded = base64.urlsafe_b64encode(json.dumps(payload).encode('ascii')).decode('ascii')
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        return self.encode_cursor(self.page[0], reverse=True)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+
+class CommentPagination(KeysetPagination):
+    """
+    Newest-first cursor pages over one post's thread, seeking on
+    ``comment_thread_keyset_idx`` (``post_id, created_at, id``).
+    """
+    page_size = 20
+
+    def get_ordering(self, queryset, view):
+        return 'created_at', True
+
+
+class KunnicPagination(PageNumberPagination):
+    """
+    Default pagination for the kunnic API.
+
+    Plain requests keep the ``PageNumberPagination`` shape the frontend uses.
+    Clients can opt in to cheaper shapes without changing endpoints:
+
+    * ``?pagination=cursor`` (or any ``?cursor=``) switches to
+      :class:`KeysetPagination`;
+    * ``?count=false`` keeps page numbers but skips the ``COUNT(*)`` and
+      drops ``count`` from the response, probing one extra row for ``next``.
+    """
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    mode_query_param = 'pagination'
+    count_query_param = 'count'
+    keyset_class = KeysetPagination
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.keyset = None
+        self.include_count = True
+        self.total = None
+        self.display_page_controls = False
+
+        if self.wants_keyset(request):
+            self.keyset = self.keyset_class()
+            self.keyset.max_page_size = self.max_page_size
+            return self.keyset.paginate_queryset(queryset, request, view)
+
+        if request.query_params.get(self.count_query_param, '').lower() in ('0', 'false', 'no'):
+            self.include_count = False
+            return self.paginate_without_count(queryset, request)
+
+        return super().paginate_queryset(queryset, request, view)
+
+    def wants_keyset(self, request):
+        return (
+            self.keyset_class.cursor_query_param in request.query_params
+            or request.query_params.get(self.mode_query_param) == 'cursor'
+        )
+
+    def paginate_without_count(self, queryset, request):
+        self.request = request
+        page_size = self.get_page_size(request)
+        if not page_size:
+            return None
+
+        # Only ?page=last needs a count.
+        count = queryset.count() if self.wants_last_page(request) else None
+        offset = self.get_offset(request, page_size, count)
+        return self.trim_page(list(queryset[offset:offset + page_size + 1]), page_size)
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        """
+        Page-number pagination on the async ORM, with or without ``count``.
+        Keyset requests stay on the sync path (see ``kunnic/async_views.py``).
+        """
+        self.keyset = None
+        self.include_count = False
+        self.total = None
+        self.request = request
+        page_size = self.get_page_size(request)
+        if not page_size:
+            return None
+
+        count = None
+        if request.query_params.get(self.count_query_param, '').lower() not in ('0', 'false', 'no'):
+            count = self.total = await queryset.acount()
+        elif self.wants_last_page(request):
+            count = await queryset.acount()
+        offset = self.get_offset(request, page_size, count)
+        results = [obj async for obj in queryset[offset:offset + page_size + 1]]
+        return self.trim_page(results, page_size)
+
+    def wants_last_page(self, request):
+        return request.query_params.get(self.page_query_param) in self.last_page_strings
+
+    def get_offset(self, request, page_size, count=None):
+        """Offset of the requested page; ``count`` resolves ``?page=last`` as DRF does."""
+        page_number = request.query_params.get(self.page_query_param) or 1
+        if page_number in self.last_page_strings and count is not None:
+            page_number = max(1, -(-count // page_size))
+        try:
+            self.page_number = positive_int(page_number, strict=True)
+        except ValueError:
+            raise NotFound(self.invalid_page_message.format(
+                page_number=request.query_params.get(self.page_query_param), message='Invalid page.'
+            ))
+        return (self.page_number - 1) * page_size
+
+    def trim_page(self, results, page_size):
+        if not results and self.page_number > 1:
+            raise NotFound(self.invalid_page_message.format(
+                page_number=self.page_number, message='That page contains no results'
+            ))
+        self.has_next = len(results) > page_size
+        return results[:page_size]
+
+    def get_paginated_response(self, data):
+        if self.keyset is not None:
+            return self.keyset.get_paginated_response(data)
+        if not self.include_count:
+            return Response(self.get_paginated_data(data))
+        return super().get_paginated_response(data)
+
+    def get_paginated_data(self, data):
+        # Count-free and async pages; the latter may carry a separate count.
+        payload = {
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        }
+        if self.total is not None:
+            payload = {'count': self.total, **payload}
+        return payload
+
+    def get_next_link(self):
+        if self.include_count:
+            return super().get_next_link()
+        if not self.has_next:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.page_query_param, self.page_number + 1)
+
+    def get_previous_link(self):
+        if self.include_count:
+            return super().get_previous_link()
+        if self.page_number <= 1:
+            return None
+        url = self.request.build_absolute_uri()
+        if self.page_number == 2:
+            return remove_query_param(url, self.page_query_param)
+        return replace_query_param(url, self.page_query_param, self.page_number - 1)
+
+
+class SearchPagination(KunnicPagination):
+    """
+    Page numbers (with or without ``count``) for relevance-ranked results,
+    which have no stable key to seek on.
+    """
+
+    def wants_keyset(self, request):
+        return False
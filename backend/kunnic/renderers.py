@@ -0,0 +1,67 @@
+"""
+JSON rendering and parsing on orjson.
+
+:class:`FastJSONRenderer` and :class:`FastJSONParser` are drop-in
+replacements for DRF's ``JSONRenderer`` and ``JSONParser`` and produce the
+same bytes. Objects orjson doesn't know (lazy strings, decimals, datetimes
+outside a serializer) go through DRF's ``JSONEncoder.default``, and
+``\\u2028``/``\\u2029`` are escaped the same way. Anything the fast path
+can't reproduce exactly falls back to the stdlib: indented output (the
+browsable API, ``; indent=``), non-default ``UNICODE_JSON``/``COMPACT_JSON``
+settings, integers wider than 64 bits and non-UTF-8 request bodies.
+
+Two known differences remain: floats in exponent form are written as
+``1e16`` rather than ``1e+16``, and NaN/Infinity render as ``null`` instead
+of raising. Neither comes out of the kunnic models.
+
+Without the ``orjson`` package both classes behave exactly like DRF's.
+"""
+from django.conf import settings
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+if orjson is not None:
+    OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS
+
+UNSAFE = (b'\xe2\x80\xa8', b'\\u2028'), (b'\xe2\x80\xa9', b'\\u2029')
+
+
+class FastJSONRenderer(JSONRenderer):
+    encoder = JSONEncoder()
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if (
+            orjson is None or self.ensure_ascii or not self.compact or not self.strict
+            or self.get_indent(accepted_media_type, renderer_context or {}) is not None
+        ):
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            ret = orjson.dumps(data, default=self.encoder.default, option=OPTIONS)
+        except orjson.JSONEncodeError:
+            return super().render(data, accepted_media_type, renderer_context)
+        if b'\xe2\x80' in ret:
+            for char, escaped in UNSAFE:
+                ret = ret.replace(char, escaped)
+        return ret
+
+
+class FastJSONParser(JSONParser):
+    renderer_class = FastJSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        encoding = (parser_context or {}).get('encoding', settings.DEFAULT_CHARSET)
+        if orjson is None or not self.strict or encoding.lower().replace('-', '') != 'utf8':
+            return super().parse(stream, media_type, parser_context)
+        try:
+            return orjson.loads(stream.read())
+        except orjson.JSONDecodeError as exc:
+            raise ParseError('JSON parse error - %s' % str(exc))
@@ -0,0 +1,266 @@
+"""
+Full-text search over published posts, songs and approved comments.
+
+Every searchable object is one row of the ``kunnic_search`` index with a
+``title`` and a ``body`` column, keyed by ``object_id * 4 + kind`` so a
+row is found by primary key without an extra lookup table. The index is
+kept current from model signals (see ``kunnic/signals.py``) and rebuilt
+with ``manage.py rebuild_search_index``.
+
+The index lives in the database itself. ``KUNNIC_SEARCH['BACKENDS']`` maps
+a connection vendor to its backend class: an FTS5 virtual table on SQLite
+and a generated ``tsvector`` column with a GIN index on PostgreSQL.
+Highlights come back HTML-escaped with matches wrapped in ``<mark>``.
+"""
+import re
+
+from django.conf import settings
+from django.db import connections
+from django.utils.html import escape, strip_tags
+from django.utils.module_loading import import_string
+
+from kunnic.models import Comment, Post, Song
+
+DEFAULTS = {
+    'BACKENDS': {
+        'sqlite': 'kunnic.search.SqliteSearchBackend',
+        'postgresql': 'kunnic.search.PostgresSearchBackend',
+    },
+    'MAX_TERMS': 16,
+}
+
+TABLE = 'kunnic_search'
+KINDS = {'post': 1, 'song': 2, 'comment': 3}
+KIND_SLOTS = 4
+# Markers the database wraps matches in; swapped for <mark> after escaping.
+START, STOP = '\x02', '\x03'
+
+
+def get_setting(name):
+    return getattr(settings, 'KUNNIC_SEARCH', {}).get(name, DEFAULTS[name])
+
+
+def get_backend(using='default'):
+    """Return the search backend for a connection, or ``None`` if its vendor has none."""
+    connection = connections[using]
+    path = get_setting('BACKENDS').get(connection.vendor)
+    return import_string(path)(connection) if path else None
+
+
+def parse_terms(query):
+    return re.findall(r'\w+', query.lower())[:get_setting('MAX_TERMS')]
+
+
+def doc_id(kind, pk):
+    return pk * KIND_SLOTS + KINDS[kind]
+
+
+def split_doc_id(value):
+    kind = next(name for name, code in KINDS.items() if code == value % KIND_SLOTS)
+    return kind, value // KIND_SLOTS
+
+
+def get_document(obj):
+    """Return ``(doc_id, title, body)`` for a searchable object, or ``None`` if hidden."""
+    if isinstance(obj, Post):
+        if not obj.is_published:
+            return None
+        return doc_id('post', obj.pk), obj.title, strip_tags(obj.content)
+    if isinstance(obj, Song):
+        return doc_id('song', obj.pk), obj.title, ' '.join(filter(None, [obj.artist, obj.lyrics]))
+    if isinstance(obj, Comment):
+        if not obj.is_approved or not obj.post.is_published:
+            return None
+        return doc_id('comment', obj.pk), obj.author, obj.content
+    raise TypeError(f'{type(obj).__name__} is not searchable')
+
+
+def render_highlight(text):
+    return escape(text or '').replace(START, '<mark>').replace(STOP, '</mark>')
+
+
+class SearchResults:
+    """
+    A lazy, sliceable result set for ``Paginator``: ``count()`` and each
+    slice run one query against the index. Hits are dicts with ``type``,
+    ``id``, ``title``, ``snippet`` and ``score``, plus ``slug`` for posts
+    and ``post_slug`` for comments.
+    """
+
+    def __init__(self, backend, terms, kinds):
+        self.backend = backend
+        self.terms = terms
+        self.kinds = kinds
+        self._count = None
+
+    def count(self):
+        if self._count is None:
+            self._count = self.backend.count(self.terms, self.kinds)
+        return self._count
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, key):
+        if not isinstance(key, slice):
+            raise TypeError('Search results only support slicing')
+        offset = key.start or 0
+        rows = self.backend.fetch(self.terms, self.kinds, offset, key.stop - offset)
+        return self.hydrate(rows)
+
+    def hydrate(self, rows):
+        hits = []
+        ids = {kind: [] for kind in KINDS}
+        for value, title, snippet, score in rows:
+            kind, pk = split_doc_id(value)
+            ids[kind].append(pk)
+            hits.append({
+                'type': kind, 'id': pk, 'title': render_highlight(title),
+                'snippet': render_highlight(snippet), 'score': score,
+            })
+        # One query per kind for the fields the result URLs need.
+        slugs = {
+            ('post', pk): slug
+            for pk, slug in Post.objects.filter(pk__in=ids['post']).values_list('pk', 'slug')
+        } if ids['post'] else {}
+        slugs.update({
+            ('comment', pk): slug
+            for pk, slug in Comment.objects.filter(pk__in=ids['comment']).values_list('pk', 'post__slug')
+        } if ids['comment'] else {})
+        for hit in hits:
+            if hit['type'] == 'post':
+                hit['slug'] = slugs.get(('post', hit['id']))
+            elif hit['type'] == 'comment':
+                hit['post_slug'] = slugs.get(('comment', hit['id']))
+        return hits
+
+
+class SearchBackend:
+    """
+    Index maintenance shared by the database backends. Subclasses provide
+    ``upsert`` and ``count``/``fetch``; the table is created by migration
+    ``0007_search_index``.
+    """
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def index(self, obj):
+        self.index_many([obj])
+
+    def index_many(self, objs):
+        rows, hidden = [], []
+        for obj in objs:
+            document = get_document(obj)
+            if document is None:
+                hidden.append(obj)
+            else:
+                rows.append(document)
+        if hidden:
+            self.remove_many(hidden)
+        if rows:
+            self.upsert(rows)
+        return len(rows)
+
+    def remove(self, obj):
+        self.remove_many([obj])
+
+    def remove_many(self, objs):
+        kinds = {Post: 'post', Song: 'song', Comment: 'comment'}
+        ids = [doc_id(kinds[type(obj)], obj.pk) for obj in objs]
+        self.delete(ids)
+
+    def delete(self, ids):
+        with self.connection.cursor() as cursor:
+            cursor.executemany(f'DELETE FROM {TABLE} WHERE {self.id_column} = %s', [(value,) for value in ids])
+
+    def clear(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {TABLE}')
+
+    def search(self, terms, kinds=None):
+        return SearchResults(self, terms, kinds)
+
+    def kind_filter(self, kinds):
+        if not kinds:
+            return '', []
+        placeholders = ', '.join(['%s'] * len(kinds))
+        return f' AND {self.id_column} %% {KIND_SLOTS} IN ({placeholders})', [KINDS[kind] for kind in kinds]
+
+
+class SqliteSearchBackend(SearchBackend):
+    """FTS5 with diacritics folded, ranked by bm25 with titles weighted 5x."""
+    id_column = 'rowid'
+
+    def upsert(self, rows):
+        self.delete([row[0] for row in rows])
+        with self.connection.cursor() as cursor:
+            cursor.executemany(f'INSERT INTO {TABLE} (rowid, title, body) VALUES (%s, %s, %s)', rows)
+
+    def match(self, terms):
+        # Quoted terms can't be read as FTS5 operators; the last one also matches as a prefix.
+        return ' '.join(f'"{term}"' for term in terms) + '*'
+
+    def count(self, terms, kinds):
+        where, params = self.kind_filter(kinds)
+        with self.connection.cursor() as cursor:
+            cursor.execute(f'SELECT COUNT(*) FROM {TABLE} WHERE {TABLE} MATCH %s{where}', [self.match(terms), *params])
+            return cursor.fetchone()[0]
+
+    def fetch(self, terms, kinds, offset, limit):
+        where, params = self.kind_filter(kinds)
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT rowid, highlight({TABLE}, 0, %s, %s), snippet({TABLE}, 1, %s, %s, '…', 24), "
+                f"-bm25({TABLE}, 5.0, 1.0) AS score "
+                f"FROM {TABLE} WHERE {TABLE} MATCH %s{where} ORDER BY score DESC, rowid LIMIT %s OFFSET %s",
+                [START, STOP, START, STOP, self.match(terms), *params, limit, offset],
+            )
+            return cursor.fetchall()
+
+
+class PostgresSearchBackend(SearchBackend):
+    """
+    A stored ``tsvector`` (title weighted A, body B) under a GIN index,
+    ranked by ``ts_rank_cd``. The ``simple`` configuration is used because
+    posts mix Vietnamese and English.
+    """
+    id_column = 'doc_id'
+    config = 'simple'
+
+    def upsert(self, rows):
+        with self.connection.cursor() as cursor:
+            cursor.executemany(
+                f'INSERT INTO {TABLE} (doc_id, title, body) VALUES (%s, %s, %s) '
+                f'ON CONFLICT (doc_id) DO UPDATE SET title = EXCLUDED.title, body = EXCLUDED.body',
+                rows,
+            )
+
+    def match(self, terms):
+        return ' & '.join(terms) + ':*'
+
+    def count(self, terms, kinds):
+        where, params = self.kind_filter(kinds)
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT COUNT(*) FROM {TABLE} WHERE document @@ to_tsquery('{self.config}', %s){where}",
+                [self.match(terms), *params],
+            )
+            return cursor.fetchone()[0]
+
+    def fetch(self, terms, kinds, offset, limit):
+        where, params = self.kind_filter(kinds)
+        options = f'StartSel={START}, StopSel={STOP}'
+        # Rank and page first; ts_headline only runs on the rows returned.
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT doc_id, ts_headline('{self.config}', title, query, %s), "
+                f"ts_headline('{self.config}', body, query, %s), score "
+                f"FROM (SELECT doc_id, title, body, ts_rank_cd(document, query) AS score, query "
+                f"FROM {TABLE}, to_tsquery('{self.config}', %s) AS query "
+                f"WHERE document @@ query{where} ORDER BY score DESC, doc_id LIMIT %s OFFSET %s) AS hits "
+                f"ORDER BY score DESC, doc_id",
+                [options + ', HighlightAll=true', options + ', MaxWords=24, MinWords=8, MaxFragments=2',
+                 self.match(terms), *params, limit, offset],
+            )
+            return cursor.fetchall()
@@ -1,34 +1,410 @@
+from operator import itemgetter
+
 from rest_framework import serializers
+from rest_framework.reverse import reverse
 from django.contrib.auth.models import User
-from kunnic.models import Post, GalleryImage, Song, Comment
+from django.core.exceptions import FieldDoesNotExist, ImproperlyConfigured
+from django.db.models import Prefetch
+from django.utils.encoding import iri_to_uri
+from django.utils.html import strip_tags
+from django.utils.text import Truncator
+from kunnic.models import ArchiveMonth, Post, GalleryImage, Job, Song, Comment, Tag, Upload
+from kunnic.moderation import ACTIONS
+from kunnic import uploads
+
+# Latest approved comments embedded per post by ?expand=comments; the
+# comments endpoint pages through the rest.
+EMBEDDED_COMMENTS = 20
+
+def parse_names(value):
+    """Names from a comma-separated query parameter, in order, once each."""
+    return list(dict.fromkeys(name for name in (part.strip() for part in (value or '').split(',')) if name))
+
+class SparseFieldsMixin:
+    """
+    Serializer taking ``fields`` and ``expand`` keyword arguments, passed from
+    ``?fields=`` and ``?expand=`` by ``SparseFieldsViewMixin`` in
+    kunnic/views.py.
+
+    ``fields`` keeps only the named fields. ``expand`` names keys of
+    ``expandable_fields``, ``{name: (field factory, prefetch lookup or
+    None)}``; each adds its field under that name, or replaces the plain one
+    (tag slugs by tag objects), and is kept whatever ``fields`` says.
+    ``field_columns`` lists the model fields read by a field whose name
+    isn't one, so the view can ``only()`` the columns a response needs.
+    """
+    expandable_fields = {}
+    field_columns = {}
+
+    def __init__(self, *args, fields=None, expand=(), **kwargs):
+        super().__init__(*args, **kwargs)
+        for name in expand:
+            self.fields[name] = self.expandable_fields[name][0]()
+        if fields is not None:
+            keep = set(fields) | set(expand)
+            for name in [name for name in self.fields if name not in keep]:
+                del self.fields[name]
+
+    @classmethod
+    def check_names(cls, fields, expand):
+        """Raise ``ValidationError`` for names the serializer doesn't have."""
+        errors = {}
+        unknown = [name for name in fields or () if name not in cls.Meta.fields and name not in cls.expandable_fields]
+        if unknown:
+            errors['fields'] = f'Unknown fields: {", ".join(unknown)}. Choose from {", ".join(cls.Meta.fields)}.'
+        unknown = [name for name in expand if name not in cls.expandable_fields]
+        if unknown:
+            choices = ', '.join(cls.expandable_fields) or 'nothing here'
+            errors['expand'] = f'Cannot expand {", ".join(unknown)}; choose from {choices}.'
+        if errors:
+            raise serializers.ValidationError(errors)
+
+    @classmethod
+    def get_field_columns(cls, fields):
+        """Concrete model fields read by ``fields``, always with the primary key."""
+        opts = cls.Meta.model._meta
+        columns = {opts.pk.name}
+        for name in fields:
+            for column in cls.field_columns.get(name, (name,)):
+                try:
+                    field = opts.get_field(column)
+                except FieldDoesNotExist:
+                    continue
+                if field.concrete and not field.many_to_many:
+                    columns.add(column)
+        return columns
+
+    @classmethod
+    def get_prefetches(cls, expand):
+        return [cls.expandable_fields[name][1] for name in expand if cls.expandable_fields[name][1] is not None]
+
+def embedded_comments():
+    return Prefetch(
+        'comments', to_attr='embedded_comments',
+        queryset=Comment.objects.filter(is_approved=True).order_by('-created_at', '-id')[:EMBEDDED_COMMENTS],
+    )
 
 class UserSerializer(serializers.ModelSerializer):
     class Meta:
         model = User
         fields = ['id', 'username', 'email']
 
-class PostSerializer(serializers.ModelSerializer):
+class TagSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Tag
+        fields = ['name', 'slug', 'post_count']
+        read_only_fields = fields
+
+class ArchiveMonthSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ArchiveMonth
+        fields = ['year', 'month', 'post_count']
+        read_only_fields = fields
+
+class PostSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    """
+    ``?expand=comments`` embeds the latest ``EMBEDDED_COMMENTS`` approved
+    comments, ``?expand=tags`` the tags' names and counts for their slugs.
+    """
     author = UserSerializer(read_only=True)
+    # Tag slugs; ModelSerializer sets them on the post after saving it.
+    tags = serializers.SlugRelatedField(many=True, slug_field='slug', queryset=Tag.objects.all(), required=False)
 
     class Meta:
         model = Post
-        fields = ['id', 'title', 'slug', 'content', 'is_published', 'published_at', 'updated_at', 'created_at', 'author']
-        read_only_fields = ['slug', 'author', 'updated_at', 'created_at']
+        fields = ['id', 'title', 'slug', 'content', 'is_published', 'comment_count', 'tags', 'published_at', 'updated_at', 'created_at', 'author']
+        read_only_fields = ['slug', 'author', 'comment_count', 'updated_at', 'created_at']
+
+    expandable_fields = {
+        'comments': (lambda: CommentSerializer(source='embedded_comments', many=True, read_only=True), embedded_comments()),
+        'tags': (lambda: TagSerializer(many=True, read_only=True), 'tags'),
+    }
+
+class PostListSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    """
+    Summary representation for the post list, expanding like ``PostSerializer``.
+
+    Expects the queryset built by ``PostViewSet.get_queryset`` for the list
+    action, which defers ``content`` and annotates ``content_head`` and
+    ``content_length`` in the same query.
+    """
+    author = UserSerializer(read_only=True)
+    tags = serializers.SlugRelatedField(many=True, slug_field='slug', read_only=True)
+    excerpt = serializers.SerializerMethodField()
+    reading_time = serializers.SerializerMethodField()
+
+    EXCERPT_LENGTH = 200
+    # Average characters per word (including the trailing space) and reading speed.
+    CHARS_PER_WORD = 6
+    WORDS_PER_MINUTE = 200
+
+    class Meta:
+        model = Post
+        fields = ['id', 'title', 'slug', 'excerpt', 'reading_time', 'comment_count', 'tags', 'published_at', 'updated_at', 'created_at', 'author']
+        read_only_fields = fields
+
+    expandable_fields = PostSerializer.expandable_fields
+
+    def get_excerpt(self, obj):
+        head = obj.content_head
+        # Drop a tag cut in half by the database-side slice.
+        if head.rfind('<') > head.rfind('>'):
+            head = head[:head.rfind('<')]
+        return Truncator(' '.join(strip_tags(head).split())).chars(self.EXCERPT_LENGTH)
+
+    def get_reading_time(self, obj):
+        words = obj.content_length / self.CHARS_PER_WORD
+        return max(1, round(words / self.WORDS_PER_MINUTE))
+
+class GalleryImageSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    """
+    ``srcset`` maps each derivative format to a ready-made ``srcset``
+    attribute, e.g. ``{"webp": ".../a-320.webp 320w, .../a-640.webp 640w"}``;
+    ``image`` stays the original upload.
+    """
+    srcset = serializers.SerializerMethodField()
 
-class GalleryImageSerializer(serializers.ModelSerializer):
     class Meta:
         model = GalleryImage
-        fields = ['id', 'image', 'caption', 'upload_date']
-        read_only_fields = ['upload_date']
+        fields = ['id', 'image', 'srcset', 'width', 'height', 'placeholder', 'caption', 'upload_date']
+        read_only_fields = ['width', 'height', 'placeholder', 'upload_date']
+
+    field_columns = {'srcset': ('derivatives',)}
+
+    def get_srcset(self, obj):
+        # The field's storage, so image needn't be loaded for srcset alone.
+        return build_srcset(obj.derivatives, GalleryImage.image.field.storage, get_absolute_url_builder(self.context.get('request')))
+
+def build_srcset(derivatives, storage, absolute):
+    srcset = {}
+    for fmt, names in derivatives.items():
+        candidates = []
+        for width, name in sorted(names.items(), key=lambda item: int(item[0])):
+            candidates.append(f'{absolute(storage.url(name))} {width}w')
+        srcset[fmt] = ', '.join(candidates)
+    return srcset
+
+def get_absolute_url_builder(request):
+    """
+    ``request.build_absolute_uri`` for many URLs. Plain absolute paths, which
+    storages return, are joined to the origin computed once.
+    """
+    if request is None:
+        return lambda url: url
+    origin = request.build_absolute_uri('/')[:-1]
+
+    def absolute(url):
+        if url.startswith('/') and not url.startswith('//') and '/./' not in url and '/../' not in url:
+            return origin + iri_to_uri(url)
+        return request.build_absolute_uri(url)
+    return absolute
+
+class SongSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    # Seekable endpoint for players; audio_file stays the raw media URL.
+    stream_url = serializers.HyperlinkedIdentityField(view_name='song-stream')
+    peaks_url = serializers.HyperlinkedIdentityField(view_name='song-peaks')
 
-class SongSerializer(serializers.ModelSerializer):
     class Meta:
         model = Song
-        fields = ['id', 'title', 'artist', 'audio_file', 'lyrics', 'release_date', 'upload_date']
-        read_only_fields = ['upload_date']
+        fields = ['id', 'title', 'artist', 'audio_file', 'stream_url', 'peaks_url', 'duration', 'sample_rate', 'channels', 'bitrate', 'lyrics', 'release_date', 'upload_date']
+        read_only_fields = ['duration', 'sample_rate', 'channels', 'bitrate', 'upload_date']
+
+class ValuesSerializer:
+    """
+    Read-only ``many=True`` stand-in for ``serializer_class`` that builds the
+    same dicts straight from ``values_list(*columns, named=True)`` rows,
+    skipping model instances and DRF's per-field ``get_attribute`` walk.
 
-class CommentSerializer(serializers.ModelSerializer):
+    Each field of ``serializer_class`` gets a plain function of the row:
+
+    * fields whose ``to_representation`` is a no-op on database values read
+      the column directly;
+    * file fields build their URL from the stored name;
+    * ``HyperlinkedIdentityField`` fills in a URL reversed once per page;
+    * ``SerializerMethodField`` calls the ``get_<field>(row)`` method here;
+    * anything else goes through the field's own ``to_representation``.
+
+    ``fields`` trims the output like ``SparseFieldsMixin``; the rows then
+    hold ``columns``, from :meth:`get_columns`.
+    """
+    serializer_class = None
+    columns = ()
+
+    # to_representation returns the database value unchanged.
+    passthrough_fields = (
+        serializers.BooleanField, serializers.CharField, serializers.FloatField,
+        serializers.IntegerField, serializers.JSONField,
+    )
+    url_placeholder = '0000000000'
+
+    def __init__(self, instance=None, many=False, context=None, fields=None, expand=(), columns=None, **kwargs):
+        self.instance = instance
+        self.context = context or {}
+        self.fields = fields
+        self.columns_read = columns
+        self.absolute = get_absolute_url_builder(self.context.get('request'))
+
+    @classmethod
+    def get_columns(cls, fields=None, keep=()):
+        """The columns ``fields`` (all if ``None``) read, plus ``keep``, in ``columns`` order."""
+        if fields is None:
+            return list(cls.columns)
+        needed = cls.serializer_class.get_field_columns(fields) | set(keep)
+        return [column for column in cls.columns if column in needed]
+
+    @classmethod
+    def check_names(cls, fields, expand):
+        cls.serializer_class.check_names(fields, expand)
+
+    @classmethod
+    def get_field_columns(cls, fields):
+        return cls.serializer_class.get_field_columns(fields)
+
+    @classmethod
+    def get_prefetches(cls, expand):
+        return cls.serializer_class.get_prefetches(expand)
+
+    @property
+    def data(self):
+        getters = list(self.get_getters().items())
+        return [{name: get(row) for name, get in getters} for row in self.instance]
+
+    def get_getters(self):
+        """``{field name: function of a row}`` in ``serializer_class`` field order."""
+        serializer = self.serializer_class(context=self.context, fields=self.fields)
+        columns = self.columns_read or self.get_columns()
+        getters = {}
+        for name, field in serializer.fields.items():
+            if field.write_only:
+                continue
+            if isinstance(field, serializers.SerializerMethodField):
+                getters[name] = getattr(self, field.method_name)
+            elif isinstance(field, serializers.HyperlinkedIdentityField):
+                getters[name] = self.get_url_getter(field, columns.index('id'))
+            elif field.source in columns:
+                getters[name] = self.get_column_getter(field, columns.index(field.source))
+            else:
+                raise ImproperlyConfigured(f'{type(self).__name__} has no column for the {name!r} field.')
+        return getters
+
+    def get_column_getter(self, field, index):
+        if isinstance(field, serializers.FileField):
+            absolute = self.absolute
+            storage = self.serializer_class.Meta.model._meta.get_field(field.source).storage
+
+            def get_file(row):
+                name = row[index]
+                return absolute(storage.url(name)) if name else None
+            return get_file
+        get = itemgetter(index)
+        if isinstance(field, self.passthrough_fields) and not isinstance(field, serializers.DecimalField):
+            return get
+        to_representation = field.to_representation
+
+        def get_value(row):
+            value = row[index]
+            return None if value is None else to_representation(value)
+        return get_value
+
+    def get_url_getter(self, field, index):
+        # One reverse() per page; rows only differ in the pk.
+        url = field.reverse(
+            field.view_name, kwargs={field.lookup_url_kwarg: self.url_placeholder},
+            request=self.context.get('request'), format=self.context.get('format'),
+        )
+        head, tail = url.split(self.url_placeholder)
+        return lambda row: f'{head}{row[index]}{tail}'
+
+class SongValuesSerializer(ValuesSerializer):
+    serializer_class = SongSerializer
+    columns = ['id', 'title', 'artist', 'audio_file', 'duration', 'sample_rate', 'channels', 'bitrate', 'lyrics', 'release_date', 'upload_date']
+
+class GalleryImageValuesSerializer(ValuesSerializer):
+    serializer_class = GalleryImageSerializer
+    columns = ['id', 'image', 'derivatives', 'width', 'height', 'placeholder', 'caption', 'upload_date']
+
+    def get_srcset(self, row):
+        return build_srcset(row.derivatives, GalleryImage.image.field.storage, self.absolute)
+
+class CommentSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Comment
         fields = ['id', 'post', 'author', 'content', 'created_at']
-        read_only_fields = ['post']
\ No newline at end of file
+        read_only_fields = ['post']
+
+class CommentModerationSerializer(serializers.Serializer):
+    action = serializers.ChoiceField(choices=ACTIONS)
+    ids = serializers.ListField(child=serializers.IntegerField(min_value=1), allow_empty=False, max_length=10000, required=False)
+    post = serializers.SlugField(required=False)
+
+    def validate(self, attrs):
+        if 'ids' not in attrs and 'post' not in attrs:
+            raise serializers.ValidationError('Give the comment ids, a post slug, or both.')
+        return attrs
+
+class SearchResultSerializer(serializers.Serializer):
+    """
+    A hit from ``kunnic.search``. ``title`` and ``snippet`` are escaped HTML
+    with matches wrapped in ``<mark>``.
+    """
+    type = serializers.CharField()
+    id = serializers.IntegerField()
+    title = serializers.CharField()
+    snippet = serializers.CharField()
+    score = serializers.FloatField()
+    url = serializers.SerializerMethodField()
+
+    def get_url(self, obj):
+        request = self.context.get('request')
+        if obj['type'] == 'post':
+            return reverse('post-detail', kwargs={'slug': obj['slug']}, request=request)
+        if obj['type'] == 'song':
+            return reverse('song-detail', kwargs={'pk': obj['id']}, request=request)
+        return reverse('post-comments', kwargs={'slug': obj['post_slug']}, request=request)
+
+class JobSerializer(serializers.ModelSerializer):
+    """
+    Status of a background job. ``run_at`` is when a queued job is next
+    tried; ``error`` is the last failed attempt's.
+    """
+    class Meta:
+        model = Job
+        fields = ['id', 'kind', 'status', 'attempts', 'max_attempts', 'run_at', 'error', 'result', 'created_at', 'started_at', 'finished_at']
+        read_only_fields = fields
+
+class UploadSerializer(serializers.ModelSerializer):
+    """
+    A resumable upload (see kunnic/uploads.py). ``url`` is where its chunks
+    go and ``missing`` the chunk indexes still to send.
+    """
+    url = serializers.SerializerMethodField()
+    chunk_count = serializers.IntegerField(read_only=True)
+    missing = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Upload
+        fields = ['id', 'url', 'filename', 'size', 'chunk_size', 'chunk_count', 'checksum', 'missing', 'expires_at']
+        read_only_fields = ['id', 'expires_at']
+        extra_kwargs = {'chunk_size': {'required': False}}
+
+    def get_url(self, obj):
+        return reverse(f'{obj.target}-upload-detail', kwargs={'upload_id': obj.pk}, request=self.context.get('request'))
+
+    def get_missing(self, obj):
+        return uploads.missing_chunks(obj)
+
+    def validate_size(self, value):
+        if not 0 < value <= uploads.get_setting('MAX_SIZE'):
+            raise serializers.ValidationError(f'Files of 1 to {uploads.get_setting("MAX_SIZE")} bytes can be uploaded.')
+        return value
+
+    def validate_chunk_size(self, value):
+        low, high = uploads.get_setting('MIN_CHUNK_SIZE'), uploads.get_setting('MAX_CHUNK_SIZE')
+        if not low <= value <= high:
+            raise serializers.ValidationError(f'Chunks must be {low} to {high} bytes.')
+        return value
+
+    def validate_checksum(self, value):
+        if value:
+            uploads.parse_checksum(value)
+        return value
@@ -0,0 +1,202 @@
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from kunnic.archive import adjust_month, adjust_tag_count, month_of, post_changed, tags_added
+from kunnic.cache import bump_generation
+from kunnic.images import delete_derivatives
+from kunnic.jobs import enqueue
+from kunnic.moderation import adjust_comment_count
+from kunnic.search import get_backend
+from kunnic.models import Comment, GalleryImage, Post, PostTag, Song, Tag
+
+
+@receiver([post_save, post_delete], sender=Post)
+@receiver([post_save, post_delete], sender=Song)
+@receiver([post_save, post_delete], sender=GalleryImage)
+@receiver([post_save, post_delete], sender=Comment)
+@receiver([post_save, post_delete], sender=Tag)
+def invalidate_cached_responses(sender, **kwargs):
+    bump_generation(sender)
+
+
+def _remember_file(sender, instance, field, update_fields):
+    # (stored name before the save, whether a new file is being saved), or
+    # None when the save leaves the field alone.
+    if update_fields is not None and field not in update_fields:
+        return None
+    previous = sender.objects.filter(pk=instance.pk).values_list(field, flat=True).first()
+    return previous, not getattr(instance, field)._committed
+
+
+def _file_replaced(instance, field, remembered):
+    """
+    After a save: release the file ``field`` held before it, as the new
+    file took a reference of its own, and return whether the name changed.
+    """
+    if remembered is None:
+        return False
+    previous, saved = remembered
+    current = getattr(instance, field)
+    if previous and (saved or previous != current.name):
+        current.storage.delete(previous)
+    return previous != current.name
+
+
+@receiver(pre_save, sender=Song)
+def detect_audio_change(sender, instance, update_fields=None, **kwargs):
+    instance._previous_audio = _remember_file(sender, instance, 'audio_file', update_fields)
+
+
+@receiver(post_save, sender=Song)
+def process_song_audio(sender, instance, **kwargs):
+    # Decoding is left to a job worker; the view reports the job. The same
+    # bytes uploaded again keep their name and need no processing.
+    if _file_replaced(instance, 'audio_file', getattr(instance, '_previous_audio', None)) and instance.audio_file:
+        instance.processing_job = enqueue('process_song', pk=instance.pk)
+
+
+@receiver(post_delete, sender=Song)
+def delete_song_files(sender, instance, **kwargs):
+    # Stored files are shared by content; this drops the song's references.
+    for fieldfile in (instance.audio_file, instance.peaks_file):
+        if fieldfile:
+            fieldfile.delete(save=False)
+
+
+@receiver(pre_save, sender=GalleryImage)
+def detect_image_change(sender, instance, update_fields=None, **kwargs):
+    instance._previous_image = _remember_file(sender, instance, 'image', update_fields)
+
+
+@receiver(post_save, sender=GalleryImage)
+def process_gallery_image(sender, instance, **kwargs):
+    if _file_replaced(instance, 'image', getattr(instance, '_previous_image', None)) and instance.image:
+        instance.processing_job = enqueue('process_gallery_image', pk=instance.pk)
+
+
+@receiver(post_delete, sender=GalleryImage)
+def delete_image_files(sender, instance, **kwargs):
+    delete_derivatives(instance)
+    if instance.image:
+        instance.image.delete(save=False)
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_save, sender=Song)
+@receiver(post_save, sender=Comment)
+def update_search_index(sender, instance, **kwargs):
+    backend = get_backend()
+    if backend is None:
+        return
+    backend.index(instance)
+    if sender is Post:
+        # Comments are only searchable while their post is published.
+        backend.index_many(instance.comments.select_related('post'))
+
+
+@receiver(post_delete, sender=Post)
+@receiver(post_delete, sender=Song)
+@receiver(post_delete, sender=Comment)
+def remove_from_search_index(sender, instance, **kwargs):
+    backend = get_backend()
+    if backend is not None:
+        backend.remove(instance)
+
+
+@receiver(pre_save, sender=Comment)
+def remember_counted_comment(sender, instance, **kwargs):
+    previous = None
+    if instance.pk is not None:
+        previous = sender.objects.filter(pk=instance.pk).values_list('post_id', 'is_approved').first()
+    # The post this comment was counted on before the save, if any.
+    instance._counted_on = previous[0] if previous and previous[1] else None
+
+
+@receiver(post_save, sender=Comment)
+def update_comment_count(sender, instance, **kwargs):
+    counted_on = getattr(instance, '_counted_on', None)
+    now_counted_on = instance.post_id if instance.is_approved else None
+    if counted_on != now_counted_on:
+        if counted_on is not None:
+            adjust_comment_count(counted_on, -1)
+        if now_counted_on is not None:
+            adjust_comment_count(now_counted_on, 1)
+
+
+@receiver(post_delete, sender=Comment)
+def discount_deleted_comment(sender, instance, **kwargs):
+    if instance.is_approved:
+        adjust_comment_count(instance.post_id, -1)
+
+
+@receiver(pre_save, sender=Post)
+def remember_archived_post(sender, instance, **kwargs):
+    # (is_published, published_at) before the save; None for a new post.
+    instance._archived_as = None
+    if instance.pk is not None:
+        instance._archived_as = sender.objects.filter(pk=instance.pk).values_list('is_published', 'published_at').first()
+
+
+@receiver(post_save, sender=Post)
+def update_archive(sender, instance, **kwargs):
+    post_changed(instance, getattr(instance, '_archived_as', None))
+
+
+@receiver(post_delete, sender=Post)
+def unarchive_deleted_post(sender, instance, **kwargs):
+    # Its PostTag rows were deleted first and uncounted their tags.
+    if instance.is_published:
+        adjust_month(*month_of(instance.published_at), -1)
+
+
+@receiver(pre_save, sender=PostTag)
+def remember_counted_tag(sender, instance, **kwargs):
+    instance.is_published = instance.post.is_published
+    instance.published_at = instance.post.published_at
+    previous = None
+    if instance.pk is not None:
+        previous = sender.objects.filter(pk=instance.pk).values_list('tag_id', 'is_published').first()
+    # The tag this row was counted on before the save, if any.
+    instance._counted_on = previous[0] if previous and previous[1] else None
+
+
+@receiver(post_save, sender=PostTag)
+def update_tag_count(sender, instance, **kwargs):
+    counted_on = getattr(instance, '_counted_on', None)
+    now_counted_on = instance.tag_id if instance.is_published else None
+    if counted_on != now_counted_on:
+        if counted_on is not None:
+            adjust_tag_count(counted_on, -1)
+        if now_counted_on is not None:
+            adjust_tag_count(now_counted_on, 1)
+
+
+@receiver(post_delete, sender=PostTag)
+def discount_deleted_tag(sender, instance, **kwargs):
+    if instance.is_published:
+        adjust_tag_count(instance.tag_id, -1)
+
+
+@receiver(m2m_changed, sender=PostTag)
+def update_tagged_posts(sender, instance, action, reverse, pk_set, **kwargs):
+    # add() bulk-creates rows without signals; remove() and clear() delete
+    # them one by one through discount_deleted_tag.
+    if action == 'pre_clear':
+        instance._cleared_posts = list(instance.post_tags.values_list('post_id', flat=True)) if reverse else []
+        return
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if action == 'post_add':
+        if reverse:
+            tags_added(PostTag.objects.filter(tag=instance, post__in=pk_set))
+        else:
+            tags_added(PostTag.objects.filter(post=instance, tag__in=pk_set))
+    if reverse:
+        post_ids = getattr(instance, '_cleared_posts', []) if action == 'post_clear' else pk_set
+    else:
+        post_ids = [instance.pk]
+    # The posts' representations changed; move their timestamps along for snapshots.
+    Post.objects.filter(pk__in=post_ids).update(updated_at=timezone.now())
+    bump_generation(Post)
+    bump_generation(Tag)
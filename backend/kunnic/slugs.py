@@ -0,0 +1,56 @@
+"""
+Unique slugs for a batch of objects in a constant number of queries.
+
+:func:`unique_slugs` keeps each wanted slug when it's free and otherwise
+appends the next free ``-2``, ``-3``... suffix. It checks the table and the
+rest of the batch, so ``bulk_create`` can't hit the unique constraint.
+"""
+import re
+from collections import defaultdict
+from functools import reduce
+from operator import or_
+
+from django.db.models import Q
+
+
+def unique_slugs(model, wanted, field='slug', exclude_pk=None):
+    """
+    Return a unique slug for each of ``wanted`` (already slugified; empty
+    ones fall back to the model name). Two queries at most, however many
+    slugs are asked for.
+    """
+    max_length = model._meta.get_field(field).max_length
+    queryset = model._default_manager.all()
+    if exclude_pk is not None:
+        queryset = queryset.exclude(pk=exclude_pk)
+    bases = [(slug or model._meta.model_name)[:max_length] for slug in wanted]
+
+    taken = set(queryset.filter(**{f'{field}__in': set(bases)}).values_list(field, flat=True))
+    counts = defaultdict(int)
+    for base in bases:
+        counts[base] += 1
+    clashing = {base for base, count in counts.items() if count > 1 or base in taken}
+    if not clashing:
+        return bases
+
+    # Everything already suffixed off a clashing base, in one query. Long
+    # bases were cut short to fit their suffix, so match on the cut prefix.
+    condition = reduce(or_, (
+        Q(**{f'{field}__startswith': f'{base}-' if len(base) <= max_length - 6 else base[:max_length - 6]})
+        for base in clashing
+    ))
+    taken.update(queryset.filter(condition).values_list(field, flat=True))
+
+    slugs, seen, next_suffix = [], set(), defaultdict(lambda: 2)
+    for base in bases:
+        slug = base
+        if base in clashing and (base in taken or base in seen):
+            while True:
+                suffix = f'-{next_suffix[base]}'
+                next_suffix[base] += 1
+                slug = re.sub(r'-+$', '', base[:max_length - len(suffix)]) + suffix
+                if slug not in taken and slug not in seen:
+                    break
+        seen.add(slug)
+        slugs.append(slug)
+    return slugs
@@ -0,0 +1,232 @@
+"""
+Static JSON snapshots of the public API.
+
+:class:`SnapshotBuilder` renders every list page and detail endpoint of the
+kunnic router through the real viewsets, as an anonymous client would see
+them. Each response becomes a content-hashed file under
+``KUNNIC_SNAPSHOT['ROOT']`` (``STATIC_ROOT/snapshot`` by default), with
+``.gz`` and ``.br`` siblings. WhiteNoise serves those precompressed and,
+because of the hash, cacheable forever. ``manifest.json`` maps every API
+path (``/api/posts/?page=2``) to its file, so a frontend or CDN can answer
+reads without reaching Django.
+
+Builds are incremental. The manifest records, for each model, the newest
+``last_modified_field`` value it has rendered. The next build re-renders
+only detail files for newer objects and drops deleted ones. List pages are
+re-rendered only for models that changed; a new comment counts as a change
+to its post, which shows the comment count. Edits that move no timestamp
+need ``--full``: song and gallery edits (``upload_date`` is set once),
+comment deletion and moderation.
+
+WhiteNoise indexes files when a worker starts, so reload the workers after
+a build. Files replaced by a build are deleted by the next one, so workers
+that haven't reloaded yet can still serve them.
+"""
+import gzip
+import hashlib
+import json
+import os
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.db.models import Max
+from django.templatetags.static import static
+from django.test import RequestFactory
+from django.utils import timezone
+
+from kunnic.models import Comment, Post
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+DEFAULTS = {
+    'ROOT': None,
+    'BASE_URL': 'http://localhost:8000',
+    # Smaller files aren't worth a compressed sibling.
+    'COMPRESS_MIN_SIZE': 256,
+}
+
+MANIFEST = 'manifest.json'
+
+
+def get_setting(name):
+    return getattr(settings, 'KUNNIC_SNAPSHOT', {}).get(name, DEFAULTS[name])
+
+
+def get_root():
+    return get_setting('ROOT') or os.path.join(settings.STATIC_ROOT, 'snapshot')
+
+
+def get_static_url(root):
+    """Where WhiteNoise serves ``root``, or ``None`` outside ``STATIC_ROOT``."""
+    relative = os.path.relpath(root, settings.STATIC_ROOT)
+    if relative.startswith(os.pardir):
+        return None
+    return static(relative.replace(os.sep, '/') + '/')
+
+
+def get_endpoints():
+    """``(prefix, viewset, basename)`` for every viewset on the kunnic router."""
+    from kunnic.urls import router
+    return router.registry
+
+
+class SnapshotBuilder:
+    """
+    Build or refresh the snapshot in ``root``. ``stats`` counts files
+    ``rendered``, ``unchanged`` and ``removed``.
+    """
+
+    def __init__(self, root=None, base_url=None):
+        self.root = root or get_root()
+        url = urlsplit(base_url or get_setting('BASE_URL'))
+        self.factory = RequestFactory()
+        self.request_options = {'HTTP_HOST': url.netloc, 'secure': url.scheme == 'https'}
+        self.base_url = f'{url.scheme}://{url.netloc}'
+        self.stats = {'rendered': 0, 'unchanged': 0, 'removed': 0}
+
+    def load_manifest(self):
+        try:
+            with open(os.path.join(self.root, MANIFEST), encoding='utf-8') as file:
+                manifest = json.load(file)
+        except FileNotFoundError:
+            return None
+        # Another host or scheme means every absolute URL in the files is wrong.
+        return manifest if manifest.get('base_url') == self.base_url else None
+
+    def build(self, full=False):
+        previous = None if full else self.load_manifest()
+        manifest = {
+            'version': 1,
+            'built_at': timezone.now().isoformat(),
+            'base_url': self.base_url,
+            'static_url': get_static_url(self.root),
+            'watermarks': {},
+            'routes': {},
+            'objects': {},
+            'retired': [],
+        }
+        old_routes = dict(previous['routes']) if previous else {}
+        watermarks = previous['watermarks'] if previous else {}
+
+        # Posts show their comment count, so a new comment changes its post.
+        comments_since = watermarks.get('comment')
+        manifest['watermarks']['comment'] = _iso(Comment.objects.aggregate(latest=Max('created_at'))['latest'])
+        commented = set()
+        if comments_since is not None and manifest['watermarks']['comment'] != comments_since:
+            commented = set(Comment.objects.filter(created_at__gt=comments_since).values_list('post_id', flat=True))
+
+        for prefix, viewset, basename in get_endpoints():
+            self.build_endpoint(prefix, viewset, basename, previous, manifest, commented)
+
+        # Routes that are gone or now point elsewhere retire their file; the
+        # files retired by the previous build are deleted now.
+        live = set(manifest['routes'].values())
+        manifest['retired'] = sorted({name for name in old_routes.values() if name not in live})
+        for name in (previous or {}).get('retired', []):
+            if name not in live:
+                self.remove(name)
+        self.write_manifest(manifest)
+        return manifest
+
+    def build_endpoint(self, prefix, viewset, basename, previous, manifest, commented):
+        queryset = viewset.queryset.all()
+        model = queryset.model
+        label = model._meta.model_name
+        field = viewset.last_modified_field
+        lookup = viewset.lookup_field
+
+        since = previous['watermarks'].get(label) if previous else None
+        manifest['watermarks'][label] = _iso(queryset.aggregate(latest=Max(field))['latest'])
+        old_objects = previous['objects'].get(label, {}) if previous else {}
+        old_routes = previous['routes'] if previous else {}
+
+        current = dict(queryset.order_by().values_list('pk', lookup))
+        changed = queryset if since is None else queryset.filter(**{f'{field}__gt': since})
+        changed_pks = set(changed.values_list('pk', flat=True))
+        if model is Post:
+            changed_pks |= commented & set(current)
+
+        detail_view = viewset.as_view({'get': 'retrieve'}, throttle_classes=[])
+        objects = manifest['objects'][label] = {}
+        for pk, key in current.items():
+            path = f'/api/{prefix}/{key}/'
+            objects[str(pk)] = path
+            if pk in changed_pks or path not in old_routes or old_objects.get(str(pk)) != path:
+                manifest['routes'][path] = self.render(detail_view, path, f'{prefix}/{key}', **{lookup: key})
+            else:
+                manifest['routes'][path] = old_routes[path]
+                self.stats['unchanged'] += 1
+
+        lists_changed = (
+            previous is None or changed_pks or set(old_objects) != {str(pk) for pk in current}
+        )
+        list_path = f'/api/{prefix}/'
+        if not lists_changed:
+            list_paths = [path for path in old_routes if path == list_path or path.startswith(list_path + '?')]
+            for path in list_paths:
+                manifest['routes'][path] = old_routes[path]
+                self.stats['unchanged'] += 1
+            return
+
+        list_view = viewset.as_view({'get': 'list'}, throttle_classes=[])
+        page, path = 1, list_path
+        while path is not None:
+            data, name = self.render(list_view, path, f'{prefix}/page-{page}', data=True)
+            manifest['routes'][path] = name
+            page += 1
+            path = f'{list_path}?page={page}' if data.get('next') else None
+
+    def render(self, view, path, stem, data=False, **kwargs):
+        request = self.factory.get(path, HTTP_ACCEPT='application/json', **self.request_options)
+        response = view(request, **kwargs)
+        if hasattr(response, 'render'):
+            response.render()
+        if response.status_code != 200:
+            raise RuntimeError(f'{path} answered {response.status_code}')
+        name = self.write(stem, response.content)
+        return (json.loads(response.content), name) if data else name
+
+    def write(self, stem, content):
+        name = f'{stem}.{hashlib.sha256(content).hexdigest()[:12]}.json'
+        path = os.path.join(self.root, name)
+        if os.path.exists(path):
+            self.stats['unchanged'] += 1
+            return name
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.write_file(path, content)
+        self.stats['rendered'] += 1
+        return name
+
+    def write_file(self, path, content):
+        variants = [(path, content)]
+        if len(content) >= get_setting('COMPRESS_MIN_SIZE'):
+            variants.append((path + '.gz', gzip.compress(content, compresslevel=9, mtime=0)))
+            if brotli is not None:
+                variants.append((path + '.br', brotli.compress(content, mode=brotli.MODE_TEXT)))
+        for target, data in variants:
+            temporary = f'{target}.tmp'
+            with open(temporary, 'wb') as file:
+                file.write(data)
+            os.replace(temporary, target)
+
+    def write_manifest(self, manifest):
+        os.makedirs(self.root, exist_ok=True)
+        path = os.path.join(self.root, MANIFEST)
+        for stale in (path + '.gz', path + '.br'):
+            if os.path.exists(stale):
+                os.remove(stale)
+        self.write_file(path, json.dumps(manifest, indent=1, sort_keys=True).encode('utf-8'))
+
+    def remove(self, name):
+        path = os.path.join(self.root, name)
+        for target in (path, path + '.gz', path + '.br'):
+            if os.path.exists(target):
+                os.remove(target)
+        self.stats['removed'] += 1
+
+
+def _iso(value):
+    return value.isoformat() if value is not None else None
@@ -0,0 +1,190 @@
+"""
+Content-addressed storage for song audio, peaks and gallery images.
+
+:class:`ContentAddressedStorage` stores every file under the SHA-256 of its
+bytes, ``<upload_to>/<first two hex digits>/<digest><ext>``; the name a
+field asks for only lends its directory and extension. Saving the same
+bytes again, as another row or another derivative, stores nothing new.
+
+Each stored file has a :class:`~kunnic.models.MediaFile` row counting the
+references to it. :meth:`~ContentAddressedStorage.save` takes one and
+:meth:`~ContentAddressedStorage.delete` drops one, deleting the file with
+the last, so the fields' own ``delete()`` and the delete signals in
+kunnic/signals.py keep the counts. Bulk inserts and raw deletes don't;
+:func:`kunnic.mediafiles.refresh_refs` recounts from the rows.
+
+Files are hashed while they are written, never read twice:
+:class:`HashingFileUploadHandler` hashes request bodies as Django spools
+them to disk, resumable uploads pass on their verified sha256 and anything
+else is copied into a temporary file next to its destination on the way.
+A new file is then moved into place and a known one dropped.
+
+A content-addressed name never changes its bytes, so its ``MEDIA_URL`` can
+be cached forever (see :func:`kunnic.media.serve_media`).
+"""
+import hashlib
+import os
+import posixpath
+import re
+import shutil
+import tempfile
+
+from django.core.files.move import file_move_safe
+from django.core.files.storage import FileSystemStorage, storages
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+BLOCK_SIZE = 1024 * 1024
+# Stored names keep a short alphanumeric extension; anything else is dropped.
+EXTENSION_RE = re.compile(r'^\.[a-z0-9]{1,10}$')
+CONTENT_ADDRESSED_RE = re.compile(r'(?:^|/)([0-9a-f]{2})/\1[0-9a-f]{62}(?:\.[a-z0-9]{1,10})?$')
+
+
+def get_media_storage():
+    """The storage of the kunnic media fields, ``STORAGES['media']``."""
+    return storages['media']
+
+
+def is_content_addressed(name):
+    return bool(CONTENT_ADDRESSED_RE.search(name or ''))
+
+
+def content_name(name, digest):
+    """Where the bytes with SHA-256 ``digest``, asked to be stored as ``name``, go."""
+    directory = posixpath.dirname(name)
+    extension = os.path.splitext(name)[1].lower()
+    if not EXTENSION_RE.match(extension):
+        extension = ''
+    return posixpath.join(directory, digest[:2], digest + extension)
+
+
+def hash_file(path):
+    hasher = hashlib.sha256()
+    with open(path, 'rb') as file:
+        while block := file.read(BLOCK_SIZE):
+            hasher.update(block)
+    return hasher.hexdigest()
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    File system storage naming files by content and counting references.
+
+    A ``content_hash`` attribute on saved content (the hex SHA-256) is
+    trusted rather than hashed again.
+    """
+
+    def get_available_name(self, name, max_length=None):
+        # _save picks the name; equal names hold equal bytes.
+        return name
+
+    def _save(self, name, content):
+        digest = getattr(content, 'content_hash', None)
+        spooled = None
+        if hasattr(content, 'temporary_file_path'):
+            source = content.temporary_file_path()
+            digest = digest or hash_file(source)
+        else:
+            source, digest = spooled = self._spool(posixpath.dirname(name), content)
+        name = content_name(name, digest)
+        try:
+            self.acquire(name, content.size, source)
+        finally:
+            # Left behind when the bytes were stored already.
+            if spooled is not None and os.path.exists(source):
+                os.remove(source)
+        return name
+
+    def _spool(self, directory, content):
+        """Copy ``content`` to a temporary file under ``directory``; returns ``(path, digest)``."""
+        directory = self.path(directory)
+        os.makedirs(directory, exist_ok=True)
+        hasher = hashlib.sha256()
+        fd, path = tempfile.mkstemp(prefix='.upload-', dir=directory)
+        try:
+            with os.fdopen(fd, 'wb') as file:
+                if hasattr(content, 'seek'):
+                    content.seek(0)
+                for chunk in content.chunks(BLOCK_SIZE):
+                    if isinstance(chunk, str):
+                        chunk = chunk.encode()
+                    hasher.update(chunk)
+                    file.write(chunk)
+        except BaseException:
+            os.remove(path)
+            raise
+        return path, hasher.hexdigest()
+
+    def acquire(self, name, size, source):
+        """Count a reference to ``name``, moving ``source`` there if it is new."""
+        from kunnic.models import MediaFile
+
+        with transaction.atomic():
+            if not MediaFile.objects.filter(name=name).update(refs=F('refs') + 1):
+                try:
+                    with transaction.atomic():
+                        MediaFile.objects.create(name=name, size=size, refs=1)
+                except IntegrityError:
+                    # Saved concurrently; count this reference on that row.
+                    MediaFile.objects.filter(name=name).update(refs=F('refs') + 1)
+            path = self.path(name)
+            if not os.path.exists(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                file_move_safe(source, path, allow_overwrite=True)
+                if self.file_permissions_mode is not None:
+                    os.chmod(path, self.file_permissions_mode)
+
+    def delete(self, name):
+        """Drop a reference to ``name``; the file goes with the last one."""
+        from kunnic.models import MediaFile
+
+        if not name:
+            raise ValueError('The name must be given to delete().')
+        with transaction.atomic():
+            if MediaFile.objects.filter(name=name, refs__gt=1).update(refs=F('refs') - 1):
+                return
+            deleted, _ = MediaFile.objects.filter(name=name).delete()
+            # A content-addressed file nobody counted may still be in use;
+            # collect_garbage() decides once the counts are refreshed.
+            if deleted or not is_content_addressed(name):
+                super().delete(name)
+
+    def adopt(self, name):
+        """
+        Give the stored file ``name`` a content address too, as a hard link
+        where the file system allows, and return it. References are not
+        counted.
+        """
+        path = self.path(name)
+        target = content_name(name, hash_file(path))
+        target_path = self.path(target)
+        if not os.path.exists(target_path):
+            os.makedirs(os.path.dirname(target_path), exist_ok=True)
+            try:
+                os.link(path, target_path)
+            except FileExistsError:
+                pass
+            except OSError:
+                shutil.copyfile(path, target_path)
+        return target
+
+
+class HashingFileUploadHandler(TemporaryFileUploadHandler):
+    """
+    Django's temporary-file upload handler, hashing each file as it arrives
+    so :class:`ContentAddressedStorage` doesn't read it again.
+    """
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.hasher = hashlib.sha256()
+
+    def receive_data_chunk(self, raw_data, start):
+        self.hasher.update(raw_data)
+        return super().receive_data_chunk(raw_data, start)
+
+    def file_complete(self, file_size):
+        file = super().file_complete(file_size)
+        file.content_hash = self.hasher.hexdigest()
+        return file
@@ -0,0 +1,32 @@
+"""
+Tasks run as background jobs (see kunnic/jobs.py and ``KUNNIC_JOBS['TASKS']``).
+
+Each takes JSON-able keyword arguments and returns a JSON-able result or
+``None``. :class:`~kunnic.jobs.JobFailed` fails the job for good; any other
+exception has it retried. Rows are looked up again by primary key, as they
+may have changed or gone since the job was queued.
+"""
+from kunnic.audio import process_song as extract_audio
+from kunnic.images import process_image
+from kunnic.jobs import JobFailed, run_cpu
+from kunnic.models import GalleryImage, Song
+
+
+def process_song(pk):
+    """Audio metadata and waveform peaks for an uploaded song."""
+    song = Song.objects.filter(pk=pk).first()
+    if song is None or not song.audio_file:
+        return None
+    if not extract_audio(song):
+        raise JobFailed('The audio file could not be decoded.')
+    return {'duration': song.duration, 'sample_rate': song.sample_rate, 'channels': song.channels}
+
+
+def process_gallery_image(pk):
+    """Responsive derivatives and a placeholder for an uploaded gallery image."""
+    gallery_image = GalleryImage.objects.filter(pk=pk).first()
+    if gallery_image is None or not gallery_image.image:
+        return None
+    if not process_image(gallery_image, run=run_cpu):
+        raise JobFailed('The image could not be rendered.')
+    return {'width': gallery_image.width, 'height': gallery_image.height}
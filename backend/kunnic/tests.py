@@ -0,0 +1,665 @@
+import base64
+import hashlib
+import io
+import json
+import os
+import tempfile
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.db import connections
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from PIL import Image
+
+from kunnic.archive import refresh_archive
+from kunnic.cache import bump_generation, get_cache
+from kunnic.images import process_image
+from kunnic.jobs import Worker
+from kunnic.metrics import RouteStats, render_prometheus
+from kunnic.moderation import moderate
+from kunnic.models import Comment, GalleryImage, Job, MediaFile, Post, Song, Tag
+from kunnic.slugs import unique_slugs
+from kunnic.storage import get_media_storage
+from kunnic.throttling import get_store
+from kunnic.transfer import Importer
+from kunnic.warmup import warmup
+
+
+def create_posts(count=30, comments=1):
+    """``count`` published posts with three tags and ``comments`` approved comments each."""
+    author = User.objects.create_user('author')
+    tags = [Tag.objects.create(name=f'Tag {i}') for i in range(3)]
+    for i in range(count):
+        post = Post.objects.create(title=f'Post {i}', content='Lorem ipsum. ' * 100, is_published=True, author=author)
+        post.tags.set(tags)
+        Comment.objects.bulk_create(Comment(post=post, author='reader', content='Nice.') for _ in range(comments))
+    # Bulk inserts send no signals.
+    bump_generation(Comment)
+
+
+def assert_get_queries(test, num, url):
+    """GET ``url`` in ``num`` queries and return the JSON."""
+    with test.assertNumQueries(num):
+        response = test.client.get(url)
+    test.assertEqual(response.status_code, 200)
+    return response.json()
+
+
+@contextmanager
+def shared_cache():
+    """Put the API cache in files, as other processes could share it."""
+    with tempfile.TemporaryDirectory() as location, override_settings(CACHES={
+        'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+        'api': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': location},
+    }):
+        yield
+
+
+@contextmanager
+def media_root():
+    """Store media in a temporary directory."""
+    with tempfile.TemporaryDirectory() as location, override_settings(MEDIA_ROOT=location):
+        yield location
+
+
+@override_settings(KUNNIC_THROTTLE={'RATES': {}})
+class ApiTestCase(TestCase):
+    """Unthrottled API requests, with no responses or generations left over from other tests."""
+
+    def setUp(self):
+        get_cache().clear()
+
+
+class PostListQueryTests(ApiTestCase):
+    """The post list costs the same number of queries whatever the page size."""
+
+    @classmethod
+    def setUpTestData(cls):
+        create_posts()
+
+    def assertListQueries(self, num, url):
+        return assert_get_queries(self, num, url)
+
+    def test_list_small_page(self):
+        data = self.assertListQueries(4, '/api/posts/?page_size=5')
+        self.assertEqual(len(data['results']), 5)
+
+    def test_list_large_page(self):
+        data = self.assertListQueries(4, '/api/posts/?page_size=25')
+        self.assertEqual(len(data['results']), 25)
+
+
+class ConditionalGetTests(ApiTestCase):
+    """Validators come from generations every process shares, not from the rows."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.post = Post.objects.create(title='Post', content='Lorem ipsum.', is_published=True,
+                                       author=User.objects.create_user('author'))
+
+    def test_not_modified_reads_only_generations(self):
+        etag = self.client.get('/api/posts/')['ETag']
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/posts/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_not_modified_with_shared_cache_reads_nothing(self):
+        with shared_cache():
+            etag = self.client.get('/api/posts/')['ETag']
+            with self.assertNumQueries(0):
+                response = self.client.get('/api/posts/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_edit_changes_etag(self):
+        url = f'/api/posts/{self.post.slug}/'
+        etag = self.client.get(url)['ETag']
+        self.post.title = 'Edited'
+        self.post.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_song_edit_changes_etag(self):
+        # upload_date never moves; the ETag must still change.
+        song = Song.objects.create(title='Song', artist='Artist', audio_file='songs/a.wav', release_date='2024-01-01')
+        etag = self.client.get('/api/songs/')['ETag']
+        Song.objects.get(pk=song.pk).save(update_fields=['title'])
+        self.assertEqual(self.client.get('/api/songs/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+class ResponseCacheTests(ApiTestCase):
+    """Anonymous reads are served from a shared cache until a model they depend on changes."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.post = Post.objects.create(title='Post', content='Lorem ipsum.', is_published=True,
+                                       author=User.objects.create_user('author'))
+
+    def setUp(self):
+        self.enterContext(shared_cache())
+        super().setUp()
+
+    def test_hit(self):
+        self.assertEqual(self.client.get('/api/posts/')['X-Cache'], 'MISS')
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/posts/')
+        self.assertEqual(response['X-Cache'], 'HIT')
+        self.assertEqual(response.json()['results'][0]['title'], 'Post')
+
+    def test_save_invalidates(self):
+        url = f'/api/posts/{self.post.slug}/'
+        self.client.get(url)
+        self.post.title = 'Edited'
+        # A shared cache's generations move on commit.
+        with self.captureOnCommitCallbacks(execute=True):
+            self.post.save()
+        response = self.client.get(url)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.json()['title'], 'Edited')
+
+    def test_authenticated_not_cached(self):
+        self.client.force_login(User.objects.create_user('reader'))
+        self.client.get('/api/posts/')
+        self.assertNotIn('X-Cache', self.client.get('/api/posts/'))
+
+
+class StreamTests(ApiTestCase):
+    """Song audio is served in byte ranges for seeking."""
+
+    def setUp(self):
+        super().setUp()
+        self.enterContext(media_root())
+        song = Song.objects.create(title='Song', artist='Artist', release_date='2024-01-01',
+                                   audio_file=ContentFile(bytes(range(100)), name='a.wav'))
+        self.url = f'/api/songs/{song.pk}/stream/'
+
+    def get_content(self, response):
+        return b''.join(response.streaming_content)
+
+    def test_whole_file(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertEqual(self.get_content(response), bytes(range(100)))
+
+    def test_range(self):
+        response = self.client.get(self.url, HTTP_RANGE='bytes=10-19')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], 'bytes 10-19/100')
+        self.assertEqual(self.get_content(response), bytes(range(10, 20)))
+
+    def test_suffix_range(self):
+        response = self.client.get(self.url, HTTP_RANGE='bytes=-5')
+        self.assertEqual(response['Content-Range'], 'bytes 95-99/100')
+        self.assertEqual(self.get_content(response), bytes(range(95, 100)))
+
+    def test_past_the_end(self):
+        response = self.client.get(self.url, HTTP_RANGE='bytes=100-')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], 'bytes */100')
+
+    def test_stale_if_range_sends_everything(self):
+        response = self.client.get(self.url, HTTP_RANGE='bytes=10-19', HTTP_IF_RANGE='"stale"')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(self.get_content(response)), 100)
+
+
+class SearchTests(ApiTestCase):
+    """Search finds published posts, songs and comments, and follows their edits."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.post = Post.objects.create(title='Café au lait', content='Notes from Hanoi.', is_published=True,
+                                       author=User.objects.create_user('author'))
+        Comment.objects.create(post=cls.post, author='reader', content='Hanoi in the rain.')
+        Song.objects.create(title='Hanoi', artist='Artist', audio_file='songs/a.wav', release_date='2024-01-01')
+
+    def search(self, query):
+        response = self.client.get('/api/search/', {'q': query})
+        self.assertEqual(response.status_code, 200)
+        return [(hit['type'], hit['id']) for hit in response.json()['results']]
+
+    def test_matches(self):
+        # Diacritics fold and the last term matches as a prefix.
+        self.assertEqual(self.search('cafe'), [('post', self.post.pk)])
+        self.assertEqual(self.search('caf'), [('post', self.post.pk)])
+        self.assertEqual({kind for kind, _ in self.search('hanoi')}, {'post', 'song', 'comment'})
+
+    def test_type(self):
+        response = self.client.get('/api/search/', {'q': 'hanoi', 'type': 'song'})
+        self.assertEqual([hit['type'] for hit in response.json()['results']], ['song'])
+        self.assertEqual(self.client.get('/api/search/', {'q': 'hanoi', 'type': 'nope'}).status_code, 400)
+
+    def test_highlight(self):
+        response = self.client.get('/api/search/', {'q': 'lait'})
+        self.assertEqual(response.json()['results'][0]['title'], 'Café au <mark>lait</mark>')
+
+    def test_save_updates_index(self):
+        self.post.title = 'Bánh mì'
+        self.post.save()
+        self.assertEqual(self.search('cafe'), [])
+        self.assertEqual(self.search('banh'), [('post', self.post.pk)])
+
+    def test_unpublished_post_and_comments_drop_out(self):
+        self.post.is_published = False
+        self.post.save()
+        self.assertEqual(self.search('hanoi'), [('song', Song.objects.get().pk)])
+
+    def test_empty_query(self):
+        self.assertEqual(self.client.get('/api/search/', {'q': ' '}).status_code, 400)
+
+
+@override_settings(KUNNIC_THROTTLE={'RATES': {'read': '2/min'}})
+class ThrottleTests(TestCase):
+    """Past its bucket a client gets 429 and how long to wait; other clients don't notice."""
+
+    def setUp(self):
+        # A new store, so no bucket carries over from another test.
+        get_store.cache_clear()
+
+    def get(self, url='/api/posts/', **extra):
+        return self.client.get(url, **extra)
+
+    def test_retry_after(self):
+        # The async list view throttles on its own, outside DRF.
+        for url in ('/api/posts/', '/api/search/?q=hello'):
+            with self.subTest(url=url):
+                get_store.cache_clear()
+                self.assertEqual(self.get(url).status_code, 200)
+                self.assertEqual(self.get(url).status_code, 200)
+                response = self.get(url)
+                self.assertEqual(response.status_code, 429)
+                # One token every 30 seconds.
+                self.assertEqual(response['Retry-After'], '30')
+
+    def test_buckets_per_client(self):
+        self.get(), self.get()
+        self.assertEqual(self.get(REMOTE_ADDR='192.0.2.1').status_code, 200)
+        self.client.force_login(User.objects.create_user('reader'))
+        self.assertEqual(self.get().status_code, 200)
+
+    def test_forwarded_for_not_trusted(self):
+        # NUM_PROXIES is 0: X-Forwarded-For can't pick a fresh bucket.
+        self.get(), self.get()
+        self.assertEqual(self.get(HTTP_X_FORWARDED_FOR='192.0.2.1').status_code, 429)
+
+
+class ArchiveTests(ApiTestCase):
+    """Month and tag counts follow posts as they are published, moved, unpublished and deleted."""
+
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create_user('author')
+        cls.news, cls.music = Tag.objects.create(name='News'), Tag.objects.create(name='Music')
+        cls.post = Post.objects.create(title='Post', content='Lorem ipsum.', is_published=True, author=author,
+                                       published_at=timezone.make_aware(datetime(2024, 1, 15, 12)))
+        cls.post.tags.set([cls.news, cls.music])
+        draft = Post.objects.create(title='Draft', content='Lorem ipsum.', author=author)
+        draft.tags.set([cls.news])
+
+    def get_archive(self):
+        data = self.client.get('/api/posts/archive/').json()
+        return (
+            {(month['year'], month['month']): month['post_count'] for month in data['months']},
+            {tag['slug']: tag['post_count'] for tag in data['tags']},
+        )
+
+    def test_publish(self):
+        self.assertEqual(self.get_archive(), ({(2024, 1): 1}, {'news': 1, 'music': 1}))
+        draft = Post.objects.get(title='Draft')
+        draft.is_published = True
+        draft.published_at = timezone.make_aware(datetime(2024, 2, 1, 12))
+        draft.save()
+        self.assertEqual(self.get_archive(), ({(2024, 1): 1, (2024, 2): 1}, {'news': 2, 'music': 1}))
+
+    def test_unpublish(self):
+        self.post.is_published = False
+        self.post.save()
+        self.assertEqual(self.get_archive(), ({}, {}))
+
+    def test_move_month(self):
+        self.post.published_at = timezone.make_aware(datetime(2023, 12, 31, 12))
+        self.post.save()
+        self.assertEqual(self.get_archive()[0], {(2023, 12): 1})
+
+    def test_delete(self):
+        self.post.delete()
+        self.assertEqual(self.get_archive(), ({}, {}))
+
+    def test_tags_added_later(self):
+        self.post.tags.add(Tag.objects.create(name='Travel'))
+        self.assertEqual(self.get_archive()[1], {'news': 1, 'music': 1, 'travel': 1})
+
+    def test_refresh_agrees(self):
+        counts = self.get_archive()
+        refresh_archive()
+        self.assertEqual(self.get_archive(), counts)
+
+
+def checksum(data):
+    return 'sha256 ' + base64.b64encode(hashlib.sha256(data).digest()).decode('ascii')
+
+
+class UploadTests(ApiTestCase):
+    """Chunks are checked as they arrive, a dropped upload picks up where it was, and a commit creates the song."""
+    data = bytes(range(10))
+
+    def setUp(self):
+        super().setUp()
+        root = self.enterContext(media_root())
+        self.enterContext(override_settings(KUNNIC_UPLOADS={'STAGING_DIR': os.path.join(root, 'staging'),
+                                                            'MIN_CHUNK_SIZE': 1}))
+        self.client.force_login(User.objects.create_user('owner'))
+
+    def start(self, **extra):
+        response = self.client.post('/api/songs/uploads/', {'filename': 'a.wav', 'size': 10, 'chunk_size': 4, **extra},
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        return response.json()['url']
+
+    def put_chunk(self, url, index, data=None, digest=None):
+        data = self.data[index * 4:index * 4 + 4] if data is None else data
+        return self.client.put(f'{url}chunks/{index}/', data, content_type='application/octet-stream',
+                               HTTP_UPLOAD_CHECKSUM=digest or checksum(data))
+
+    def commit(self, url):
+        return self.client.post(f'{url}commit/', {'title': 'Song', 'artist': 'Artist', 'release_date': '2024-01-01'},
+                                content_type='application/json')
+
+    def get_missing(self, url):
+        return self.client.get(url).json()['missing']
+
+    def test_chunk_checksum(self):
+        url = self.start()
+        response = self.put_chunk(url, 1, digest=checksum(b'something else'))
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('Upload-Checksum', response.json())
+        self.assertEqual(self.get_missing(url), [0, 1, 2])
+        self.assertEqual(self.put_chunk(url, 1, data=b'\0' * 3).status_code, 400)
+
+    def test_resume_and_commit(self):
+        url = self.start(checksum=checksum(self.data))
+        self.assertEqual(self.put_chunk(url, 2).status_code, 204)
+        self.assertEqual(self.put_chunk(url, 0).status_code, 204)
+        # The connection drops; the client asks what is left.
+        self.assertEqual(self.get_missing(url), [1])
+        self.assertEqual(self.commit(url).status_code, 400)
+        self.assertEqual(self.put_chunk(url, 1).status_code, 204)
+
+        # Accepted: the song's audio is processed by a job.
+        self.assertEqual(self.commit(url).status_code, 202)
+        song = Song.objects.get()
+        with song.audio_file.open('rb') as file:
+            self.assertEqual(file.read(), self.data)
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+    def test_file_checksum(self):
+        url = self.start(checksum=checksum(b'something else'))
+        for index in range(3):
+            self.put_chunk(url, index)
+        response = self.commit(url)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('checksum', response.json())
+        self.assertFalse(Song.objects.exists())
+
+
+class JobViewTests(ApiTestCase):
+    """A job's status is visible to whoever requested it and to staff."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user('owner')
+        cls.job = Job.objects.create(kind='process_song', args={'pk': 1}, key='process_song:1', requested_by=cls.owner)
+
+    def get_job(self, user):
+        self.client.force_login(user)
+        return self.client.get(f'/api/jobs/{self.job.pk}/')
+
+    def test_requester_sees_job(self):
+        self.assertEqual(self.get_job(self.owner).status_code, 200)
+
+    def test_other_user_does_not(self):
+        self.assertEqual(self.get_job(User.objects.create_user('other')).status_code, 404)
+
+    def test_staff_sees_job(self):
+        self.assertEqual(self.get_job(User.objects.create_user('staff', is_staff=True)).status_code, 200)
+
+
+class SparseFieldsQueryTests(ApiTestCase):
+    """``?fields=`` and ``?expand=`` keep post lists and details to a fixed number of queries."""
+
+    @classmethod
+    def setUpTestData(cls):
+        create_posts(comments=25)
+        cls.slug = Post.objects.first().slug
+
+    def test_list_fields_small_page(self):
+        data = assert_get_queries(self, 3, '/api/posts/?page_size=5&fields=id,title')
+        self.assertEqual([set(post) for post in data['results']], [{'id', 'title'}] * 5)
+
+    def test_list_fields_large_page(self):
+        data = assert_get_queries(self, 3, '/api/posts/?page_size=25&fields=id,title')
+        self.assertEqual(len(data['results']), 25)
+
+    def test_list_expand_small_page(self):
+        data = assert_get_queries(self, 5, '/api/posts/?page_size=5&expand=comments,tags')
+        self.assertEqual(len(data['results'][0]['comments']), 20)
+        self.assertEqual(len(data['results'][0]['tags']), 3)
+
+    def test_list_expand_large_page(self):
+        data = assert_get_queries(self, 5, '/api/posts/?page_size=25&expand=comments,tags')
+        self.assertEqual(len(data['results']), 25)
+
+    def test_list_fields_and_expand(self):
+        data = assert_get_queries(self, 4, '/api/posts/?page_size=25&fields=title&expand=comments')
+        self.assertEqual(set(data['results'][0]), {'title', 'comments'})
+
+    def test_detail_fields(self):
+        data = assert_get_queries(self, 2, f'/api/posts/{self.slug}/?fields=content')
+        self.assertEqual(set(data), {'content'})
+
+    def test_detail_expand(self):
+        data = assert_get_queries(self, 4, f'/api/posts/{self.slug}/?expand=comments,tags')
+        self.assertEqual(len(data['comments']), 20)
+
+    def test_unknown_field(self):
+        self.assertEqual(self.client.get('/api/posts/?fields=nope').status_code, 400)
+
+
+class KeysetPaginationTests(ApiTestCase):
+    """Cursor pages seek on ``(published_at, id)``, so posts published together are neither skipped nor repeated."""
+
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create_user('author')
+        # Three posts to each timestamp, so pages of five split ties.
+        now, cls.expected = timezone.now(), []
+        for i in range(12):
+            published_at = now - timedelta(days=i // 3)
+            post = Post.objects.create(title=f'Post {i}', content='Lorem ipsum.', is_published=True, author=author,
+                                       published_at=published_at)
+            cls.expected.append((published_at, post.pk))
+        cls.expected = [pk for _, pk in sorted(cls.expected, reverse=True)]
+
+    def get_page(self, url):
+        data = self.client.get(url).json()
+        return [post['id'] for post in data['results']], data['next'], data['previous']
+
+    def test_forward_and_back(self):
+        pages, url = [], '/api/posts/?pagination=cursor&page_size=5&fields=id'
+        while url:
+            ids, url, previous = self.get_page(url)
+            pages.append(ids)
+        self.assertEqual([pk for page in pages for pk in page], self.expected)
+        self.assertEqual([len(page) for page in pages], [5, 5, 2])
+
+        back = [pages[-1]]
+        while previous:
+            ids, _, previous = self.get_page(previous)
+            back.insert(0, ids)
+        self.assertEqual(back, pages)
+
+    def test_invalid_cursor(self):
+        self.assertEqual(self.client.get('/api/posts/?cursor=nope').status_code, 404)
+
+
+def record(label, **fields):
+    return json.dumps({'model': label, 'fields': fields}) + '\n'
+
+
+class ImportTests(TestCase):
+    """Imported posts whose slug is taken get a suffix, and their comments follow them."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.existing = Post.objects.create(title='Hello', content='Here first.', author=User.objects.create_user('author'))
+        cls.lines = [
+            record('kunnic.post', title='Hello', slug='hello', content='Imported.', is_published=True, author='author'),
+            record('kunnic.post', title='World', slug='world', content='Imported.', is_published=True, author='author'),
+            record('kunnic.comment', post='hello', author='reader', content='Nice.', is_approved=True),
+        ]
+
+    def test_unique_slugs(self):
+        self.assertEqual(unique_slugs(Post, ['hello', 'hello', 'new', '']), ['hello-2', 'hello-3', 'new', 'post'])
+
+    def test_slug_collision(self):
+        importer = Importer(index=False)
+        importer.run(self.lines)
+        self.assertEqual(importer.renamed, {'hello': 'hello-2'})
+        self.assertEqual(Post.objects.get(slug='hello'), self.existing)
+        imported = Post.objects.get(slug='hello-2')
+        self.assertEqual(imported.content, 'Imported.')
+        self.assertEqual(list(imported.comments.values_list('content', flat=True)), ['Nice.'])
+        self.assertEqual(imported.comment_count, 1)
+
+    def test_resume_keeps_renames(self):
+        with tempfile.TemporaryDirectory() as directory:
+            checkpoint = os.path.join(directory, 'archive.checkpoint')
+            with self.assertRaises(ValueError):
+                Importer(batch_size=1, checkpoint=checkpoint, index=False).run([*self.lines[:2], 'truncated'])
+            # The first post was committed; the rerun starts after it.
+            importer = Importer(batch_size=1, checkpoint=checkpoint, index=False)
+            self.assertEqual(importer.load_checkpoint(), 1)
+            importer.run(self.lines, skip=1)
+            self.assertFalse(os.path.exists(checkpoint))
+        self.assertEqual(Post.objects.count(), 3)
+        self.assertEqual(Post.objects.get(slug='hello-2').comments.count(), 1)
+
+
+class MediaFileTests(TestCase):
+    """Equal bytes are stored once and counted; the file goes with its last reference."""
+
+    def setUp(self):
+        self.enterContext(media_root())
+
+    def create_song(self, data=b'audio'):
+        return Song.objects.create(title='Song', artist='Artist', release_date='2024-01-01',
+                                   audio_file=ContentFile(data, name='a.wav'))
+
+    def get_refs(self, name):
+        return MediaFile.objects.filter(name=name).values_list('refs', flat=True).first()
+
+    def test_refs(self):
+        first, second = self.create_song(), self.create_song()
+        name = first.audio_file.name
+        self.assertEqual(second.audio_file.name, name)
+        self.assertEqual(self.get_refs(name), 2)
+        first.delete()
+        self.assertEqual(self.get_refs(name), 1)
+        self.assertTrue(get_media_storage().exists(name))
+        second.delete()
+        self.assertIsNone(self.get_refs(name))
+        self.assertFalse(get_media_storage().exists(name))
+
+    def test_gc_keeps_shared_files(self):
+        song = self.create_song()
+        name = song.audio_file.name
+        # Bulk inserts aren't counted.
+        Song.objects.bulk_create([Song(title='Copy', artist='Artist', release_date='2024-01-01', audio_file=name)])
+        orphan = self.create_song(b'other audio').audio_file.name
+        Song.objects.filter(audio_file=orphan).update(audio_file='')
+
+        call_command('gc_media', stdout=io.StringIO())
+        self.assertEqual(self.get_refs(name), 2)
+        self.assertFalse(get_media_storage().exists(orphan))
+        song.delete()
+        self.assertTrue(get_media_storage().exists(name))
+
+
+class ModerationTests(TestCase):
+    """Bulk moderation costs the same number of queries however many comments it touches."""
+
+    @classmethod
+    def setUpTestData(cls):
+        create_posts(count=10, comments=3)
+
+    def test_bulk_delete(self):
+        with self.assertNumQueries(9):
+            self.assertEqual(moderate(Comment.objects.filter(post__in=Post.objects.order_by('pk')[:2]), 'delete'), 6)
+        with self.assertNumQueries(9):
+            self.assertEqual(moderate(Comment.objects.all(), 'delete'), 24)
+        self.assertFalse(Comment.objects.exists())
+        self.assertEqual(set(Post.objects.values_list('comment_count', flat=True)), {0})
+
+
+class WorkerTests(TestCase):
+    """Job threads never fork the worker."""
+
+    def test_process_pool_does_not_fork(self):
+        with mock.patch('kunnic.jobs.ProcessPoolExecutor') as pool, mock.patch('kunnic.jobs.claim', return_value=[]):
+            Worker(processes=2, burst=True).run()
+        self.assertIn(pool.call_args.kwargs['mp_context'].get_start_method(), ('forkserver', 'spawn'))
+        pool.return_value.shutdown.assert_called_once_with()
+
+
+class ImageProcessingTests(TestCase):
+    """Uploads Pillow won't decode fail for good instead of being retried."""
+
+    def assertUndecodable(self, data):
+        with mock.patch('kunnic.images._read', return_value=data):
+            self.assertFalse(process_image(GalleryImage(pk=1)))
+
+    def test_not_an_image(self):
+        self.assertUndecodable(b'not an image')
+
+    def test_decompression_bomb(self):
+        buffer = io.BytesIO()
+        Image.new('RGB', (100, 100)).save(buffer, format='PNG')
+        with mock.patch.object(Image, 'MAX_IMAGE_PIXELS', 1000):
+            self.assertUndecodable(buffer.getvalue())
+
+
+class PrometheusTests(TestCase):
+    """Counters render exactly, however large they grow."""
+
+    def test_full_precision(self):
+        stats = RouteStats()
+        stats.requests = 12345678
+        stats.db_duration = 1234567.125
+        output = render_prometheus({('PostViewSet', 'GET'): stats})
+        self.assertIn('kunnic_requests_total{view="PostViewSet",method="GET"} 12345678\n', output)
+        self.assertIn('kunnic_db_duration_seconds_total{view="PostViewSet",method="GET"} 1234567.125\n', output)
+
+
+class WarmupTests(TestCase):
+    """The gunicorn master warms up before forking; nothing it opens may outlive that."""
+
+    def test_no_pool_survives(self):
+        # SQLite has no pools; stand one in the way PostgreSQL keeps them.
+        connection = connections['default']
+        pool = mock.Mock()
+        pools = {connection.alias: pool}
+
+        def close_pool():
+            pools.pop(connection.alias).close()
+
+        with mock.patch.object(type(connection), '_connection_pools', pools, create=True), \
+                mock.patch.object(connection, 'close_pool', close_pool, create=True):
+            warmup()
+        self.assertEqual(pools, {})
+        pool.close.assert_called_once_with()
@@ -0,0 +1,246 @@
+"""
+Token-bucket rate limiting for the kunnic API.
+
+Every request is counted against a scope: ``comment`` for new comments,
+``upload`` for resumable upload chunks and steps, ``write`` for other unsafe
+methods and ``read`` for the rest. Views can name
+their own with ``throttle_scope`` or ``get_throttle_scope(request)``. Each
+scope has a rate in ``KUNNIC_THROTTLE['RATES']`` such as ``'5/min'``, which
+allows bursts of 5 and refills one token every 12 seconds. Buckets are keyed
+by user id, or by client address for anonymous requests. The address is
+read from ``X-Forwarded-For`` only as far as DRF's ``NUM_PROXIES`` trusts
+it, so a client can't pick its own bucket.
+
+Bucket state lives in a pluggable store (``KUNNIC_THROTTLE['STORE']``):
+
+* :class:`MemoryStore`, per process, which adds about a microsecond;
+* :class:`FileStore`, an SQLite file shared by the workers on one host;
+* :class:`RedisStore`, any Redis-compatible server, shared by every host.
+
+Over the limit, DRF answers 429 with ``Retry-After``.
+"""
+import functools
+import math
+import random
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+from rest_framework.throttling import BaseThrottle
+
+DEFAULTS = {
+    'STORE': 'kunnic.throttling.MemoryStore',
+    'LOCATION': '',
+    'RATES': {
+        'read': '600/min',
+        'write': '120/min',
+        'comment': '5/min',
+        'upload': '600/min',
+    },
+    'KEY_PREFIX': 'kunnic:throttle',
+}
+
+PERIODS = {'s': 1, 'm': 60, 'h': 60 * 60, 'd': 24 * 60 * 60}
+
+
+def get_setting(name):
+    return getattr(settings, 'KUNNIC_THROTTLE', {}).get(name, DEFAULTS[name])
+
+
+def parse_rate(rate):
+    """``'5/min'`` -> ``(capacity, tokens per second)``; ``None`` for no limit."""
+    if rate is None:
+        return None
+    num, period = rate.split('/')
+    seconds = PERIODS.get(period[:1])
+    if seconds is None:
+        raise ImproperlyConfigured(f'Unknown throttle period in {rate!r}')
+    capacity = int(num)
+    return capacity, capacity / seconds
+
+
+@functools.cache
+def get_rates():
+    return {scope: parse_rate(rate) for scope, rate in get_setting('RATES').items()}
+
+
+@functools.cache
+def get_buckets():
+    """``{scope: (key prefix, capacity, rate)}`` for every limited scope, built once."""
+    prefix = get_setting('KEY_PREFIX')
+    return {scope: (f'{prefix}:{scope}:', *rate) for scope, rate in get_rates().items() if rate}
+
+
+@functools.cache
+def get_store():
+    return import_string(get_setting('STORE'))(get_setting('LOCATION'))
+
+
+@receiver(setting_changed)
+def reset_throttle_settings(setting, **kwargs):
+    if setting == 'KUNNIC_THROTTLE':
+        get_rates.cache_clear()
+        get_buckets.cache_clear()
+        get_store.cache_clear()
+
+
+def refill(tokens, updated, now, capacity, rate):
+    """Take one token from a bucket; returns ``(tokens, wait)``."""
+    tokens = min(capacity, tokens + max(0.0, now - updated) * rate)
+    if tokens >= 1:
+        return tokens - 1, 0.0
+    return tokens, (1 - tokens) / rate
+
+
+class MemoryStore:
+    """Buckets in this process only; each worker enforces the limit on its own."""
+    blocking = False
+    # Past this size the least recently used bucket is dropped for each new one.
+    max_entries = 100_000
+
+    def __init__(self, location=''):
+        self.buckets = OrderedDict()
+        self.lock = threading.Lock()
+
+    def consume(self, key, capacity, rate):
+        now = time.monotonic()
+        with self.lock:
+            tokens, updated = self.buckets.pop(key, (capacity, now))
+            tokens, wait = refill(tokens, updated, now, capacity, rate)
+            self.buckets[key] = (tokens, now)
+            if len(self.buckets) > self.max_entries:
+                self.buckets.popitem(last=False)
+        return wait
+
+
+class FileStore:
+    """
+    Buckets in an SQLite file, so every worker on the host shares them.
+    ``LOCATION`` is the file path.
+    """
+    blocking = True
+
+    def __init__(self, location):
+        if not location:
+            raise ImproperlyConfigured('FileStore needs KUNNIC_THROTTLE["LOCATION"], a file path.')
+        self.location = location
+        self.local = threading.local()
+        with self.connect() as connection:
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS buckets '
+                '(key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL, expires REAL NOT NULL)'
+            )
+
+    def connect(self):
+        connection = getattr(self.local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.location, timeout=5, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=OFF')
+            self.local.connection = connection
+        return connection
+
+    def consume(self, key, capacity, rate):
+        connection = self.connect()
+        now = time.time()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            row = connection.execute('SELECT tokens, updated FROM buckets WHERE key = ?', (key,)).fetchone()
+            tokens, wait = refill(*(row or (capacity, now)), now, capacity, rate)
+            connection.execute(
+                'INSERT OR REPLACE INTO buckets (key, tokens, updated, expires) VALUES (?, ?, ?, ?)',
+                (key, tokens, now, now + capacity / rate),
+            )
+            if random.random() < 0.001:
+                connection.execute('DELETE FROM buckets WHERE expires < ?', (now,))
+            connection.execute('COMMIT')
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        return wait
+
+
+class RedisStore:
+    """
+    Buckets on a Redis-compatible server, updated atomically by a Lua
+    script on the server's clock. ``LOCATION`` is a ``redis://`` URL; needs
+    the ``redis`` package.
+    """
+    blocking = True
+    script = """
+        local capacity = tonumber(ARGV[1])
+        local rate = tonumber(ARGV[2])
+        local clock = redis.call('TIME')
+        local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+        local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+        local tokens = tonumber(state[1]) or capacity
+        local updated = tonumber(state[2]) or now
+        tokens = math.min(capacity, tokens + math.max(0, now - updated) * rate)
+        local wait = 0
+        if tokens >= 1 then tokens = tokens - 1 else wait = (1 - tokens) / rate end
+        redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated', tostring(now))
+        redis.call('PEXPIRE', KEYS[1], math.ceil(capacity / rate * 1000))
+        return tostring(wait)
+    """
+
+    def __init__(self, location):
+        try:
+            import redis
+        except ImportError as exc:
+            raise ImproperlyConfigured('RedisStore needs the redis package.') from exc
+        self.client = redis.Redis.from_url(location)
+        self.consume_script = self.client.register_script(self.script)
+
+    def consume(self, key, capacity, rate):
+        return float(self.consume_script(keys=[key], args=[capacity, rate]))
+
+
+def get_wait(scope, ident):
+    """Take a token for ``ident`` in ``scope``; returns the seconds to wait, 0 if allowed."""
+    bucket = get_buckets().get(scope)
+    if bucket is None:
+        return 0.0
+    prefix, capacity, rate = bucket
+    return get_store().consume(prefix + ident, capacity, rate)
+
+
+async def aget_wait(scope, ident):
+    if get_store().blocking:
+        return await sync_to_async(get_wait)(scope, ident)
+    return get_wait(scope, ident)
+
+
+def retry_after(wait):
+    return str(math.ceil(wait))
+
+
+class BucketThrottle(BaseThrottle):
+    """DRF throttle over :func:`get_wait`; the default for every API view."""
+
+    def allow_request(self, request, view):
+        self.wait_time = get_wait(self.get_scope(request, view), self.get_key(request))
+        return not self.wait_time
+
+    def get_scope(self, request, view):
+        get_throttle_scope = getattr(view, 'get_throttle_scope', None)
+        scope = get_throttle_scope(request) if get_throttle_scope else None
+        scope = scope or getattr(view, 'throttle_scope', None)
+        if scope:
+            return scope
+        return 'read' if request.method in ('GET', 'HEAD', 'OPTIONS') else 'write'
+
+    def get_key(self, request):
+        user = request.user
+        if user and user.is_authenticated:
+            return f'user:{user.pk}'
+        return f'ip:{self.get_ident(request)}'
+
+    def wait(self):
+        return self.wait_time
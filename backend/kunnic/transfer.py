@@ -0,0 +1,282 @@
+"""
+Streaming JSONL export and import of kunnic content.
+
+Every line is one object, ``{"model": "kunnic.post", "fields": {...}}``.
+Primary keys are left out so an archive loads into any database. Posts
+carry their author's username, comments their post's slug and post tags
+both slugs instead. Tags already present by slug or name are kept as they
+are. File
+fields hold storage names only, so copy ``MEDIA_ROOT`` alongside the
+archive.
+
+Export walks each table with ``iterator()``. Import reads one line at a time
+and writes ``bulk_create`` batches, one transaction each. Slugs are made
+unique per batch (see ``kunnic/slugs.py``) and renames are remembered, so
+later comments still find their post. ``created_at`` and other
+``auto_now`` fields keep their archived values.
+
+After each batch, the importer can write a checkpoint with the last line
+committed and the slug renames. A rerun with the checkpoint resumes from
+there.
+"""
+import datetime
+import gzip
+import json
+import os
+import sys
+import time
+from contextlib import contextmanager
+
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.text import slugify
+
+from kunnic.archive import posts_created, tags_added
+from kunnic.cache import bump_generation
+from kunnic.models import Comment, GalleryImage, Post, PostTag, Song, Tag
+from kunnic.moderation import refresh_comment_counts
+from kunnic.search import get_backend
+from kunnic.slugs import unique_slugs
+
+# label: (model, plain fields, {relation: lookup})
+SPECS = {
+    'kunnic.tag': (Tag, ['name', 'slug'], {}),
+    'kunnic.post': (
+        Post, ['title', 'slug', 'content', 'is_published', 'published_at', 'updated_at', 'created_at'],
+        {'author': 'author__username'},
+    ),
+    'kunnic.posttag': (PostTag, [], {'post': 'post__slug', 'tag': 'tag__slug'}),
+    'kunnic.song': (
+        Song, ['title', 'artist', 'audio_file', 'lyrics', 'release_date', 'upload_date',
+               'duration', 'sample_rate', 'channels', 'bitrate', 'peaks_file'],
+        {},
+    ),
+    'kunnic.galleryimage': (
+        GalleryImage, ['image', 'caption', 'upload_date', 'width', 'height', 'placeholder', 'derivatives'],
+        {},
+    ),
+    'kunnic.comment': (
+        Comment, ['author', 'content', 'is_approved', 'created_at'],
+        {'post': 'post__slug'},
+    ),
+}
+
+
+def open_archive(path, mode):
+    """Open ``path`` as text, gzipped for ``.gz``; ``-`` is stdin/stdout."""
+    if path == '-':
+        return open((sys.stdin if 'r' in mode else sys.stdout).fileno(), mode, encoding='utf-8', closefd=False)
+    if path.endswith('.gz'):
+        return gzip.open(path, mode + 't', encoding='utf-8')
+    return open(path, mode, encoding='utf-8')
+
+
+def _default(value):
+    # Full precision, unlike DjangoJSONEncoder, which cuts microseconds.
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    raise TypeError(f'{type(value).__name__} is not JSON serializable')
+
+
+def export_records(labels, chunk_size=2000):
+    """Yield ``(label, line)`` for every object of ``labels``, streamed in primary-key order."""
+    for label in labels:
+        model, fields, relations = SPECS[label]
+        names = [*fields, *relations]
+        rows = model._default_manager.order_by('pk').values_list(*fields, *relations.values())
+        for row in rows.iterator(chunk_size=chunk_size):
+            record = {'model': label, 'fields': dict(zip(names, row))}
+            yield label, json.dumps(record, default=_default, ensure_ascii=False)
+
+
+@contextmanager
+def keep_timestamps(model):
+    """Let ``bulk_create`` write archived values into ``auto_now``/``auto_now_add`` fields."""
+    fields = [field for field in model._meta.concrete_fields
+              if getattr(field, 'auto_now', False) or getattr(field, 'auto_now_add', False)]
+    saved = [(field, field.auto_now, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield fields
+    finally:
+        for field, auto_now, auto_now_add in saved:
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+class Importer:
+    """
+    Load records in ``batch_size`` batches. ``stats`` maps each label to
+    ``[rows, skipped, seconds]``.
+    """
+
+    def __init__(self, batch_size=1000, checkpoint=None, index=True):
+        self.batch_size = batch_size
+        self.checkpoint = checkpoint
+        self.search = get_backend() if index else None
+        self.renamed = {}
+        self.line = 0
+        self.stats = {label: [0, 0, 0.0] for label in SPECS}
+
+    def load_checkpoint(self):
+        with open(self.checkpoint, encoding='utf-8') as file:
+            state = json.load(file)
+        self.line = state['line']
+        self.renamed = state['renamed']
+        return self.line
+
+    def save_checkpoint(self):
+        temporary = f'{self.checkpoint}.tmp'
+        with open(temporary, 'w', encoding='utf-8') as file:
+            json.dump({'line': self.line, 'renamed': self.renamed}, file)
+        os.replace(temporary, self.checkpoint)
+
+    def run(self, lines, skip=0):
+        """Import from an iterable of lines, skipping the first ``skip``."""
+        label, batch = None, []
+        for number, line in enumerate(lines, 1):
+            if number <= skip or not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+                record_label = record['model']
+                fields = record['fields']
+            except (ValueError, KeyError, TypeError) as exc:
+                raise ValueError(f'Line {number}: not an export record ({exc})') from exc
+            if record_label not in SPECS:
+                raise ValueError(f'Line {number}: unknown model {record_label!r}')
+            if batch and (record_label != label or len(batch) == self.batch_size):
+                self.flush(label, batch, number - 1)
+                batch = []
+            label = record_label
+            batch.append(fields)
+        if batch:
+            self.flush(label, batch, number)
+        if self.checkpoint and os.path.exists(self.checkpoint):
+            os.remove(self.checkpoint)
+
+    def flush(self, label, batch, last_line):
+        model = SPECS[label][0]
+        started = time.perf_counter()
+        with transaction.atomic():
+            objs, skipped = getattr(self, f'build_{model._meta.model_name}')(batch)
+            with keep_timestamps(model) as timestamps:
+                now = timezone.now()
+                for obj in objs:
+                    for field in timestamps:
+                        if getattr(obj, field.attname) is None:
+                            setattr(obj, field.attname, now)
+                model._default_manager.bulk_create(objs)
+            if model is Comment:
+                refresh_comment_counts({comment.post_id for comment in objs})
+            elif model is Post:
+                posts_created(objs)
+            elif model is PostTag:
+                # Rows not filled in yet are the new ones; not every database returns their keys.
+                tags_added(PostTag.objects.filter(post__in={row.post_id for row in objs}, published_at=None))
+            if self.search is not None and model in (Post, Song, Comment):
+                self.index(model, objs)
+        # Cached responses are only invalidated by signals, which bulk_create skips.
+        bump_generation(model)
+        if model in (Comment, PostTag):
+            bump_generation(Post)
+        stats = self.stats[label]
+        stats[0] += len(objs)
+        stats[1] += skipped
+        stats[2] += time.perf_counter() - started
+        self.line = last_line
+        if self.checkpoint:
+            self.save_checkpoint()
+
+    def index(self, model, objs):
+        if model is Comment:
+            objs = Comment.objects.filter(pk__in=[obj.pk for obj in objs]).select_related('post')
+        self.search.index_many(objs)
+
+    def build(self, model, fields):
+        values = {}
+        for name in SPECS[model._meta.label_lower][1]:
+            if name in fields and fields[name] is not None:
+                values[name] = model._meta.get_field(name).to_python(fields[name])
+        return model(**values)
+
+    def build_post(self, batch):
+        usernames = {fields.get('author') for fields in batch}
+        authors = dict(User.objects.filter(username__in=usernames).values_list('username', 'pk'))
+        missing = [User(username=name) for name in usernames - authors.keys() if name]
+        for user in missing:
+            user.set_unusable_password()
+        for user in User.objects.bulk_create(missing):
+            authors[user.username] = user.pk
+
+        posts, skipped = [], 0
+        for fields in batch:
+            if fields.get('author') not in authors:
+                skipped += 1
+                continue
+            post = self.build(Post, fields)
+            post.author_id = authors[fields['author']]
+            posts.append(post)
+        wanted = [post.slug or slugify(post.title) for post in posts]
+        for post, slug in zip(posts, unique_slugs(Post, wanted)):
+            if post.slug and slug != post.slug:
+                self.renamed[post.slug] = slug
+            post.slug = slug
+        return posts, skipped
+
+    def build_tag(self, batch):
+        tags = [self.build(Tag, fields) for fields in batch]
+        for tag in tags:
+            tag.slug = tag.slug or slugify(tag.name)
+        slugs, names = set(), set()
+        existing = Tag.objects.filter(Q(slug__in={tag.slug for tag in tags}) | Q(name__in={tag.name for tag in tags}))
+        for slug, name in existing.values_list('slug', 'name'):
+            slugs.add(slug)
+            names.add(name)
+        new, skipped = [], 0
+        for tag in tags:
+            if not tag.slug or tag.slug in slugs or tag.name in names:
+                skipped += 1
+                continue
+            slugs.add(tag.slug)
+            names.add(tag.name)
+            new.append(tag)
+        return new, skipped
+
+    def build_posttag(self, batch):
+        slugs = {self.renamed.get(fields.get('post'), fields.get('post')) for fields in batch}
+        posts = dict(Post.objects.filter(slug__in=slugs).values_list('slug', 'pk'))
+        tags = dict(Tag.objects.filter(slug__in={fields.get('tag') for fields in batch}).values_list('slug', 'pk'))
+        existing = set(PostTag.objects.filter(post__in=posts.values()).values_list('post_id', 'tag_id'))
+        rows, skipped = [], 0
+        for fields in batch:
+            pair = (posts.get(self.renamed.get(fields.get('post'), fields.get('post'))), tags.get(fields.get('tag')))
+            if None in pair or pair in existing:
+                skipped += 1
+                continue
+            existing.add(pair)
+            rows.append(PostTag(post_id=pair[0], tag_id=pair[1]))
+        return rows, skipped
+
+    def build_song(self, batch):
+        return [self.build(Song, fields) for fields in batch], 0
+
+    def build_galleryimage(self, batch):
+        return [self.build(GalleryImage, fields) for fields in batch], 0
+
+    def build_comment(self, batch):
+        slugs = {self.renamed.get(fields.get('post'), fields.get('post')) for fields in batch}
+        posts = dict(Post.objects.filter(slug__in=slugs).values_list('slug', 'pk'))
+        comments, skipped = [], 0
+        for fields in batch:
+            post_id = posts.get(self.renamed.get(fields.get('post'), fields.get('post')))
+            if post_id is None:
+                skipped += 1
+                continue
+            comment = self.build(Comment, fields)
+            comment.post_id = post_id
+            comments.append(comment)
+        return comments, skipped
+
@@ -0,0 +1,186 @@
+"""
+Resumable, chunked uploads for song audio and gallery images.
+
+A client starts an upload with the file's name and size, then sends the
+file in ``chunk_size`` pieces, in any order and as many at once as it
+likes (see ``ResumableUploadMixin`` in kunnic/views.py)::
+
+    POST   /api/songs/uploads/                   {"filename", "size", "chunk_size"?, "checksum"?}
+    PUT    /api/songs/uploads/<id>/chunks/<n>/   raw bytes; Upload-Checksum: sha256 <base64>
+    GET    /api/songs/uploads/<id>/              which chunks are still missing
+    POST   /api/songs/uploads/<id>/commit/       the other fields, e.g. {"title", "artist", ...}
+    DELETE /api/songs/uploads/<id>/
+
+Chunk ``n`` is bytes ``n * chunk_size`` onwards, the last one what
+remains. :func:`write_chunk` streams each from the request body to its
+offset in a staging file under ``KUNNIC_UPLOADS['STAGING_DIR']``, hashing on
+the way, so chunks never sit in memory or in Django's temporary files. A
+chunk counts once its checksum matches; sending it again overwrites it.
+After a dropped connection the client asks which chunks are missing.
+
+The commit hands the staged file to the endpoint's serializer as
+:class:`StagedFile`. Like Django's temporary uploads it has a
+``temporary_file_path()``, so file system storage moves it into
+``MEDIA_ROOT`` with a rename when both are on one file system; keep
+``STAGING_DIR`` next to ``MEDIA_ROOT``. Other storages copy it. A sha256
+whole-file checksum doubles as the file's content address.
+
+Under ASGI the server has the request body spooled already; chunks are
+still written without another copy in memory.
+"""
+import base64
+import hashlib
+import os
+from datetime import timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+from django.db import transaction
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+
+from kunnic.models import Upload, UploadChunk
+
+DEFAULTS = {
+    # None: an "upload-staging" directory next to MEDIA_ROOT.
+    'STAGING_DIR': None,
+    'CHUNK_SIZE': 8 * 1024 * 1024,
+    'MIN_CHUNK_SIZE': 256 * 1024,
+    'MAX_CHUNK_SIZE': 64 * 1024 * 1024,
+    'MAX_SIZE': 2 * 1024 * 1024 * 1024,
+    # Seconds an upload may take, from start to commit.
+    'EXPIRES': 24 * 60 * 60,
+}
+
+# hashlib names accepted in Upload-Checksum and the whole-file checksum.
+ALGORITHMS = ('sha256', 'sha1', 'md5')
+BLOCK_SIZE = 256 * 1024
+
+
+def get_setting(name):
+    return getattr(settings, 'KUNNIC_UPLOADS', {}).get(name, DEFAULTS[name])
+
+
+def staging_dir():
+    return Path(get_setting('STAGING_DIR') or Path(settings.MEDIA_ROOT).parent / 'upload-staging')
+
+
+def staging_path(upload):
+    return staging_dir() / f'{upload.pk}.part'
+
+
+def parse_checksum(value, field='checksum'):
+    """``(algorithm, digest bytes)`` from ``'<algorithm> <base64 digest>'``, the tus format."""
+    algorithm, _, encoded = (value or '').strip().partition(' ')
+    algorithm = algorithm.lower()
+    if algorithm not in ALGORITHMS:
+        raise ValidationError({field: f'Give "<algorithm> <base64 digest>" with one of {", ".join(ALGORITHMS)}.'})
+    try:
+        digest = base64.b64decode(encoded, validate=True)
+    except ValueError:
+        digest = b''
+    if len(digest) != hashlib.new(algorithm).digest_size:
+        raise ValidationError({field: f'Not a base64 {algorithm} digest.'})
+    return algorithm, digest
+
+
+def start(owner, target, filename, size, chunk_size=None, checksum=''):
+    """Create an upload and its staging file, the full size but sparse."""
+    upload = Upload.objects.create(
+        owner=owner, target=target, filename=os.path.basename(filename), size=size,
+        chunk_size=chunk_size or get_setting('CHUNK_SIZE'), checksum=checksum,
+        expires_at=timezone.now() + timedelta(seconds=get_setting('EXPIRES')),
+    )
+    staging_dir().mkdir(parents=True, exist_ok=True)
+    with open(staging_path(upload), 'wb') as file:
+        file.truncate(size)
+    return upload
+
+
+def write_chunk(upload, index, stream, length, checksum):
+    """
+    Copy chunk ``index`` of ``length`` bytes from ``stream`` to its place in
+    the staging file and record it if it matches ``checksum``. Raises
+    ``ValidationError`` for a chunk that is out of range, the wrong size,
+    cut short or doesn't match; it is then left uncounted.
+    """
+    if index >= upload.chunk_count:
+        raise ValidationError({'chunk': f'This upload has chunks 0 to {upload.chunk_count - 1}.'})
+    offset, expected = upload.chunk_range(index)
+    if length != expected:
+        raise ValidationError({'chunk': f'Chunk {index} is {expected} bytes, not {length}.'})
+    algorithm, digest = parse_checksum(checksum, 'Upload-Checksum')
+    hasher = hashlib.new(algorithm)
+    written = 0
+    fd = os.open(staging_path(upload), os.O_WRONLY)
+    try:
+        while written < expected:
+            block = stream.read(min(BLOCK_SIZE, expected - written))
+            if not block:
+                break
+            hasher.update(block)
+            view = memoryview(block)
+            while view:
+                count = os.pwrite(fd, view, offset + written)
+                view = view[count:]
+                written += count
+    finally:
+        os.close(fd)
+    if written != expected:
+        raise ValidationError({'chunk': f'Chunk {index} was cut short at {written} of {expected} bytes.'})
+    if hasher.digest() != digest:
+        raise ValidationError({'Upload-Checksum': f'Chunk {index} does not match its checksum.'})
+    UploadChunk.objects.update_or_create(upload=upload, index=index, defaults={'checksum': checksum.strip()})
+
+
+def missing_chunks(upload):
+    received = set(upload.chunks.values_list('index', flat=True))
+    return [index for index in range(upload.chunk_count) if index not in received]
+
+
+def verify(upload):
+    """
+    Check the staged file against the upload's whole-file checksum, if it
+    has one. Returns the hex digest of a sha256 checksum, which
+    content-addressed storage then needn't compute again.
+    """
+    if not upload.checksum:
+        return None
+    algorithm, digest = parse_checksum(upload.checksum)
+    hasher = hashlib.new(algorithm)
+    with open(staging_path(upload), 'rb') as file:
+        while block := file.read(BLOCK_SIZE * 4):
+            hasher.update(block)
+    if hasher.digest() != digest:
+        raise ValidationError({'checksum': 'The assembled file does not match the upload checksum.'})
+    return hasher.hexdigest() if algorithm == 'sha256' else None
+
+
+class StagedFile(UploadedFile):
+    """A staged upload posing as one of Django's temporary uploads, so storage can move it."""
+
+    def __init__(self, upload, content_type=None, content_hash=None):
+        super().__init__(open(staging_path(upload), 'rb'), upload.filename, content_type, upload.size, None)
+        self.path = staging_path(upload)
+        if content_hash:
+            self.content_hash = content_hash
+
+    def temporary_file_path(self):
+        return str(self.path)
+
+
+def discard(upload):
+    """Delete ``upload`` with its chunks and staging file."""
+    path = staging_path(upload)
+    with transaction.atomic():
+        upload.delete()
+    path.unlink(missing_ok=True)
+
+
+def clear_expired():
+    """Discard uploads past their expiry; returns how many."""
+    expired = list(Upload.objects.filter(expires_at__lt=timezone.now()))
+    for upload in expired:
+        discard(upload)
+    return len(expired)
@@ -1,6 +1,8 @@
-from django.urls import path, include
+from django.conf import settings
+from django.urls import path, include, re_path
 from rest_framework.routers import DefaultRouter
-from kunnic.views import PostViewSet, GalleryImageViewSet, SongViewSet
+from kunnic.async_views import async_read_view, home
+from kunnic.views import PostViewSet, GalleryImageViewSet, SongViewSet, SearchView, CommentModerationView, CacheStatsView, JobView
 
 router = DefaultRouter()
 
@@ -9,7 +11,29 @@ router.register(r'gallery', GalleryImageViewSet, basename='gallery')
 router.register(r'songs', SongViewSet, basename='song')
 
 urlpatterns = [
-    path('', include(router.urls)),
+    path('home/', home, name='home'),
 ]
 
+if settings.KUNNIC_ASYNC_READS:
+    # Same routes and names as the router; reads run async, the rest is delegated.
+    list_actions = {'get': 'list', 'post': 'create'}
+    detail_actions = {'get': 'retrieve', 'put': 'update', 'patch': 'partial_update', 'delete': 'destroy'}
+    for prefix, viewset, basename in router.registry:
+        lookup = viewset.lookup_url_kwarg or viewset.lookup_field
+        # List actions such as posts/archive/ and songs/uploads/<id>/ stay with the router.
+        reserved = ''.join(sorted({
+            rf'(?!{extra.url_path.split("/")[0]}/)' for extra in viewset.get_extra_actions() if not extra.detail
+        }))
+        urlpatterns += [
+            re_path(rf'^{prefix}/$', async_read_view(viewset, list_actions), name=f'{basename}-list'),
+            re_path(rf'^{prefix}/{reserved}(?P<{lookup}>[^/.]+)/$', async_read_view(viewset, detail_actions),
+                    name=f'{basename}-detail'),
+        ]
 
+urlpatterns += [
+    path('', include(router.urls)),
+    path('search/', SearchView.as_view(), name='search'),
+    path('comments/moderate/', CommentModerationView.as_view(), name='comment-moderate'),
+    path('cache/stats/', CacheStatsView.as_view(), name='cache-stats'),
+    path('jobs/<int:pk>/', JobView.as_view(), name='job-detail'),
+]
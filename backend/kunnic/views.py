@@ -1,46 +1,510 @@
 from django.shortcuts import render
 
-from rest_framework import viewsets, permissions
-from kunnic.models import Post, GalleryImage, Song
-from kunnic.serializers import PostSerializer, GalleryImageSerializer, SongSerializer, CommentSerializer
+from rest_framework import generics, viewsets, permissions
+from kunnic.models import ArchiveMonth, Post, GalleryImage, Job, Song, Comment, Tag, Upload
+from kunnic.archive import month_range
+from kunnic.audio import read_peaks
+from kunnic.cache import CachedResponseMixin, cache_response, get_stats
+from kunnic.conditional import ConditionalGetMixin, conditional_response
+from kunnic.media import MediaContentNegotiation, serve_file
+from kunnic.metrics import MetricsMixin
+from kunnic.moderation import moderate
+from kunnic.pagination import CommentPagination, SearchPagination, positive_int
+from kunnic.search import KINDS, get_backend, parse_terms
+from kunnic.serializers import parse_names, ArchiveMonthSerializer, TagSerializer, PostSerializer, PostListSerializer, GalleryImageSerializer, GalleryImageValuesSerializer, SongSerializer, SongValuesSerializer, CommentSerializer, CommentModerationSerializer, SearchResultSerializer, JobSerializer, UploadSerializer
+from kunnic.uploads import StagedFile, discard, missing_chunks, start, verify, write_chunk
+from django.db.models import F, FilteredRelation, Prefetch, Q, Subquery
+from django.db.models.functions import Length, Substr
+from django.utils import timezone
 
 from rest_framework.decorators import action
+from rest_framework.exceptions import NotFound, ValidationError
 from rest_framework.response import Response
+from rest_framework.reverse import reverse
 from rest_framework import status
+from rest_framework.views import APIView
+
 
 # Create your views here.
-class PostViewSet(viewsets.ModelViewSet):
-    queryset = Post.objects.filter(is_published=True).order_by('-published_at')
+def keep_relations(queryset, names):
+    """``queryset`` without the ``select_related``/``prefetch_related`` lookups of fields not in ``names``."""
+    selected = queryset.query.select_related
+    if isinstance(selected, dict):
+        queryset = queryset.select_related(None)
+        if kept := [lookup for lookup in selected if lookup in names]:
+            queryset = queryset.select_related(*kept)
+    lookups = [
+        lookup for lookup in queryset._prefetch_related_lookups
+        if (lookup.prefetch_through if isinstance(lookup, Prefetch) else lookup).split('__')[0] in names
+    ]
+    return queryset.prefetch_related(None).prefetch_related(*lookups)
+
+
+class SparseFieldsViewMixin:
+    """
+    ``?fields=a,b`` trims list and detail responses to those fields, and
+    ``only()`` loads the columns they read. ``?expand=x`` embeds a related
+    resource the serializer offers in ``expandable_fields`` (see
+    ``SparseFieldsMixin``), prefetched in one query per page. Unknown names
+    are a 400. Cache entries and ETags vary with the query string already.
+    """
+    sparse_actions = ('list', 'retrieve')
+    # Off where one query string would apply to several resources (/api/home/).
+    sparse_fields = True
+
+    def get_sparse_fields(self, serializer_class=None):
+        """
+        ``{'fields': names or None, 'expand': names}`` from the query string,
+        checked against ``serializer_class``; the view's own for its list
+        and detail actions by default.
+        """
+        if not self.sparse_fields or (serializer_class is None and self.action not in self.sparse_actions):
+            return {'fields': None, 'expand': []}
+        params = self.request.query_params
+        sparse = {'fields': parse_names(params.get('fields')) or None, 'expand': parse_names(params.get('expand'))}
+        (serializer_class or self.get_serializer_class()).check_names(**sparse)
+        return sparse
+
+    def wants_field(self, name):
+        fields = self.get_sparse_fields()['fields']
+        return fields is None or name in fields
+
+    def get_cursor_columns(self, model):
+        # Keyset pagination reads its cursor off the last row of the page.
+        ordering = getattr(self, 'keyset_ordering', None) or model._meta.ordering[0]
+        return {ordering.lstrip('-'), 'id'}
+
+    def select_fields(self, queryset, serializer_class, fields=None, expand=()):
+        """``queryset`` loading just what ``serializer_class`` reads for ``fields`` and ``expand``."""
+        if fields is not None:
+            keep = set(fields) | set(expand)
+            columns = serializer_class.get_field_columns(keep) | self.get_cursor_columns(queryset.model)
+            queryset = keep_relations(queryset, keep).only(*columns)
+        if prefetches := serializer_class.get_prefetches(expand):
+            queryset = queryset.prefetch_related(*prefetches)
+        return queryset
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action in self.sparse_actions:
+            queryset = self.select_fields(queryset, self.get_serializer_class(), **self.get_sparse_fields())
+        return queryset
+
+    def get_serializer(self, *args, **kwargs):
+        if self.action in self.sparse_actions:
+            kwargs.update(self.get_sparse_fields())
+        return super().get_serializer(*args, **kwargs)
+
+
+class ValuesListMixin:
+    """
+    Serve ``GET`` lists from ``values_list()`` rows through
+    ``values_serializer_class`` (see ``ValuesSerializer``); same JSON, no
+    model instances. Other actions and the browsable API's forms keep
+    ``serializer_class``. Goes before ``SparseFieldsViewMixin``, whose
+    ``?fields=`` narrow the columns.
+    """
+    values_serializer_class = None
+
+    def use_values(self):
+        return self.action == 'list' and self.request.method in ('GET', 'HEAD')
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.use_values():
+            self.values_columns = self.values_serializer_class.get_columns(
+                self.get_sparse_fields()['fields'], keep=self.get_cursor_columns(queryset.model),
+            )
+            queryset = queryset.values_list(*self.values_columns, named=True)
+        return queryset
+
+    def get_serializer(self, *args, **kwargs):
+        if self.use_values():
+            kwargs['columns'] = getattr(self, 'values_columns', None)
+        return super().get_serializer(*args, **kwargs)
+
+    def get_serializer_class(self):
+        if self.use_values():
+            return self.values_serializer_class
+        return super().get_serializer_class()
+
+
+class ProcessingJobMixin:
+    """
+    Uploads are processed by a background job (see kunnic/jobs.py), which
+    the save signals leave on the instance as ``processing_job``. Creates
+    and updates that queued one answer ``202 Accepted`` with its status URL
+    in ``job`` and ``Location``; the processed fields fill in once it's done.
+    The job is recorded as the requester's, who alone can poll it.
+    """
+
+    def perform_create(self, serializer):
+        super().perform_create(serializer)
+        self.processing_job = getattr(serializer.instance, 'processing_job', None)
+
+    def perform_update(self, serializer):
+        super().perform_update(serializer)
+        self.processing_job = getattr(serializer.instance, 'processing_job', None)
+
+    def create(self, request, *args, **kwargs):
+        return self.accepted(super().create(request, *args, **kwargs))
+
+    def update(self, request, *args, **kwargs):
+        return self.accepted(super().update(request, *args, **kwargs))
+
+    def accepted(self, response):
+        job = getattr(self, 'processing_job', None)
+        if job is None:
+            return response
+        # An identical job already queued now reports to the latest requester.
+        Job.objects.filter(pk=job.pk).update(requested_by=self.request.user)
+        url = reverse('job-detail', kwargs={'pk': job.pk}, request=self.request)
+        response.data = {**response.data, 'job': url}
+        response.status_code = status.HTTP_202_ACCEPTED
+        response['Location'] = url
+        return response
+
+
+UPLOAD_PATH = r'uploads/(?P<upload_id>[0-9a-f-]{36})'
+
+
+class ResumableUploadMixin:
+    """
+    Chunked, resumable uploads of ``upload_field`` under ``<prefix>/uploads/``
+    (see kunnic/uploads.py). The commit creates the row through the same
+    serializer and ``perform_create`` as a plain upload, so it is processed
+    and answered the same way.
+    """
+    upload_field = None
+    # The upload actions count against the 'upload' rate instead of 'write'.
+    throttle_scope = None
+
+    def get_upload(self, upload_id):
+        upload = Upload.objects.filter(
+            pk=upload_id, owner=self.request.user, target=self.basename, committed_at=None,
+            expires_at__gt=timezone.now(),
+        ).first()
+        if upload is None:
+            raise NotFound('No such upload; it may have expired or been committed.')
+        return upload
+
+    def upload_response(self, upload, **kwargs):
+        return Response(UploadSerializer(upload, context=self.get_serializer_context()).data, **kwargs)
+
+    @action(detail=False, methods=['post'], url_path='uploads', url_name='upload-list',
+            permission_classes=[permissions.IsAuthenticated], throttle_scope='upload')
+    def start_upload(self, request, *args, **kwargs):
+        serializer = UploadSerializer(data=request.data, context=self.get_serializer_context())
+        serializer.is_valid(raise_exception=True)
+        upload = start(request.user, self.basename, **serializer.validated_data)
+        response = self.upload_response(upload, status=status.HTTP_201_CREATED)
+        response['Location'] = response.data['url']
+        return response
+
+    @action(detail=False, methods=['get', 'delete'], url_path=UPLOAD_PATH, url_name='upload-detail',
+            permission_classes=[permissions.IsAuthenticated], throttle_scope='upload')
+    def upload(self, request, upload_id=None):
+        upload = self.get_upload(upload_id)
+        if request.method == 'DELETE':
+            discard(upload)
+            return Response(status=status.HTTP_204_NO_CONTENT)
+        return self.upload_response(upload)
+
+    @action(detail=False, methods=['put'], url_path=rf'{UPLOAD_PATH}/chunks/(?P<index>[0-9]+)', url_name='upload-chunk',
+            permission_classes=[permissions.IsAuthenticated], throttle_scope='upload')
+    def upload_chunk(self, request, upload_id=None, index=None):
+        # The body is read straight off the request; request.data is never parsed.
+        upload = self.get_upload(upload_id)
+        index = int(index)
+        offset = upload.chunk_range(index)[0]
+        if request.headers.get('Upload-Offset', str(offset)) != str(offset):
+            raise ValidationError({'Upload-Offset': f'Chunk {index} starts at byte {offset}.'})
+        try:
+            length = int(request.META.get('CONTENT_LENGTH') or 0)
+        except ValueError:
+            length = 0
+        write_chunk(upload, index, request.stream, length, request.headers.get('Upload-Checksum'))
+        return Response(status=status.HTTP_204_NO_CONTENT, headers={'Upload-Offset': str(offset)})
+
+    @action(detail=False, methods=['post'], url_path=rf'{UPLOAD_PATH}/commit', url_name='upload-commit',
+            permission_classes=[permissions.IsAuthenticated], throttle_scope='upload')
+    def commit_upload(self, request, upload_id=None):
+        upload = self.get_upload(upload_id)
+        missing = missing_chunks(upload)
+        if missing:
+            raise ValidationError({'chunks': f'{len(missing)} of {upload.chunk_count} chunks are missing; '
+                                             f'the upload lists them.'})
+        digest = verify(upload)
+        # Claimed so a second commit of the same upload finds nothing.
+        if not Upload.objects.filter(pk=upload.pk, committed_at=None).update(committed_at=timezone.now()):
+            raise NotFound('No such upload; it may have expired or been committed.')
+        try:
+            with StagedFile(upload, content_hash=digest) as staged:
+                data = {key: request.data[key] for key in request.data}
+                data[self.upload_field] = staged
+                serializer = self.get_serializer(data=data)
+                serializer.is_valid(raise_exception=True)
+                self.perform_create(serializer)
+        except Exception:
+            Upload.objects.filter(pk=upload.pk).update(committed_at=None)
+            raise
+        discard(upload)
+        headers = self.get_success_headers(serializer.data)
+        return self.accepted(Response(serializer.data, status=status.HTTP_201_CREATED, headers=headers))
+
+
+class PostViewSet(MetricsMixin, SparseFieldsViewMixin, ConditionalGetMixin, CachedResponseMixin, viewsets.ModelViewSet):
+    """
+    The list takes ``?tag=<slug>`` and ``?year=`` with an optional
+    ``&month=``. ``/api/posts/archive/`` lists post counts per month and
+    per tag, precomputed (see kunnic/archive.py).
+
+    Lists, details and comment pages take ``?fields=``; lists and details
+    ``?expand=comments,tags``, so a window can open a post with its latest
+    comments in one request.
+    """
+    queryset = Post.objects.filter(is_published=True).select_related('author').prefetch_related('tags').order_by('-published_at')
     serializer_class = PostSerializer
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
+    # The list embeds comment counts and tags, so those invalidate it too.
+    cache_models = (Post, Comment, Tag)
+    last_modified_field = 'updated_at'
 
     lookup_field = 'slug'
+    # Set by filter_queryset for tag lists (see KeysetPagination).
+    keyset_lookups = None
+
+    # Characters of content fetched for the list excerpt; markup is stripped afterwards.
+    excerpt_source_length = 600
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action == 'list':
+            # One query per page: author joined and only the head of the
+            # content read, never the full TextField.
+            queryset = queryset.defer('content')
+            if self.wants_field('excerpt'):
+                queryset = queryset.annotate(content_head=Substr('content', 1, self.excerpt_source_length))
+            if self.wants_field('reading_time'):
+                queryset = queryset.annotate(content_length=Length('content'))
+        return queryset
+
+    def get_serializer_class(self):
+        if self.action == 'list':
+            return PostListSerializer
+        return super().get_serializer_class()
 
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        if self.action != 'list':
+            return queryset
+        params = self.request.query_params
+        published_at = 'published_at'
+        if params.get('tag'):
+            # A subquery rather than a lookup here, so the async read path
+            # can filter too; an unknown slug matches nothing.
+            tag_id = Subquery(Tag.objects.filter(slug=params['tag']).order_by().values('pk'))
+            # The tag's rows carry the posts' publish state and date, so the
+            # page is read in order off posttag_tag_keyset_idx. Later filters
+            # go through the aliases; a new lookup on the relation would join
+            # it again.
+            queryset = queryset.alias(tagged=FilteredRelation('post_tags', condition=Q(
+                post_tags__tag=tag_id, post_tags__is_published=True,
+            ))).filter(tagged__tag=tag_id).alias(
+                tagged_at=F('tagged__published_at'), tagged_post=F('tagged__post'),
+            ).order_by('-tagged_at', '-tagged_post')
+            published_at = 'tagged_at'
+            self.keyset_lookups = ('tagged_at', 'tagged_post')
+        if 'year' in params:
+            start, end = self.get_date_range(params)
+            queryset = queryset.filter(**{f'{published_at}__gte': start, f'{published_at}__lt': end})
+        elif 'month' in params:
+            raise ValidationError({'year': 'A year is required with a month.'})
+        return queryset
+
+    def get_date_range(self, params):
+        try:
+            year = positive_int(params['year'], strict=True, cutoff=9998)
+        except ValueError:
+            raise ValidationError({'year': 'A positive integer is required.'})
+        if 'month' not in params:
+            return month_range(year, 1)[0], month_range(year + 1, 1)[0]
+        try:
+            month = positive_int(params['month'], strict=True)
+        except ValueError:
+            month = 0
+        if not 1 <= month <= 12:
+            raise ValidationError({'month': 'A month from 1 to 12 is required.'})
+        return month_range(year, month)
+
+    def get_throttle_scope(self, request):
+        # New comments get their own, much smaller bucket (see kunnic/throttling.py).
+        if self.action == 'comments' and request.method == 'POST':
+            return 'comment'
+        return None
 
     def perform_create(self, serializer):
         serializer.save(author=self.request.user)
 
+    @action(detail=False, methods=['get'], url_path='archive', url_name='archive')
+    @conditional_response
+    @cache_response
+    def archive(self, request):
+        return Response({
+            'months': ArchiveMonthSerializer(ArchiveMonth.objects.filter(post_count__gt=0), many=True).data,
+            'tags': TagSerializer(Tag.objects.filter(post_count__gt=0), many=True).data,
+        })
+
     @action(detail=True, methods=['get', 'post'], url_path='comments', url_name='comments')
+    @conditional_response
+    @cache_response
     def comments(self, request, slug=None):
         post = self.get_object()
         if request.method == 'GET':
-            comments = post.comments.all()
-            serializer = CommentSerializer(comments, many=True)
-            return Response(serializer.data)
+            # Approved comments, newest first, one cursor page at a time.
+            paginator = CommentPagination()
+            sparse = self.get_sparse_fields(CommentSerializer)
+            # Not post.comments: the related manager would read each row's
+            # post_id to attach the post, deferred or not.
+            comments = Comment.objects.filter(post=post, is_approved=True)
+            comments = self.select_fields(comments, CommentSerializer, **sparse)
+            page = paginator.paginate_queryset(comments, request, view=self)
+            serializer = CommentSerializer(page, many=True, **sparse)
+            return paginator.get_paginated_response(serializer.data)
         elif request.method == 'POST':
             serializer = CommentSerializer(data=request.data)
             if serializer.is_valid():
-                serializer.save(post=post, author=request.user)
+                serializer.save(post=post, author=request.user.get_username())
                 return Response(serializer.data, status=status.HTTP_201_CREATED)
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
         return Response(status=status.HTTP_405_METHOD_NOT_ALLOWED)
 
-class GalleryImageViewSet(viewsets.ModelViewSet):
+
+class GalleryImageViewSet(MetricsMixin, ResumableUploadMixin, ProcessingJobMixin, ValuesListMixin, SparseFieldsViewMixin, ConditionalGetMixin, CachedResponseMixin, viewsets.ModelViewSet):
     queryset = GalleryImage.objects.all().order_by('-upload_date')
     serializer_class = GalleryImageSerializer
+    values_serializer_class = GalleryImageValuesSerializer
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
+    upload_field = 'image'
+    cache_models = (GalleryImage,)
+    # For snapshots (see kunnic/snapshot.py); set once, so edits need a full build.
+    last_modified_field = 'upload_date'
 
-class SongViewSet(viewsets.ModelViewSet):
+
+class SongViewSet(MetricsMixin, ResumableUploadMixin, ProcessingJobMixin, ValuesListMixin, SparseFieldsViewMixin, ConditionalGetMixin, CachedResponseMixin, viewsets.ModelViewSet):
     queryset = Song.objects.all().order_by('-release_date')
     serializer_class = SongSerializer
-    permission_classes = [permissions.IsAuthenticatedOrReadOnly]
\ No newline at end of file
+    values_serializer_class = SongValuesSerializer
+    permission_classes = [permissions.IsAuthenticatedOrReadOnly]
+    upload_field = 'audio_file'
+    cache_models = (Song,)
+    # For snapshots (see kunnic/snapshot.py); set once, so edits need a full build.
+    last_modified_field = 'upload_date'
+
+    @action(detail=True, methods=['get'], url_path='stream', url_name='stream',
+            content_negotiation_class=MediaContentNegotiation)
+    def stream(self, request, pk=None):
+        # Seekable audio: Range/206, strong ETag, optional X-Accel-Redirect.
+        song = self.get_object()
+        return serve_file(request, song.audio_file)
+
+    @action(detail=True, methods=['get'], url_path='peaks', url_name='peaks')
+    @conditional_response
+    @cache_response
+    def peaks(self, request, pk=None):
+        song = self.get_object()
+        if not song.peaks_file:
+            raise NotFound('Waveform peaks have not been computed for this song.')
+        resolution = request.query_params.get('resolution')
+        if resolution is not None:
+            try:
+                resolution = positive_int(resolution, strict=True)
+            except ValueError:
+                raise ValidationError({'resolution': 'A positive integer is required.'})
+        with song.peaks_file.open('rb') as peaks_file:
+            resolution, available, peaks = read_peaks(peaks_file, resolution)
+        # Flat min/max pairs, scaled to -127..127.
+        return Response({
+            'resolution': resolution,
+            'available_resolutions': available,
+            'duration': song.duration,
+            'peaks': peaks.ravel().tolist(),
+        })
+
+
+class SearchView(MetricsMixin, CachedResponseMixin, generics.GenericAPIView):
+    """
+    ``GET /api/search/?q=`` over published posts, songs and comments, best
+    match first. ``type`` narrows the kinds, e.g. ``?type=post,song``.
+    """
+    serializer_class = SearchResultSerializer
+    pagination_class = SearchPagination
+    permission_classes = [permissions.IsAuthenticatedOrReadOnly]
+    cache_models = (Post, Song, Comment)
+
+    @cache_response
+    def get(self, request):
+        terms = parse_terms(request.query_params.get('q', ''))
+        if not terms:
+            raise ValidationError({'q': 'Enter at least one word to search for.'})
+        kinds = [kind for kind in request.query_params.get('type', '').split(',') if kind]
+        unknown = set(kinds) - set(KINDS)
+        if unknown:
+            raise ValidationError({'type': f'Unknown type: {", ".join(sorted(unknown))}.'})
+
+        backend = get_backend()
+        if backend is None:
+            raise NotFound('Search is not available on this database.')
+        page = self.paginate_queryset(backend.search(terms, kinds))
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
+
+class CommentModerationView(MetricsMixin, APIView):
+    """
+    ``POST /api/comments/moderate/`` with ``{"action": "approve" | "hide" |
+    "delete"}`` and ``ids``, a post ``slug``, or both. Changes every matching
+    comment in one query and returns how many changed.
+    """
+    permission_classes = [permissions.IsAdminUser]
+
+    def post(self, request):
+        serializer = CommentModerationSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        comments = Comment.objects.all()
+        if 'ids' in serializer.validated_data:
+            comments = comments.filter(pk__in=serializer.validated_data['ids'])
+        if 'post' in serializer.validated_data:
+            comments = comments.filter(post__slug=serializer.validated_data['post'])
+        action = serializer.validated_data['action']
+        return Response({'action': action, 'count': moderate(comments, action)})
+
+
+class CacheStatsView(MetricsMixin, APIView):
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        return Response(get_stats())
+
+
+class JobView(MetricsMixin, generics.RetrieveAPIView):
+    """
+    ``GET /api/jobs/<id>/``: status of a background job, for clients
+    polling after a ``202``. ``Retry-After`` suggests when to ask again.
+    Users see the jobs they requested; staff see every job.
+    """
+    queryset = Job.objects.all()
+    serializer_class = JobSerializer
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.request.user.is_staff:
+            return queryset
+        return queryset.filter(requested_by=self.request.user)
+
+    def retrieve(self, request, *args, **kwargs):
+        response = super().retrieve(request, *args, **kwargs)
+        if response.data['status'] in (Job.QUEUED, Job.RUNNING):
+            response['Retry-After'] = '1'
+        return response
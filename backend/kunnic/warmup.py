@@ -0,0 +1,108 @@
+"""
+Warm a server process up before it accepts traffic.
+
+Django imports the URLconf and builds most of its per-process caches on the
+first request, so the first requests after a deploy pay for them.
+:func:`warmup` does that work up front:
+
+* imports and resolves the URLconf, including every ``DefaultRouter`` route;
+* fills the model ``_meta`` caches and the content-type cache;
+* loads DRF's configured classes and builds every serializer's fields once.
+
+It touches the database only for content types and closes its connections
+afterwards, along with any connection pool that created (the tuned
+PostgreSQL profile, see kunnic/db.py), so it can run in the gunicorn master
+before workers fork (see ``gunicorn.conf.py``). :func:`connect` is the per-worker half: it opens the
+database connections and the throttle store that must not cross a fork.
+"""
+import logging
+import time
+
+from django.apps import apps
+from django.contrib.contenttypes.models import ContentType
+from django.db import connections
+from django.urls import get_resolver, resolve, reverse
+from rest_framework.serializers import BaseSerializer
+from rest_framework.settings import api_settings
+
+logger = logging.getLogger(__name__)
+
+API_SETTINGS = (
+    'DEFAULT_RENDERER_CLASSES', 'DEFAULT_PARSER_CLASSES', 'DEFAULT_AUTHENTICATION_CLASSES',
+    'DEFAULT_PERMISSION_CLASSES', 'DEFAULT_THROTTLE_CLASSES', 'DEFAULT_CONTENT_NEGOTIATION_CLASS',
+    'DEFAULT_METADATA_CLASS', 'DEFAULT_VERSIONING_CLASS', 'DEFAULT_PAGINATION_CLASS',
+    'DEFAULT_FILTER_BACKENDS', 'DEFAULT_SCHEMA_CLASS', 'UNAUTHENTICATED_USER',
+)
+
+
+def warmup():
+    """Build the per-process caches; returns seconds spent per step."""
+    timings = {}
+    for name, step in (
+        ('urls', warm_urls),
+        ('models', warm_models),
+        ('content_types', warm_content_types),
+        ('serializers', warm_serializers),
+    ):
+        started = time.perf_counter()
+        step()
+        timings[name] = time.perf_counter() - started
+    connections.close_all()
+    close_pools()
+    logger.info('Warmed up in %.0fms: %s', sum(timings.values()) * 1000,
+                ', '.join(f'{name} {seconds * 1000:.0f}ms' for name, seconds in timings.items()))
+    return timings
+
+
+def warm_urls():
+    from kunnic.urls import router
+
+    get_resolver().url_patterns
+    for prefix, viewset, basename in router.registry:
+        lookup = viewset.lookup_url_kwarg or viewset.lookup_field
+        resolve(reverse(f'{basename}-list'))
+        resolve(reverse(f'{basename}-detail', kwargs={lookup: '0'}))
+    resolve(reverse('api-root'))
+
+
+def warm_models():
+    for model in apps.get_models():
+        model._meta.get_fields()
+        model._meta.concrete_fields
+        model._meta.related_objects
+
+
+def warm_content_types():
+    ContentType.objects.get_for_models(*apps.get_models())
+
+
+def warm_serializers():
+    for name in API_SETTINGS:
+        getattr(api_settings, name)
+    from kunnic import serializers
+
+    for value in vars(serializers).values():
+        if isinstance(value, type) and issubclass(value, BaseSerializer) and value.__module__ == serializers.__name__:
+            value().fields
+
+
+def close_pools():
+    """
+    Close the connection pools of this process. ``close_all()`` only hands
+    pooled connections back; the pool's sockets and threads must not cross
+    a fork.
+    """
+    for connection in connections.all():
+        # Reading connection.pool would create a pool that isn't there.
+        if connection.alias in getattr(type(connection), '_connection_pools', {}):
+            connection.close_pool()
+
+
+def connect():
+    """Open this process's database connections and throttle store."""
+    from kunnic.throttling import get_buckets, get_store
+
+    for connection in connections.all():
+        connection.ensure_connection()
+    get_buckets()
+    get_store()
@@ -33,7 +33,10 @@ const BlogWindow = ({ onClose, onFocus, zIndex = 40, onMinimize, isMinimized = f
     const fetchPosts = async () => {
       try {
         setLoading(true);
-        const response = await axiosClient.get('posts/');
+        // Only what the list and the post header show; content comes with the post.
+        const response = await axiosClient.get('posts/', {
+          params: { fields: 'id,title,slug,excerpt,tags,created_at,author' }
+        });
         setPosts(response.data.results);
         setError(null);
       } catch (err) {
@@ -53,9 +56,11 @@ const BlogWindow = ({ onClose, onFocus, zIndex = 40, onMinimize, isMinimized = f
       // First set the basic post data immediately
       setSelectedPost(post);
       
-      // Then fetch full post details
-      const response = await axiosClient.get(`posts/${post.slug}/`);
-      setSelectedPost(response.data);
+      // Then fetch the rest of it: the list already has everything but the content
+      const response = await axiosClient.get(`posts/${post.slug}/`, {
+        params: { fields: 'content' }
+      });
+      setSelectedPost({ ...post, ...response.data });
     } catch (err) {
       console.error('Error fetching post details:', err);
       // If fetching details fails, still show the basic post data
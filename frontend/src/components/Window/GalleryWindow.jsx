@@ -642,12 +642,24 @@ const GalleryWindow = ({ onClose, onFocus, zIndex = 40, onMinimize, isMinimized
                         className="relative group cursor-pointer bg-gray-100 rounded-lg overflow-hidden aspect-square hover:shadow-lg transition-shadow"
                         onClick={() => handleImageClick(image)}
                       >
-                        <img
-                          src={image.image}
-                          alt={image.caption}
-                          className="w-full h-full object-cover transition-transform group-hover:scale-105"
-                          loading="lazy"
-                        />
+                        <picture>
+                          {Object.entries(image.srcset || {}).map(([format, srcSet]) => (
+                            <source
+                              key={format}
+                              type={`image/${format}`}
+                              srcSet={srcSet}
+                              sizes="(min-width: 1024px) 25vw, (min-width: 768px) 33vw, (min-width: 640px) 50vw, 100vw"
+                            />
+                          ))}
+                          <img
+                            src={image.image}
+                            alt={image.caption}
+                            width={image.width}
+                            height={image.height}
+                            className="w-full h-full object-cover transition-transform group-hover:scale-105"
+                            loading="lazy"
+                          />
+                        </picture>
                         <div className="absolute inset-0 bg-black bg-opacity-0 group-hover:bg-opacity-30 transition-all duration-200 flex items-end">
                           <div className="p-3 text-white opacity-0 group-hover:opacity-100 transition-opacity duration-200">
                             <p className="text-sm font-medium truncate">{image.caption}</p>
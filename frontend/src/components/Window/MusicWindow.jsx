@@ -1381,7 +1381,7 @@ const MusicWindow = ({ onClose, onFocus, zIndex = 40, onMinimize, isMinimized =
         {/* Hidden audio element for playback */}
         <audio
           ref={audioRef}
-          src={currentSong?.audio_file}
+          src={currentSong?.stream_url || currentSong?.audio_file}
           onPlay={() => setIsPlaying(true)}
           onPause={() => setIsPlaying(false)}
           crossOrigin="anonymous"
@@ -35,11 +35,19 @@ function GalleryPage() {
       <div style={{ display: 'grid', gridTemplateColumns: 'repeat(auto-fill, minmax(250px, 1fr))', gap: '1rem' }}>
         {images.map(image => (
           <div key={image.id}>
-            <img
-              src={image.image}
-              alt={image.caption}
-              style={{ width: '100%', height: 'auto', objectFit: 'cover' }}
-            />
+            <picture>
+              {Object.entries(image.srcset || {}).map(([format, srcSet]) => (
+                <source key={format} type={`image/${format}`} srcSet={srcSet} sizes="250px" />
+              ))}
+              <img
+                src={image.image}
+                alt={image.caption}
+                width={image.width}
+                height={image.height}
+                loading="lazy"
+                style={{ width: '100%', height: 'auto', objectFit: 'cover' }}
+              />
+            </picture>
             <p>{image.caption}</p>
           </div>
         ))}
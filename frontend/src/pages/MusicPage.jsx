@@ -36,7 +36,7 @@ function MusicPage() {
         {songs.map(song => (
           <div key={song.id} style={{ border: '1px solid #ccc', margin: '1rem', padding: '1rem' }}>
             <h3>{song.title} - {song.artist}</h3>
-            <audio controls src={song.audio_file}>
+            <audio controls src={song.stream_url || song.audio_file}>
               Trình duyệt của bạn không hỗ trợ thẻ audio.
             </audio>
           </div>